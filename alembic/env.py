@@ -10,6 +10,8 @@ from webapp.app.models import *  # noqa: F403,F401,E402
 
 config = context.config
 fileConfig(config.config_file_name)
+if os.getenv("DATABASE_URL"):
+    config.set_main_option("sqlalchemy.url", os.environ["DATABASE_URL"])
 target_metadata = Base.metadata
 
 def run_migrations_offline():
@@ -0,0 +1,24 @@
+from alembic import op
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_build_jobs_status_created_at', 'build_jobs', ['status', 'created_at'])
+    op.create_index('ix_build_jobs_app_project_id_created_at', 'build_jobs', ['app_project_id', 'created_at'])
+    op.create_index('ix_app_projects_owner_user_id', 'app_projects', ['owner_user_id'])
+    op.create_index('ix_keystore_download_requests_status', 'keystore_download_requests', ['status'])
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'mysql':
+        # InnoDB dropped its implicit foreign-key indexes when ours were created; restore them first.
+        op.create_index('app_project_id', 'build_jobs', ['app_project_id'])
+        op.create_index('owner_user_id', 'app_projects', ['owner_user_id'])
+    op.drop_index('ix_keystore_download_requests_status', table_name='keystore_download_requests')
+    op.drop_index('ix_app_projects_owner_user_id', table_name='app_projects')
+    op.drop_index('ix_build_jobs_app_project_id_created_at', table_name='build_jobs')
+    op.drop_index('ix_build_jobs_status_created_at', table_name='build_jobs')
@@ -0,0 +1,17 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('build_jobs', sa.Column('stage', sa.String(length=50), nullable=True))
+    op.create_index('ix_build_jobs_updated_at', 'build_jobs', ['updated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_build_jobs_updated_at', table_name='build_jobs')
+    op.drop_column('build_jobs', 'stage')
@@ -0,0 +1,32 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'builder_nodes',
+        sa.Column('id', sa.String(length=100), primary_key=True),
+        sa.Column('platforms', sa.JSON(), nullable=False),
+        sa.Column('gradle_versions', sa.JSON(), nullable=False),
+        sa.Column('warm_daemons', sa.JSON(), nullable=False),
+        sa.Column('current_job_id', sa.Integer(), nullable=True),
+        sa.Column('jobs_claimed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('cache_hits', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('cache_misses', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('jobs_stolen', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('last_seen_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_builder_nodes_last_seen_at', 'builder_nodes', ['last_seen_at'])
+    op.add_column('build_jobs', sa.Column('builder_node', sa.String(length=100), nullable=True))
+
+
+def downgrade():
+    op.drop_column('build_jobs', 'builder_node')
+    op.drop_index('ix_builder_nodes_last_seen_at', table_name='builder_nodes')
+    op.drop_table('builder_nodes')
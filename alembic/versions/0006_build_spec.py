@@ -0,0 +1,21 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('build_jobs', sa.Column('outputs', sa.String(length=10), nullable=False, server_default='both'))
+    op.add_column('build_jobs', sa.Column('variant', sa.String(length=10), nullable=False, server_default='release'))
+    op.add_column('build_jobs', sa.Column('minify', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.add_column('build_jobs', sa.Column('abi_splits', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('build_jobs', 'abi_splits')
+    op.drop_column('build_jobs', 'minify')
+    op.drop_column('build_jobs', 'variant')
+    op.drop_column('build_jobs', 'outputs')
@@ -0,0 +1,41 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('build_jobs', sa.Column('started_at', sa.DateTime(), nullable=True))
+    op.create_table(
+        'build_stats_daily',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('enqueued', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('started', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('succeeded', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('failed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('duration_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('duration_sum', sa.Float(), nullable=False, server_default='0'),
+    )
+    op.create_table(
+        'build_duration_buckets',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('bucket', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_table(
+        'build_status_counts',
+        sa.Column('status', sa.String(length=20), primary_key=True),
+        sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+    )
+
+
+def downgrade():
+    op.drop_table('build_status_counts')
+    op.drop_table('build_duration_buckets')
+    op.drop_table('build_stats_daily')
+    op.drop_column('build_jobs', 'started_at')
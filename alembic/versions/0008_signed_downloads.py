@@ -0,0 +1,21 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'used_download_nonces',
+        sa.Column('nonce', sa.String(length=32), primary_key=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_used_download_nonces_expires_at', 'used_download_nonces', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_used_download_nonces_expires_at', table_name='used_download_nonces')
+    op.drop_table('used_download_nonces')
@@ -0,0 +1,17 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('build_jobs', sa.Column('traceparent', sa.String(length=55), nullable=True))
+    op.add_column('build_jobs', sa.Column('trace_spans', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('build_jobs', 'trace_spans')
+    op.drop_column('build_jobs', 'traceparent')
@@ -0,0 +1,15 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('build_jobs', sa.Column('validation', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('build_jobs', 'validation')
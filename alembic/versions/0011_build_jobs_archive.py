@@ -0,0 +1,42 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'build_jobs_archive',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('app_project_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('stage', sa.String(length=50), nullable=True),
+        sa.Column('log', sa.Text(), nullable=True),
+        sa.Column('apk_path', sa.String(length=1024), nullable=True),
+        sa.Column('aab_path', sa.String(length=1024), nullable=True),
+        sa.Column('released', sa.Boolean(), nullable=False),
+        sa.Column('outputs', sa.String(length=10), nullable=False),
+        sa.Column('variant', sa.String(length=10), nullable=False),
+        sa.Column('minify', sa.Boolean(), nullable=False),
+        sa.Column('abi_splits', sa.JSON(), nullable=True),
+        sa.Column('builder_node', sa.String(length=100), nullable=True),
+        sa.Column('traceparent', sa.String(length=55), nullable=True),
+        sa.Column('trace_spans', sa.JSON(), nullable=True),
+        sa.Column('validation', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_build_jobs_archive_archived_at', 'build_jobs_archive', ['archived_at'])
+    op.create_index('ix_build_jobs_archive_app_project_id_created_at', 'build_jobs_archive', ['app_project_id', 'created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_build_jobs_archive_app_project_id_created_at', table_name='build_jobs_archive')
+    op.drop_index('ix_build_jobs_archive_archived_at', table_name='build_jobs_archive')
+    op.drop_table('build_jobs_archive')
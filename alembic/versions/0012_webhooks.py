@@ -0,0 +1,57 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'webhook_subscriptions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('app_project_id', sa.Integer(), sa.ForeignKey('app_projects.id'), nullable=True),
+        sa.Column('url', sa.String(length=1024), nullable=False),
+        sa.Column('secret', sa.String(length=64), nullable=False),
+        sa.Column('events', sa.JSON(), nullable=False),
+        sa.Column('active', sa.Boolean(), nullable=False, server_default=sa.true()),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_webhook_subscriptions_user_id', 'webhook_subscriptions', ['user_id'])
+    op.create_table(
+        'webhook_outbox',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('event_type', sa.String(length=50), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('app_project_id', sa.Integer(), nullable=True),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('dispatched_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_webhook_outbox_dispatched_at', 'webhook_outbox', ['dispatched_at'])
+    op.create_table(
+        'webhook_deliveries',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('subscription_id', sa.Integer(), sa.ForeignKey('webhook_subscriptions.id'), nullable=False),
+        sa.Column('event_id', sa.Integer(), sa.ForeignKey('webhook_outbox.id'), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.String(length=255), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('delivered_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_webhook_deliveries_subscription_id', 'webhook_deliveries', ['subscription_id'])
+    op.create_index('ix_webhook_deliveries_status_next_attempt_at', 'webhook_deliveries', ['status', 'next_attempt_at'])
+
+
+def downgrade():
+    op.drop_index('ix_webhook_deliveries_status_next_attempt_at', table_name='webhook_deliveries')
+    op.drop_index('ix_webhook_deliveries_subscription_id', table_name='webhook_deliveries')
+    op.drop_table('webhook_deliveries')
+    op.drop_index('ix_webhook_outbox_dispatched_at', table_name='webhook_outbox')
+    op.drop_table('webhook_outbox')
+    op.drop_index('ix_webhook_subscriptions_user_id', table_name='webhook_subscriptions')
+    op.drop_table('webhook_subscriptions')
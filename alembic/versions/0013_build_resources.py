@@ -0,0 +1,33 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+JOB_COLUMNS = (
+    ('heap_mb', sa.Integer),
+    ('max_workers', sa.Integer),
+    ('peak_rss_bytes', sa.BigInteger),
+    ('cpu_seconds', sa.Float),
+)
+
+
+def upgrade():
+    # build_jobs_archive mirrors build_jobs column for column.
+    for table in ('build_jobs', 'build_jobs_archive'):
+        for name, type_ in JOB_COLUMNS:
+            op.add_column(table, sa.Column(name, type_(), nullable=True))
+    op.add_column('builder_nodes', sa.Column('slots', sa.Integer(), nullable=False, server_default='1'))
+    op.add_column('builder_nodes', sa.Column('running_jobs', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('builder_nodes', sa.Column('memory_bytes', sa.BigInteger(), nullable=True))
+    op.add_column('builder_nodes', sa.Column('cpus', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    for name in ('cpus', 'memory_bytes', 'running_jobs', 'slots'):
+        op.drop_column('builder_nodes', name)
+    for table in ('build_jobs_archive', 'build_jobs'):
+        for name, _ in reversed(JOB_COLUMNS):
+            op.drop_column(table, name)
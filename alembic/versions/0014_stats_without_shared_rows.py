@@ -0,0 +1,34 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0014'
+down_revision = '0013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fleet totals (user_id 0) and status counts are now aggregated at read time.
+    op.execute("DELETE FROM build_stats_daily WHERE user_id = 0")
+    op.execute("DELETE FROM build_duration_buckets WHERE user_id = 0")
+    op.drop_table('build_status_counts')
+
+
+def downgrade():
+    op.create_table(
+        'build_status_counts',
+        sa.Column('status', sa.String(length=20), primary_key=True),
+        sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.execute(
+        "INSERT INTO build_status_counts (status, count) SELECT status, COUNT(*) FROM build_jobs GROUP BY status"
+    )
+    op.execute(
+        "INSERT INTO build_stats_daily (day, user_id, enqueued, started, succeeded, failed, duration_count, duration_sum) "
+        "SELECT day, 0, SUM(enqueued), SUM(started), SUM(succeeded), SUM(failed), SUM(duration_count), SUM(duration_sum) "
+        "FROM build_stats_daily GROUP BY day"
+    )
+    op.execute(
+        "INSERT INTO build_duration_buckets (day, user_id, bucket, count) "
+        "SELECT day, 0, bucket, SUM(count) FROM build_duration_buckets GROUP BY day, bucket"
+    )
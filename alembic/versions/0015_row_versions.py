@@ -0,0 +1,19 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0015'
+down_revision = '0014'
+branch_labels = None
+depends_on = None
+
+TABLES = ('app_projects', 'build_jobs', 'build_jobs_archive')
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.drop_column(table, 'version')
@@ -0,0 +1,56 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0016'
+down_revision = '0015'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'build_stats_fleet_daily',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('shard', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('enqueued', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('started', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('succeeded', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('failed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('duration_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('duration_sum', sa.Float(), nullable=False, server_default='0'),
+    )
+    op.create_table(
+        'build_fleet_duration_buckets',
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('shard', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('bucket', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+    )
+    op.create_table(
+        'build_status_counts',
+        sa.Column('status', sa.String(length=20), primary_key=True),
+        sa.Column('shard', sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+    )
+    # Seeded into shard 0 from the per-user rollups and the job tables; writes spread over the shards from here on.
+    op.execute(
+        "INSERT INTO build_stats_fleet_daily (day, shard, enqueued, started, succeeded, failed, duration_count, duration_sum) "
+        "SELECT day, 0, SUM(enqueued), SUM(started), SUM(succeeded), SUM(failed), SUM(duration_count), SUM(duration_sum) "
+        "FROM build_stats_daily GROUP BY day"
+    )
+    op.execute(
+        "INSERT INTO build_fleet_duration_buckets (day, shard, bucket, count) "
+        "SELECT day, 0, bucket, SUM(count) FROM build_duration_buckets GROUP BY day, bucket"
+    )
+    op.execute(
+        "INSERT INTO build_status_counts (status, shard, count) "
+        "SELECT status, 0, COUNT(*) FROM ("
+        "SELECT status FROM build_jobs UNION ALL SELECT status FROM build_jobs_archive"
+        ") AS jobs GROUP BY status"
+    )
+
+
+def downgrade():
+    op.drop_table('build_status_counts')
+    op.drop_table('build_fleet_duration_buckets')
+    op.drop_table('build_stats_fleet_daily')
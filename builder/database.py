@@ -1,9 +1,9 @@
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from builder.config import get_settings
+from webapp.app.pooling import create_pooled_engine
 
 settings = get_settings()
-engine = create_engine(settings.database_url, pool_pre_ping=True, future=True)
+engine = create_pooled_engine(settings.database_url, settings.db_pool_size, settings.db_max_overflow, settings.db_pool_timeout)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
 
 
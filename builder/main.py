@@ -1,27 +1,104 @@
 import os
+import re
+import secrets
 import shutil
 import subprocess
 import sys
+import threading
 import time
+import traceback
 import urllib.request
-from datetime import datetime
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-import textwrap
-
-from sqlalchemy.orm import Session
+from typing import Optional
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from webapp.app import models  # noqa: E402
+from webapp.app import archive, models, preflight, stats, tracing, webhooks  # noqa: E402
+from webapp.app.android_project import render_project  # noqa: E402
+from webapp.app.artifacts import enforce_retention  # noqa: E402
+from webapp.app.deltas import artifact_sha256, ensure_delta  # noqa: E402
+from webapp.app.metrics import registry  # noqa: E402
+from builder import resources, workspace
 from builder.config import get_settings
 from builder.database import SessionLocal
 
 settings = get_settings()
 
-
-def write_file(path: Path, content: str) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(content)
+cache_hits_total = registry.counter("builder_toolchain_cache_hits_total", "Claimed jobs whose SDK platform was already installed on this node")
+cache_misses_total = registry.counter("builder_toolchain_cache_misses_total", "Claimed jobs that required installing their SDK platform on this node")
+jobs_stolen_total = registry.counter("builder_jobs_stolen_total", "Jobs claimed without a warm cache after waiting for a warm node")
+affinity_deferred_total = registry.counter("builder_affinity_deferred_total", "Polls that left pending jobs for warmer nodes")
+
+GRADLE_PHASE = re.compile(r"<tr>\s*<td>([^<:][^<]*)</td>\s*<td class=\"numeric\">([^<]+)</td>\s*</tr>")
+GRADLE_TASK = re.compile(r"<tr>\s*<td class=\"indentPath\">(:[^<]+)</td>\s*<td class=\"numeric\">([^<]+)</td>\s*<td>([^<]*)</td>")
+GRADLE_DURATION = re.compile(r"([\d.]+)(h|ms|m|s)")
+GRADLE_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+# Concurrent builds share the toolchain cache; installs into it run one at a time.
+toolchain_lock = threading.Lock()
+# Heap each slot's Gradle daemons were started with.
+slot_heaps: dict[int, int] = {}
+
+
+@dataclass(frozen=True)
+class AppSnapshot:
+    id: int
+    name: str
+    package_name: str
+    url: str
+    min_sdk: int
+    target_sdk: int
+    version_code: int
+    version_name: str
+
+
+@dataclass(frozen=True)
+class KeystoreSnapshot:
+    keystore_path: str
+    alias: str
+    store_password: str
+    key_password: str
+
+
+@dataclass(frozen=True)
+class BuildSpec:
+    outputs: str = "both"
+    variant: str = "release"
+    minify: bool = False
+    abi_splits: tuple[str, ...] = ()
+
+    @property
+    def wants_apk(self) -> bool:
+        return self.outputs in ("apk", "both")
+
+    @property
+    def wants_aab(self) -> bool:
+        return self.outputs in ("aab", "both")
+
+    def gradle_tasks(self) -> list[str]:
+        variant = self.variant.capitalize()
+        tasks = []
+        if self.wants_apk:
+            tasks.append(f"assemble{variant}")
+        if self.wants_aab:
+            tasks.append(f"bundle{variant}")
+        return tasks
+
+
+@dataclass(frozen=True)
+class BuildInputs:
+    id: int
+    app_project_id: int
+    app_project: AppSnapshot
+    keystore: Optional[KeystoreSnapshot]
+    spec: BuildSpec = BuildSpec()
+    owner_user_id: Optional[int] = None
+    started_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    traceparent: Optional[str] = None
 
 
 def ensure_commandline_tools(sdk_root: Path) -> None:
@@ -43,10 +120,22 @@ def ensure_commandline_tools(sdk_root: Path) -> None:
     download_to.unlink(missing_ok=True)
 
 
-def ensure_android_packages(sdk_root: Path) -> None:
+def required_packages(app_project: AppSnapshot) -> list[str]:
+    platform = f"platforms;android-{app_project.target_sdk}"
+    packages = list(settings.android_packages)
+    if platform not in packages:
+        packages.append(platform)
+    return packages
+
+
+def ensure_android_packages(sdk_root: Path, packages: list[str], log_lines: list[str]) -> None:
+    missing = [package for package in packages if not (sdk_root / package.replace(";", "/")).exists()]
+    if not missing:
+        return
+    log_lines.append(f"Installing SDK packages: {', '.join(missing)}")
     ensure_commandline_tools(sdk_root)
     sdkmanager = sdk_root / "cmdline-tools" / "latest" / "bin" / "sdkmanager"
-    cmd = [str(sdkmanager), f"--sdk_root={sdk_root}"] + settings.android_packages
+    cmd = [str(sdkmanager), f"--sdk_root={sdk_root}"] + missing
     subprocess.run(cmd, input=b"y\n" * 10, check=True)
 
 
@@ -64,279 +153,604 @@ def ensure_gradle(gradle_home: Path) -> str:
     return str(gradle_bin)
 
 
-def bootstrap_toolchain(base_dir: Path, log_lines: list[str]) -> tuple[Path, Path]:
-    sdk_root = base_dir / ".android-sdk"
-    gradle_home = base_dir / ".gradle"
-    log_lines.append(f"Bootstrapping SDK into {sdk_root} and Gradle into {gradle_home}")
+def bootstrap_toolchain(app_project: AppSnapshot, log_lines: list[str]) -> tuple[Path, Path]:
+    toolchain = Path(settings.toolchain_dir)
+    sdk_root = toolchain / "android-sdk"
+    gradle_home = toolchain / "gradle"
+    log_lines.append(f"Using SDK in {sdk_root} and Gradle in {gradle_home}")
     ensure_gradle(gradle_home)
-    ensure_android_packages(sdk_root)
+    ensure_android_packages(sdk_root, required_packages(app_project), log_lines)
     return sdk_root, gradle_home
 
 
 def create_android_project(
     base_dir: Path,
-    app_project: models.AppProject,
-    keystore: models.Keystore,
+    app_project: AppSnapshot,
+    keystore: KeystoreSnapshot,
     sdk_root: Path,
     log_lines: list[str],
+    spec: BuildSpec = BuildSpec(),
+    span: Optional[tracing.Span] = None,
+    limits: Optional[resources.JobLimits] = None,
+) -> dict[str, str]:
+    files = render_project(app_project, keystore, sdk_root, spec, **({"heap_mb": limits.heap_mb} if limits else {}))
+    golden = workspace.clone_golden(base_dir, sdk_root, log_lines)
+    changed = workspace.write_project(base_dir, files, golden.files if golden else ())
+    if span is not None:
+        span.attributes.update({"workspace.golden": golden is not None, "workspace.files_rewritten": len(changed)})
+    log_lines.append(f"Gradle project generated in {base_dir} ({len(changed)} generated files changed)")
+    return files
+
+
+def placeholder_app(app_project: AppSnapshot) -> AppSnapshot:
+    # Same SDK levels as the build that triggered the warm-up, so its platform is already installed.
+    return replace(
+        app_project,
+        id=0,
+        name="Placeholder",
+        package_name="com.appgenerator.placeholder",
+        url="https://example.invalid/",
+        version_code=1,
+        version_name="1.0",
+    )
+
+
+def throwaway_keystore(directory: Path) -> KeystoreSnapshot:
+    keystore_path = directory / "placeholder.keystore"
+    password = secrets.token_urlsafe(12)
+    subprocess.run(
+        [
+            "keytool",
+            "-genkeypair",
+            "-storetype",
+            "PKCS12",
+            "-keystore",
+            str(keystore_path),
+            "-alias",
+            "placeholder",
+            "-keyalg",
+            "RSA",
+            "-keysize",
+            "2048",
+            "-validity",
+            "1",
+            "-storepass",
+            password,
+            "-keypass",
+            password,
+            "-dname",
+            "CN=Placeholder",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return KeystoreSnapshot(str(keystore_path), "placeholder", password, password)
+
+
+def warm_golden(
+    app_project: AppSnapshot, sdk_root: Path, gradle_home: Path, limits: Optional[resources.JobLimits] = None
 ) -> None:
-    package_path = Path("app/src/main/java") / Path(app_project.package_name.replace(".", "/"))
-    manifest = textwrap.dedent(
-        f"""
-        <manifest xmlns:android="http://schemas.android.com/apk/res/android" package="{app_project.package_name}">
-            <uses-permission android:name="android.permission.INTERNET" />
-            <application
-                android:label="{app_project.name}"
-                android:allowBackup="true"
-                android:icon="@android:drawable/sym_def_app_icon"
-                android:supportsRtl="true">
-                <activity
-                    android:name=".MainActivity"
-                    android:exported="true"
-                    android:theme="@style/Theme.AppCompat.Light.NoActionBar">
-                    <intent-filter>
-                        <action android:name="android.intent.action.MAIN" />
-                        <category android:name="android.intent.category.LAUNCHER" />
-                    </intent-filter>
-                </activity>
-            </application>
-        </manifest>
-        """
-    ).strip()
-    write_file(base_dir / "app/src/main/AndroidManifest.xml", manifest)
-
-    main_activity = textwrap.dedent(
-        f"""
-        package {app_project.package_name}
-
-        import android.os.Bundle
-        import android.webkit.WebView
-        import android.webkit.WebViewClient
-        import androidx.appcompat.app.AppCompatActivity
-
-        class MainActivity : AppCompatActivity() {{
-            override fun onCreate(savedInstanceState: Bundle?) {{
-                super.onCreate(savedInstanceState)
-                val webView = WebView(this)
-                webView.settings.javaScriptEnabled = true
-                webView.webViewClient = WebViewClient()
-                webView.loadUrl("{app_project.url}")
-                setContentView(webView)
-            }}
-        }}
-        """
-    ).strip()
-    write_file(base_dir / package_path / "MainActivity.kt", main_activity)
-
-    strings = textwrap.dedent(
-        f"""
-        <resources>
-            <string name="app_name">{app_project.name}</string>
-        </resources>
-        """
-    ).strip()
-    write_file(base_dir / "app/src/main/res/values/strings.xml", strings)
-
-    styles = textwrap.dedent(
-        """
-        <resources>
-            <style name="Theme.AppCompat.Light.NoActionBar" parent="Theme.AppCompat.Light.NoActionBar" />
-        </resources>
-        """
-    ).strip()
-    write_file(base_dir / "app/src/main/res/values/themes.xml", styles)
-
-    colors = """<resources><color name=\"placeholder\">#6200EE</color></resources>"""
-    write_file(base_dir / "app/src/main/res/values/colors.xml", colors)
-
-    settings_gradle = textwrap.dedent(
-        f"""
-        rootProject.name = "webview-{app_project.id}"
-        include(":app")
-        """
-    ).strip()
-    write_file(base_dir / "settings.gradle", settings_gradle)
-
-    gradle_root = textwrap.dedent(
-        """
-        buildscript {
-            repositories {
-                google()
-                mavenCentral()
-            }
-            dependencies {
-                classpath 'com.android.tools.build:gradle:8.1.4'
-                classpath 'org.jetbrains.kotlin:kotlin-gradle-plugin:1.9.10'
-            }
-        }
-
-        allprojects {
-            repositories {
-                google()
-                mavenCentral()
-            }
-        }
-
-        task clean(type: Delete) {
-            delete rootProject.buildDir
-        }
-        """
-    ).strip()
-    write_file(base_dir / "build.gradle", gradle_root)
-
-    module_build = textwrap.dedent(
-        f"""
-        apply plugin: 'com.android.application'
-        apply plugin: 'org.jetbrains.kotlin.android'
-
-        android {{
-            namespace "{app_project.package_name}"
-            compileSdkVersion {app_project.target_sdk}
-
-            defaultConfig {{
-                applicationId "{app_project.package_name}"
-                minSdkVersion {app_project.min_sdk}
-                targetSdkVersion {app_project.target_sdk}
-                versionCode {app_project.version_code}
-                versionName "{app_project.version_name}"
-            }}
-
-            signingConfigs {{
-                release {{
-                    storeFile file('{keystore.keystore_path}')
-                    storePassword '{keystore.store_password}'
-                    keyAlias '{keystore.alias}'
-                    keyPassword '{keystore.key_password}'
-                }}
-            }}
-
-            buildTypes {{
-                debug {{
-                    signingConfig signingConfigs.release
-                }}
-                release {{
-                    signingConfig signingConfigs.release
-                    minifyEnabled false
-                    shrinkResources false
-                }}
-            }}
-        }}
-
-        dependencies {{
-            implementation 'androidx.core:core-ktx:1.12.0'
-            implementation 'androidx.appcompat:appcompat:1.6.1'
-            implementation 'androidx.activity:activity-ktx:1.8.2'
-            implementation 'androidx.webkit:webkit:1.9.0'
-        }}
-        """
-    ).strip()
-    write_file(base_dir / "app/build.gradle", module_build)
-
-    gradle_props = textwrap.dedent(
-        """
-        android.useAndroidX=true
-        android.enableJetifier=true
-        org.gradle.jvmargs=-Xmx2g -Dfile.encoding=UTF-8
-        """
-    ).strip()
-    write_file(base_dir / "gradle.properties", gradle_props)
-
-    local_props = textwrap.dedent(
-        f"""
-        sdk.dir={sdk_root}
-        """
-    ).strip()
-    write_file(base_dir / "local.properties", local_props)
-
-    log_lines.append(f"Gradle project generated in {base_dir}")
-
-
-def run_gradle_build(base_dir: Path, sdk_root: Path, gradle_home: Path, log_lines: list[str]) -> None:
-    gradle_bin = ensure_gradle(gradle_home)
+    # A customer's workspace is never promoted. The first build on a node without a golden is followed, in the
+    # same slot, by a build of a placeholder app signed with its own keystore, and that workspace becomes the golden.
+    if not workspace.needs_golden(sdk_root) or not workspace.warmup_lock.acquire(blocking=False):
+        return
+    log_lines: list[str] = []
+    staging = None
+    try:
+        staging = workspace.warmup_dir(sdk_root)
+        keystore = throwaway_keystore(staging)
+        files = render_project(
+            placeholder_app(app_project), keystore, sdk_root, BuildSpec(), **({"heap_mb": limits.heap_mb} if limits else {})
+        )
+        workspace.write_project(staging / "project", files)
+        run_gradle_build(staging / "project", sdk_root, gradle_home, log_lines, BuildSpec(), limits=limits)
+        Path(keystore.keystore_path).unlink(missing_ok=True)
+        target = workspace.promote(staging, sdk_root, files)
+        if target is not None:
+            print(f"Promoted a placeholder warm-up build to golden workspace {target}", file=sys.stderr)
+    except Exception as exc:  # noqa: BLE001
+        print(f"Golden workspace warm-up failed: {exc}", file=sys.stderr)
+    finally:
+        if staging is not None:
+            shutil.rmtree(staging, ignore_errors=True)
+        workspace.warmup_lock.release()
+
+
+def parse_gradle_duration(text: str) -> float:
+    return sum(float(value) * GRADLE_UNITS[unit] for value, unit in GRADLE_DURATION.findall(text))
+
+
+def trace_gradle_profile(base_dir: Path, trace: tracing.Trace, parent: tracing.Span) -> None:
+    reports = [
+        report
+        for report in (base_dir / "build" / "reports" / "profile").glob("profile-*.html")
+        if report.stat().st_mtime_ns >= parent.start_ns
+    ]
+    if not reports:
+        return
+    html = max(reports, key=lambda report: report.stat().st_mtime_ns).read_text(errors="replace")
+    # --profile only reports durations, so phases are laid end to end and tasks start with task execution.
+    offset = execution_start = parent.start_ns
+    for label, duration in GRADLE_PHASE.findall(html.split('id="tab1"', 1)[0]):
+        if label in ("Total Build Time", "Artifact Transforms"):
+            continue
+        nanos = int(parse_gradle_duration(duration) * 1e9)
+        if label == "Task Execution":
+            execution_start = offset
+        trace.start_span(f"gradle {label.lower()}", parent=parent, start_ns=offset).end(offset + nanos)
+        offset += nanos
+    for task, duration, outcome in GRADLE_TASK.findall(html):
+        nanos = int(parse_gradle_duration(duration) * 1e9)
+        if nanos:
+            span = trace.start_span(task, parent=parent, start_ns=execution_start, **{"gradle.task.outcome": outcome or "EXECUTED"})
+            span.end(execution_start + nanos)
+
+
+def gradle_env(sdk_root: Path, gradle_bin: str) -> dict[str, str]:
     env = os.environ.copy()
     env.setdefault("ANDROID_SDK_ROOT", str(sdk_root))
+    env.setdefault("GRADLE_USER_HOME", str(Path(settings.toolchain_dir) / "gradle-user-home"))
     env["PATH"] = f"{Path(gradle_bin).parent}:{env.get('PATH', '')}"
+    return env
+
+
+def registry_flag(slot: int) -> str:
+    return f"-Dorg.gradle.daemon.registry.base={resources.daemon_registry(slot)}"
+
+
+def stop_slot_daemons(gradle_bin: str, env: dict[str, str], slot: int) -> None:
+    subprocess.run([gradle_bin, "--stop", registry_flag(slot)], env=env, capture_output=True, text=True)
+
+
+def run_gradle_build(
+    base_dir: Path,
+    sdk_root: Path,
+    gradle_home: Path,
+    log_lines: list[str],
+    spec: BuildSpec = BuildSpec(),
+    trace: Optional[tracing.Trace] = None,
+    limits: Optional[resources.JobLimits] = None,
+    usage: Optional[resources.UsageMonitor] = None,
+) -> None:
+    trace = trace or tracing.Trace("builder")
+    gradle_bin = ensure_gradle(gradle_home)
+    env = gradle_env(sdk_root, gradle_bin)
     commands = [
         [gradle_bin, "wrapper"],
-        ["./gradlew", "assembleRelease", "bundleRelease", "-x", "lint"],
+        ["./gradlew", *spec.gradle_tasks(), "-x", "lint", "--profile"],
     ]
-    for cmd in commands:
-        proc = subprocess.run(
-            cmd,
-            cwd=base_dir,
-            env=env,
-            capture_output=True,
-            text=True,
+    extra_args = []
+    if limits is not None:
+        env[resources.SLOT_ENV] = limits.tag
+        extra_args = [registry_flag(limits.slot), f"--max-workers={limits.max_workers}"]
+        if slot_heaps.get(limits.slot) != limits.heap_mb:
+            # Daemons started with another heap are incompatible and would sit idle inside the slot's budget.
+            stop_slot_daemons(gradle_bin, env, limits.slot)
+            slot_heaps[limits.slot] = limits.heap_mb
+        log_lines.append(
+            f"Gradle limits (slot {limits.slot}): {limits.heap_mb} MB heap, {limits.max_workers} workers, "
+            f"{limits.memory_bytes // resources.MIB} MB memory"
         )
-        log_lines.append(proc.stdout)
-        if proc.returncode != 0:
-            log_lines.append(proc.stderr)
-            raise RuntimeError(f"Command {' '.join(cmd)} failed with code {proc.returncode}")
-
-
-def collect_artifacts(base_dir: Path, job: models.BuildJob, log_lines: list[str]) -> tuple[str, str]:
-    apk_src = base_dir / "app/build/outputs/apk/release/app-release.apk"
-    aab_src = base_dir / "app/build/outputs/bundle/release/app-release.aab"
+    with usage or nullcontext():
+        for cmd in commands:
+            with trace.span(" ".join([Path(cmd[0]).name, *cmd[1:]])) as span:
+                run_cmd = [*cmd, *extra_args]
+                proc = subprocess.run(
+                    resources.limited_command(run_cmd, limits) if limits else run_cmd,
+                    cwd=base_dir,
+                    env=env,
+                    capture_output=True,
+                    text=True,
+                )
+                span.attributes["process.exit_code"] = proc.returncode
+                log_lines.append(proc.stdout)
+                if "--profile" in cmd:
+                    trace_gradle_profile(base_dir, trace, span)
+                if proc.returncode != 0:
+                    log_lines.append(proc.stderr)
+                    raise RuntimeError(f"Command {' '.join(cmd)} failed with code {proc.returncode}")
+    if usage is not None:
+        log_lines.append(f"Gradle peak RSS {usage.peak_rss_bytes // resources.MIB} MB, CPU time {usage.cpu_seconds:.1f}s")
+
+
+def collect_artifacts(base_dir: Path, job: BuildInputs, log_lines: list[str]) -> tuple[Optional[str], Optional[str]]:
+    spec = job.spec
+    outputs = base_dir / "app/build/outputs"
     artifacts_dir = Path(settings.artifact_dir) / str(job.app_project_id) / str(job.id)
     artifacts_dir.mkdir(parents=True, exist_ok=True)
-    if not apk_src.exists() or not aab_src.exists():
-        raise FileNotFoundError("Expected Gradle outputs were not produced")
+    copies = []
+    if spec.wants_apk:
+        apk_name = f"app-universal-{spec.variant}.apk" if spec.abi_splits else f"app-{spec.variant}.apk"
+        copies.append((outputs / "apk" / spec.variant / apk_name, artifacts_dir / "app.apk"))
+        for abi in spec.abi_splits:
+            copies.append((outputs / "apk" / spec.variant / f"app-{abi}-{spec.variant}.apk", artifacts_dir / f"app-{abi}.apk"))
+    if spec.wants_aab:
+        copies.append((outputs / "bundle" / spec.variant / f"app-{spec.variant}.aab", artifacts_dir / "app.aab"))
+    missing = [str(src) for src, _ in copies if not src.exists()]
+    if missing:
+        raise FileNotFoundError(f"Expected Gradle outputs were not produced: {', '.join(missing)}")
+    for src, dest in copies:
+        shutil.copy(src, dest)
+    log_lines.append(f"Artifacts stored to {artifacts_dir}")
     apk_dest = artifacts_dir / "app.apk"
     aab_dest = artifacts_dir / "app.aab"
-    shutil.copy(apk_src, apk_dest)
-    shutil.copy(aab_src, aab_dest)
-    log_lines.append(f"Artifacts stored to {artifacts_dir}")
-    return str(apk_dest), str(aab_dest)
+    return (str(apk_dest) if spec.wants_apk else None), (str(aab_dest) if spec.wants_aab else None)
+
+
+def update_job(job_id: int, **values) -> None:
+    with SessionLocal.begin() as db:
+        db.query(models.BuildJob).filter(models.BuildJob.id == job_id).update(values, synchronize_session=False)
+
+
+@dataclass(frozen=True)
+class NodeCaches:
+    platforms: frozenset[str]
+    gradle_versions: frozenset[str]
+    warm_daemons: frozenset[str]
+
+
+def scan_caches() -> NodeCaches:
+    toolchain = Path(settings.toolchain_dir)
+    platforms_dir = toolchain / "android-sdk" / "platforms"
+    platforms = frozenset(
+        f"platforms;{item.name}" for item in platforms_dir.glob("android-*") if (item / "android.jar").exists()
+    )
+    gradle_versions = frozenset(
+        item.name.removeprefix("gradle-") for item in (toolchain / "gradle").glob("gradle-*") if (item / "bin" / "gradle").exists()
+    )
+    cutoff = time.time() - settings.gradle_daemon_idle_seconds
+    daemon_dir = toolchain / "gradle-user-home" / "daemon"
+    # Daemons live in per-slot registries (daemon/slot-<n>/<version>) since builds run concurrently.
+    warm_daemons = frozenset(
+        item.name
+        for item in [*daemon_dir.glob("slot-*/*"), *(item for item in daemon_dir.glob("*") if not item.name.startswith("slot-"))]
+        if item.is_dir() and max((child.stat().st_mtime for child in item.iterdir()), default=0) >= cutoff
+    )
+    return NodeCaches(platforms, gradle_versions, warm_daemons)
+
+
+def register_node(
+    caches: NodeCaches,
+    current_job_id: Optional[int] = None,
+    host: Optional[resources.Host] = None,
+    capacity: Optional[resources.Capacity] = None,
+    running_jobs: int = 0,
+) -> None:
+    now = datetime.utcnow()
+    with SessionLocal.begin() as db:
+        node = db.get(models.BuilderNode, settings.node_id)
+        if node is None:
+            node = models.BuilderNode(id=settings.node_id, started_at=now)
+            db.add(node)
+        node.platforms = sorted(caches.platforms)
+        node.gradle_versions = sorted(caches.gradle_versions)
+        node.warm_daemons = sorted(caches.warm_daemons)
+        node.current_job_id = current_job_id
+        node.running_jobs = running_jobs
+        if capacity is not None:
+            node.slots = capacity.slots
+        if host is not None:
+            node.memory_bytes = host.memory_bytes
+            node.cpus = host.cpus
+        node.last_seen_at = now
+
+
+def warm_elsewhere(db, now: datetime) -> set[str]:
+    rows = (
+        db.query(models.BuilderNode.platforms)
+        .filter(
+            models.BuilderNode.id != settings.node_id,
+            models.BuilderNode.last_seen_at >= now - timedelta(seconds=settings.node_ttl_seconds),
+        )
+        .all()
+    )
+    return {platform for (platforms,) in rows for platform in platforms or ()}
+
+
+def pick_job(candidates, caches: NodeCaches, elsewhere: set[str], now: datetime) -> tuple[Optional[int], bool, bool]:
+    for job_id, _, target_sdk in candidates:
+        if f"platforms;android-{target_sdk}" in caches.platforms:
+            return job_id, True, False
+    steal_before = now - timedelta(seconds=settings.affinity_wait_seconds)
+    for job_id, created_at, target_sdk in candidates:
+        if f"platforms;android-{target_sdk}" not in elsewhere:
+            return job_id, False, False
+        if created_at <= steal_before:
+            return job_id, False, True
+    return None, False, False
+
+
+def finish_job(job: BuildInputs, status: str, only_running: bool = False, **values) -> None:
+    finished_at = datetime.utcnow()
+    with SessionLocal.begin() as db:
+        query = db.query(models.BuildJob).filter(models.BuildJob.id == job.id)
+        if only_running:
+            query = query.filter(models.BuildJob.status == models.BuildStatus.running.value)
+        if not query.update(dict(values, status=status, finished_at=finished_at), synchronize_session=False) and only_running:
+            return
+        stats.record_finished(db, job.owner_user_id, status, job.started_at, finished_at)
+        webhooks.enqueue_build(
+            db, job.id, job.app_project_id, job.owner_user_id, status, finished_at, package_name=job.app_project.package_name
+        )
 
 
-def process_build(db: Session, job: models.BuildJob):
-    log_lines: list[str] = []
-    job.status = models.BuildStatus.running.value
-    db.commit()
-    db.refresh(job)
-
-    app_project = db.get(models.AppProject, job.app_project_id)
-    if not app_project:
-        raise RuntimeError("Associated AppProject not found")
-    keystore = app_project.keystore
+def claim_next_job(caches: NodeCaches) -> Optional[BuildInputs]:
+    now = datetime.utcnow()
+    with SessionLocal.begin() as db:
+        candidates = (
+            db.query(models.BuildJob.id, models.BuildJob.created_at, models.AppProject.target_sdk)
+            .join(models.AppProject, models.AppProject.id == models.BuildJob.app_project_id)
+            .filter(models.BuildJob.status == models.BuildStatus.pending.value)
+            .order_by(models.BuildJob.created_at.asc())
+            .limit(settings.claim_window)
+            .with_for_update(skip_locked=True, of=models.BuildJob)
+            .all()
+        )
+        if not candidates:
+            return None
+        job_id, hit, stolen = pick_job(candidates, caches, warm_elsewhere(db, now), now)
+        if job_id is None:
+            affinity_deferred_total.inc()
+            return None
+        (cache_hits_total if hit else cache_misses_total).inc()
+        if stolen:
+            jobs_stolen_total.inc()
+        db.query(models.BuilderNode).filter(models.BuilderNode.id == settings.node_id).update(
+            {
+                models.BuilderNode.jobs_claimed: models.BuilderNode.jobs_claimed + 1,
+                models.BuilderNode.cache_hits: models.BuilderNode.cache_hits + int(hit),
+                models.BuilderNode.cache_misses: models.BuilderNode.cache_misses + int(not hit),
+                models.BuilderNode.jobs_stolen: models.BuilderNode.jobs_stolen + int(stolen),
+                models.BuilderNode.current_job_id: job_id,
+                models.BuilderNode.last_seen_at: now,
+            },
+            synchronize_session=False,
+        )
+        job = db.get(models.BuildJob, job_id)
+        job.status = models.BuildStatus.running.value
+        job.stage = "claimed"
+        job.builder_node = settings.node_id
+        job.started_at = now
+        app_project = job.app_project
+        keystore = app_project.keystore
+        stats.record_started(db, app_project.owner_user_id, now)
+        return BuildInputs(
+            id=job.id,
+            app_project_id=job.app_project_id,
+            app_project=AppSnapshot(
+                id=app_project.id,
+                name=app_project.name,
+                package_name=app_project.package_name,
+                url=app_project.url,
+                min_sdk=app_project.min_sdk,
+                target_sdk=app_project.target_sdk,
+                version_code=app_project.version_code,
+                version_name=app_project.version_name,
+            ),
+            keystore=KeystoreSnapshot(
+                keystore_path=keystore.keystore_path,
+                alias=keystore.alias,
+                store_password=keystore.store_password,
+                key_password=keystore.key_password,
+            ) if keystore else None,
+            spec=BuildSpec(
+                outputs=job.outputs,
+                variant=job.variant,
+                minify=job.minify,
+                abi_splits=tuple(job.abi_splits or ()),
+            ),
+            owner_user_id=app_project.owner_user_id,
+            started_at=now,
+            created_at=job.created_at,
+            traceparent=job.traceparent,
+        )
+
+
+def precompute_deltas(job: BuildInputs, apk_path: Optional[str], aab_path: Optional[str], log_lines: list[str]) -> None:
+    if settings.delta_base_builds <= 0:
+        return
+    with SessionLocal() as db:
+        bases = (
+            db.query(models.BuildJob.id, models.BuildJob.apk_path, models.BuildJob.aab_path)
+            .filter(
+                models.BuildJob.app_project_id == job.app_project_id,
+                models.BuildJob.status == models.BuildStatus.success.value,
+                models.BuildJob.id != job.id,
+            )
+            .order_by(models.BuildJob.created_at.desc())
+            .limit(settings.delta_base_builds)
+            .all()
+        )
+    for target_path in (apk_path, aab_path):
+        if target_path:
+            artifact_sha256(target_path)
+    for base_id, base_apk, base_aab in bases:
+        for base_path, target_path in ((base_apk, apk_path), (base_aab, aab_path)):
+            if not base_path or not target_path:
+                continue
+            try:
+                delta_path = ensure_delta(base_path, base_id, target_path)
+            except Exception as exc:  # noqa: BLE001
+                log_lines.append(f"Delta from build {base_id} failed: {exc}")
+                continue
+            if delta_path:
+                log_lines.append(f"Delta from build {base_id}: {delta_path} ({delta_path.stat().st_size} bytes)")
+
+
+def start_trace(job: BuildInputs, claim_started_ns: int) -> tracing.Trace:
+    trace = tracing.Trace("builder", tracing.parse_traceparent(job.traceparent))
+    queued_ns = int(job.created_at.replace(tzinfo=timezone.utc).timestamp() * 1e9) if job.created_at else claim_started_ns
+    root = trace.start_span(
+        "build",
+        start_ns=min(queued_ns, claim_started_ns),
+        **{"build.id": job.id, "app.id": job.app_project_id, "builder.node": settings.node_id},
+    )
+    trace.start_span("queue_wait", parent=root, start_ns=min(queued_ns, claim_started_ns)).end(claim_started_ns)
+    trace.start_span("claim", parent=root, start_ns=claim_started_ns).end()
+    trace.enter(root)
+    return trace
+
+
+@contextmanager
+def build_stage(job: BuildInputs, trace: tracing.Trace, name: str):
+    update_job(job.id, stage=name)
+    with trace.span(name) as span:
+        yield span
+
+
+def process_build(
+    job: BuildInputs,
+    log_lines: list[str],
+    trace: Optional[tracing.Trace] = None,
+    limits: Optional[resources.JobLimits] = None,
+    usage: Optional[resources.UsageMonitor] = None,
+) -> None:
+    trace = trace or tracing.Trace("builder")
+    with build_stage(job, trace, "preflight"):
+        issues = preflight.validate(job.app_project, job.keystore, job.spec)
+        update_job(job.id, validation=preflight.report(issues))
+        if preflight.has_errors(issues):
+            raise RuntimeError(f"Preflight failed: {preflight.summary(issues)}")
     base_dir = Path(settings.build_work_dir) / str(job.id)
     base_dir.mkdir(parents=True, exist_ok=True)
     log_lines.append(f"Working directory: {base_dir}")
 
-    sdk_root, gradle_home = bootstrap_toolchain(base_dir, log_lines)
-    create_android_project(base_dir, app_project, keystore, sdk_root, log_lines)
-    run_gradle_build(base_dir, sdk_root, gradle_home, log_lines)
-    apk_path, aab_path = collect_artifacts(base_dir, job, log_lines)
+    with build_stage(job, trace, "bootstrap_toolchain"), toolchain_lock:
+        sdk_root, gradle_home = bootstrap_toolchain(job.app_project, log_lines)
+    with build_stage(job, trace, "create_android_project") as span:
+        create_android_project(base_dir, job.app_project, job.keystore, sdk_root, log_lines, job.spec, span, limits)
+    with build_stage(job, trace, "gradle_build") as span:
+        run_gradle_build(base_dir, sdk_root, gradle_home, log_lines, job.spec, trace, limits, usage)
+        if usage is not None:
+            span.attributes.update({f"gradle.{name}": value for name, value in usage.columns().items()})
+    with build_stage(job, trace, "collect_artifacts"):
+        apk_path, aab_path = collect_artifacts(base_dir, job, log_lines)
+        with trace.span("precompute_deltas"):
+            precompute_deltas(job, apk_path, aab_path, log_lines)
+
+    finish_job(
+        job,
+        models.BuildStatus.success.value,
+        apk_path=apk_path,
+        aab_path=aab_path,
+        log="\n".join(log_lines),
+        trace_spans=trace.finish(),
+        **(usage.columns() if usage else {}),
+    )
+    warm_golden(job.app_project, sdk_root, gradle_home, limits)
+
+
+def write_metrics() -> None:
+    if not settings.metrics_file:
+        return
+    tmp_path = Path(settings.metrics_file).with_suffix(".tmp")
+    tmp_path.write_text(registry.render())
+    tmp_path.replace(settings.metrics_file)
 
-    job.status = models.BuildStatus.success.value
-    job.apk_path = apk_path
-    job.aab_path = aab_path
-    job.log = "\n".join(log_lines)
-    job.finished_at = datetime.utcnow()
-    db.commit()
 
+def run_retention() -> None:
+    try:
+        with SessionLocal() as db:
+            summary = enforce_retention(db)
+    except Exception as exc:  # noqa: BLE001
+        print(f"Artifact retention failed: {exc}", file=sys.stderr)
+        return
+    if summary["evicted"]:
+        print(f"Artifact retention: {summary}", file=sys.stderr)
 
-def main():
-    bootstrap_toolchain()
-    while True:
+
+def run_archival() -> None:
+    try:
         with SessionLocal() as db:
-            job = (
-                db.query(models.BuildJob)
-                .filter(models.BuildJob.status == models.BuildStatus.pending.value)
-                .order_by(models.BuildJob.created_at.asc())
-                .first()
+            summary = archive.run(db)
+    except Exception as exc:  # noqa: BLE001
+        print(f"Build archival failed: {exc}", file=sys.stderr)
+        return
+    if summary["archived"]:
+        print(f"Build archival: {summary}", file=sys.stderr)
+
+
+def run_job(job: BuildInputs, limits: resources.JobLimits, claim_started_ns: int) -> None:
+    log_lines: list[str] = []
+    try:
+        trace = start_trace(job, claim_started_ns)
+        usage = resources.UsageMonitor(limits)
+        try:
+            process_build(job, log_lines, trace, limits, usage)
+        except Exception as exc:  # noqa: BLE001
+            log_lines.append(str(exc))
+            finish_job(
+                job, models.BuildStatus.failed.value, log="\n".join(log_lines), trace_spans=trace.finish(exc), **usage.columns()
             )
-            if not job:
-                time.sleep(5)
-                continue
-            try:
-                process_build(db, job)
-            except Exception as exc:  # noqa: BLE001
-                job.status = models.BuildStatus.failed.value
-                job.log = str(exc)
-                job.finished_at = datetime.utcnow()
-                db.commit()
-        time.sleep(1)
+        trace.export()
+    except Exception as exc:  # noqa: BLE001
+        # Nothing above this thread would report the error, and the job would stay running until someone noticed.
+        print(f"Build {job.id} failed outside its build steps: {exc}\n{traceback.format_exc()}", file=sys.stderr)
+        try:
+            log_lines.append(f"Builder error: {exc}")
+            finish_job(job, models.BuildStatus.failed.value, only_running=True, log="\n".join(log_lines))
+        except Exception as exc:  # noqa: BLE001
+            print(f"Could not mark build {job.id} failed: {exc}", file=sys.stderr)
+
+
+def retire_slots(used_slots: set[int], busy: set[int], slots: int) -> None:
+    # A slot dropped by a smaller plan would otherwise keep its idle daemon's heap until Gradle's idle timeout.
+    gradle_bin = Path(settings.toolchain_dir) / "gradle" / f"gradle-{settings.gradle_version}" / "bin" / "gradle"
+    for slot in sorted(used_slots - busy):
+        if slot < slots:
+            continue
+        if gradle_bin.exists():
+            stop_slot_daemons(str(gradle_bin), gradle_env(Path(settings.toolchain_dir) / "android-sdk", str(gradle_bin)), slot)
+        slot_heaps.pop(slot, None)
+        used_slots.discard(slot)
+
+
+def plan_capacity() -> tuple[resources.Host, resources.Capacity]:
+    host = resources.probe_host()
+    with SessionLocal() as db:
+        return host, resources.plan(host, resources.job_memory_bytes(db))
+
+
+def main():
+    next_retention = 0.0
+    next_archival = 0.0
+    caches = scan_caches()
+    running: dict[int, tuple[int, threading.Thread]] = {}
+    used_slots: set[int] = set()
+    while True:
+        if settings.retention_interval_seconds and time.monotonic() >= next_retention:
+            run_retention()
+            next_retention = time.monotonic() + settings.retention_interval_seconds
+        if settings.archive_interval_seconds and time.monotonic() >= next_archival:
+            run_archival()
+            next_archival = time.monotonic() + settings.archive_interval_seconds
+        finished = [slot for slot, (_, thread) in running.items() if not thread.is_alive()]
+        for slot in finished:
+            del running[slot]
+        if finished:
+            caches = scan_caches()
+        host, capacity = plan_capacity()
+        retire_slots(used_slots, set(running), capacity.slots)
+        register_node(caches, max((job_id for job_id, _ in running.values()), default=None), host, capacity, len(running))
+        job = None
+        free_slots = sorted(set(range(capacity.slots)) - set(running))
+        if free_slots:
+            slot = free_slots[0]
+            # The free slot's idle daemon is memory its next build reuses, so it counts as available.
+            if running and host.available_bytes + resources.slot_rss(slot) < capacity.job_memory_bytes:
+                resources.memory_deferred_total.inc()
+            else:
+                claim_started_ns = time.time_ns()
+                job = claim_next_job(caches)
+        if job:
+            used_slots.add(slot)
+            thread = threading.Thread(target=run_job, args=(job, capacity.limits(slot), claim_started_ns), name=f"build-{job.id}")
+            thread.start()
+            running[slot] = (job.id, thread)
+        resources.running_gauge.set(len(running))
+        write_metrics()
+        time.sleep(1 if job else settings.poll_interval_seconds)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,242 @@
+import math
+import os
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from webapp.app import models
+from webapp.app.metrics import registry
+from builder.config import get_settings
+
+settings = get_settings()
+MIB = 1024 * 1024
+CGROUP_FS = Path("/sys/fs/cgroup")
+# Every process a slot's Gradle client starts (its daemon, aapt2, workers) inherits this variable.
+SLOT_ENV = "APPGEN_BUILDER_SLOT"
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+slots_gauge = registry.gauge("builder_slots", "Concurrent builds this node currently allows")
+running_gauge = registry.gauge("builder_running_jobs", "Builds running on this node")
+job_memory_gauge = registry.gauge("builder_job_memory_estimate_bytes", "Memory reserved per build, from the peak RSS of recent builds")
+memory_deferred_total = registry.counter("builder_memory_deferred_total", "Polls that left a free slot idle because host memory was short")
+peak_rss_histogram = registry.histogram(
+    "builder_job_peak_rss_bytes",
+    "Peak resident memory of a build's Gradle processes",
+    buckets=tuple(gib * 1024 * MIB for gib in (0.5, 1, 1.5, 2, 3, 4, 6, 8, 12, 16)),
+)
+cpu_histogram = registry.histogram(
+    "builder_job_cpu_seconds", "CPU time used by a build's Gradle processes", buckets=(15, 30, 60, 120, 300, 600, 1200, 2400)
+)
+
+
+@dataclass(frozen=True)
+class Host:
+    memory_bytes: int
+    available_bytes: int
+    cpus: int
+
+
+@dataclass(frozen=True)
+class JobLimits:
+    slot: int
+    heap_mb: int
+    max_workers: int
+    memory_bytes: int
+
+    @property
+    def tag(self) -> str:
+        return slot_tag(self.slot)
+
+
+@dataclass(frozen=True)
+class Capacity:
+    slots: int
+    job_memory_bytes: int
+    budget_bytes: int
+    heap_mb: int
+    max_workers: int
+
+    def limits(self, slot: int) -> JobLimits:
+        return JobLimits(slot, self.heap_mb, self.max_workers, self.budget_bytes)
+
+
+def read_meminfo() -> dict[str, int]:
+    values = {}
+    try:
+        with open("/proc/meminfo") as handle:
+            for line in handle:
+                name, _, rest = line.partition(":")
+                values[name] = int(rest.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return values
+
+
+def read_cgroup(name: str) -> Optional[str]:
+    try:
+        return (CGROUP_FS / name).read_text().strip()
+    except OSError:
+        return None
+
+
+def probe_host() -> Host:
+    meminfo = read_meminfo()
+    total = meminfo.get("MemTotal", 0)
+    available = meminfo.get("MemAvailable", total)
+    # Inside a container the cgroup limit, not the machine, is what the kernel enforces.
+    limit = read_cgroup("memory.max")
+    if limit and limit.isdigit():
+        stat = dict(line.split() for line in (read_cgroup("memory.stat") or "").splitlines() if line.count(" ") == 1)
+        used = int(read_cgroup("memory.current") or 0) - int(stat.get("inactive_file", 0))
+        total = min(total or int(limit), int(limit))
+        available = min(available, max(0, int(limit) - used))
+    cpus = len(os.sched_getaffinity(0))
+    quota, _, period = (read_cgroup("cpu.max") or "max").partition(" ")
+    if quota.isdigit() and period.isdigit():
+        cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    if settings.host_memory_mb:
+        total = settings.host_memory_mb * MIB
+        available = min(available, total)
+    if settings.host_cpus:
+        cpus = settings.host_cpus
+    return Host(total, available, cpus)
+
+
+def job_memory_bytes(db) -> int:
+    peaks = [
+        peak
+        for (peak,) in db.query(models.BuildJob.peak_rss_bytes)
+        .filter(models.BuildJob.peak_rss_bytes.isnot(None))
+        .order_by(models.BuildJob.id.desc())
+        .limit(settings.rss_window)
+    ]
+    if not peaks:
+        return settings.job_memory_default_mb * MIB
+    return max(int(max(peaks) * settings.rss_headroom), settings.heap_min_mb * MIB)
+
+
+def plan(host: Host, job_bytes: int) -> Capacity:
+    usable = max(0, host.memory_bytes - settings.memory_reserve_mb * MIB)
+    by_cpu = max(1, host.cpus // max(1, settings.cpus_per_job))
+    slots = max(1, min(usable // job_bytes, by_cpu, settings.max_concurrency or by_cpu))
+    budget = max(usable // slots, job_bytes)
+    # Heaps come in 256 MB steps so consecutive builds in a slot can keep reusing its Gradle daemon.
+    heap_mb = int(budget * settings.heap_fraction / MIB) // 256 * 256
+    heap_mb = min(max(heap_mb, settings.heap_min_mb), settings.heap_max_mb)
+    capacity = Capacity(slots, job_bytes, budget, heap_mb, max(1, host.cpus // slots))
+    slots_gauge.set(slots)
+    job_memory_gauge.set(job_bytes)
+    return capacity
+
+
+def slot_tag(slot: int) -> str:
+    return f"{settings.node_id}.{slot}"
+
+
+def daemon_registry(slot: int) -> Path:
+    # One daemon registry per slot keeps a build from connecting to an idle daemon owned by another slot.
+    return Path(settings.toolchain_dir) / "gradle-user-home" / "daemon" / f"slot-{slot}"
+
+
+@lru_cache()
+def cgroup_root() -> Optional[Path]:
+    if settings.resource_limits not in ("auto", "cgroup"):
+        return None
+    root = Path(settings.cgroup_root)
+    try:
+        # Only a delegated cgroup v2 hierarchy will do; on v1 hosts the mount point is a plain tmpfs.
+        if not (root.parent / "cgroup.controllers").exists():
+            raise OSError(f"{root.parent} is not a cgroup v2 directory")
+        root.mkdir(exist_ok=True)
+        (root / "cgroup.subtree_control").write_text("+memory +cpu")
+    except OSError as exc:
+        if settings.resource_limits == "cgroup":
+            raise RuntimeError(f"BUILDER_RESOURCE_LIMITS=cgroup but {root} is not writable: {exc}") from exc
+        return None
+    return root
+
+
+def limited_command(cmd: list[str], limits: JobLimits) -> list[str]:
+    root = cgroup_root()
+    if root is not None:
+        group = root / f"slot-{limits.slot}"
+        group.mkdir(exist_ok=True)
+        (group / "memory.max").write_text(str(limits.memory_bytes))
+        (group / "cpu.max").write_text(f"{limits.max_workers * 100000} 100000")
+        script = f'echo $$ > {group / "cgroup.procs"} && exec "$@"'
+    elif settings.resource_limits in ("auto", "rlimit"):
+        # Without a delegated cgroup each process of the tree gets the whole budget as its data limit.
+        script = f'ulimit -d {limits.memory_bytes // 1024} && exec "$@"'
+    else:
+        return cmd
+    return ["sh", "-c", script, "sh", *cmd]
+
+
+def slot_usage(tag: str) -> dict[int, tuple[int, int]]:
+    marker = f"{SLOT_ENV}={tag}".encode()
+    usage = {}
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/environ", "rb") as handle:
+                if marker not in handle.read().split(b"\0"):
+                    continue
+            with open(f"/proc/{entry.name}/stat") as handle:
+                fields = handle.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        usage[int(entry.name)] = (int(fields[21]) * PAGE_SIZE, int(fields[11]) + int(fields[12]))
+    return usage
+
+
+def slot_rss(slot: int) -> int:
+    return sum(rss for rss, _ in slot_usage(slot_tag(slot)).values())
+
+
+class UsageMonitor:
+    def __init__(self, limits: JobLimits):
+        self.limits = limits
+        self.peak_rss_bytes = 0
+        self.started = False
+        self._baseline: dict[int, int] = {}
+        self._latest: dict[int, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"usage-{limits.tag}", daemon=True)
+
+    def __enter__(self) -> "UsageMonitor":
+        # A daemon kept from the slot's previous build only counts from here on.
+        self._baseline = {pid: ticks for pid, (_, ticks) in slot_usage(self.limits.tag).items()}
+        self._latest = dict(self._baseline)
+        self.started = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        peak_rss_histogram.observe(self.peak_rss_bytes)
+        cpu_histogram.observe(self.cpu_seconds)
+
+    def _run(self) -> None:
+        while not self._stop.wait(settings.usage_sample_seconds):
+            self.sample()
+
+    def sample(self) -> None:
+        usage = slot_usage(self.limits.tag)
+        self.peak_rss_bytes = max(self.peak_rss_bytes, sum(rss for rss, _ in usage.values()))
+        self._latest.update({pid: ticks for pid, (_, ticks) in usage.items()})
+
+    @property
+    def cpu_seconds(self) -> float:
+        return sum(ticks - self._baseline.get(pid, 0) for pid, ticks in self._latest.items()) / CLOCK_TICKS
+
+    def columns(self) -> dict:
+        values = {"heap_mb": self.limits.heap_mb, "max_workers": self.limits.max_workers}
+        if self.started:
+            values.update(peak_rss_bytes=self.peak_rss_bytes, cpu_seconds=round(self.cpu_seconds, 2))
+        return values
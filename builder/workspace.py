@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+from webapp.app import android_project
+from webapp.app.metrics import registry
+from builder.config import get_settings
+
+settings = get_settings()
+META = ".golden.json"
+# Bumped whenever what a golden may contain changes; goldens of another format are discarded.
+GOLDEN_FORMAT = 3
+
+golden_hits_total = registry.counter("builder_golden_workspace_hits_total", "Builds that started from a clone of a golden workspace")
+golden_misses_total = registry.counter("builder_golden_workspace_misses_total", "Builds that started from an empty workspace")
+files_rewritten_total = registry.counter("builder_workspace_files_rewritten_total", "Generated project files whose content changed and were rewritten")
+files_unchanged_total = registry.counter("builder_workspace_files_unchanged_total", "Generated project files left untouched because their content matched")
+
+# One warm-up build per node at a time; the other slots keep building customer jobs.
+warmup_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Golden:
+    path: Path
+    files: tuple[str, ...]
+
+
+def golden_key(sdk_root: Path) -> str:
+    # Any change to the project templates or the toolchain starts a new golden workspace.
+    digest = hashlib.sha256(Path(android_project.__file__).read_bytes())
+    digest.update(f"\0{settings.gradle_version}\0{sdk_root}\0{GOLDEN_FORMAT}".encode())
+    return digest.hexdigest()[:16]
+
+
+def golden_root() -> Path:
+    return Path(settings.build_work_dir) / "golden"
+
+
+def fingerprint(path: Path) -> list:
+    count = size = latest = 0
+    for directory, _, names in os.walk(path):
+        for name in names:
+            stat = os.lstat(os.path.join(directory, name))
+            count += 1
+            size += stat.st_size
+            latest = max(latest, stat.st_mtime_ns)
+    return [count, size, latest]
+
+
+def find_golden(key: str) -> Optional[Golden]:
+    path = golden_root() / key
+    try:
+        meta = json.loads((path / META).read_text())
+    except (OSError, ValueError):
+        return None
+    # A golden that was written to since it was promoted (a hardlinked build rewriting a file in place) is discarded.
+    if meta.get("fingerprint") != fingerprint(path / "project"):
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+    return Golden(path / "project", tuple(meta["files"]))
+
+
+def clone_tree(source: Path, dest: Path, mode: str) -> str:
+    dest.mkdir(parents=True, exist_ok=True)
+    attempts = {"auto": ("reflink", "copy"), "reflink": ("reflink",), "hardlink": ("hardlink",), "copy": ("copy",)}[mode]
+    for method in attempts:
+        flags = {"reflink": ["-a", "--reflink=always"], "hardlink": ["-al"], "copy": ["-a"]}[method]
+        proc = subprocess.run(["cp", *flags, f"{source}/.", str(dest)], capture_output=True, text=True)
+        if proc.returncode == 0:
+            return method
+    raise RuntimeError(f"Cloning {source} failed: {proc.stderr.strip()}")
+
+
+def clone_golden(base_dir: Path, sdk_root: Path, log_lines: list[str]) -> Optional[Golden]:
+    if settings.workspace_clone == "off":
+        return None
+    golden = find_golden(golden_key(sdk_root))
+    if golden is None:
+        golden_misses_total.inc()
+        log_lines.append("No golden workspace for this template and toolchain yet; building from scratch")
+        return None
+    started = time.perf_counter()
+    method = clone_tree(golden.path, base_dir, settings.workspace_clone)
+    golden_hits_total.inc()
+    log_lines.append(f"Cloned golden workspace {golden.path} ({method}) in {time.perf_counter() - started:.2f}s")
+    return golden
+
+
+def write_project(base_dir: Path, files: dict[str, str], previous: Iterable[str] = ()) -> list[str]:
+    # Only files whose content differs are written, so Gradle sees unchanged inputs with their original timestamps.
+    changed = []
+    for relative_path, content in files.items():
+        path = base_dir / relative_path
+        try:
+            if path.read_text() == content:
+                files_unchanged_total.inc()
+                continue
+        except OSError:
+            pass
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.is_file():
+            # Replace instead of truncating so a hardlinked golden copy is never modified.
+            path.unlink()
+        path.write_text(content)
+        changed.append(relative_path)
+    files_rewritten_total.inc(len(changed))
+    for relative_path in set(previous) - set(files):
+        # The golden app's sources under another package name would otherwise be compiled in too.
+        stale = base_dir / relative_path
+        if stale.is_file():
+            stale.unlink()
+            changed.append(relative_path)
+    return changed
+
+
+def needs_golden(sdk_root: Path) -> bool:
+    return settings.workspace_clone != "off" and find_golden(golden_key(sdk_root)) is None
+
+
+def warmup_dir(sdk_root: Path) -> Path:
+    path = golden_root() / f".warmup-{golden_key(sdk_root)}-{uuid.uuid4().hex}"
+    (path / "project").mkdir(parents=True)
+    return path
+
+
+def promote(staging: Path, sdk_root: Path, files: dict[str, str]) -> Optional[Path]:
+    # Only a warm-up build of the placeholder app is promoted: a golden is cloned into every tenant's builds.
+    key = golden_key(sdk_root)
+    target = golden_root() / key
+    if target.exists():
+        return None
+    meta = {"key": key, "format": GOLDEN_FORMAT, "files": sorted(files), "fingerprint": fingerprint(staging / "project")}
+    (staging / META).write_text(json.dumps(meta))
+    try:
+        staging.rename(target)
+    except OSError:
+        return None
+    prune_goldens(keep=key)
+    return target
+
+
+def golden_format(path: Path) -> Optional[int]:
+    try:
+        return json.loads((path / META).read_text()).get("format")
+    except (OSError, ValueError):
+        return None
+
+
+def prune_goldens(keep: str) -> None:
+    goldens = []
+    for path in golden_root().iterdir():
+        if not path.is_dir() or path.name.startswith(".") or path.name == keep:
+            continue
+        if golden_format(path) != GOLDEN_FORMAT:
+            # Goldens of older formats may hold a customer build's state.
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            goldens.append(path)
+    goldens.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in goldens[max(0, settings.golden_keep - 1):]:
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,124 @@
+import math
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Sequence
+
+from fastapi import HTTPException, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import get_settings
+from .metrics import registry
+
+settings = get_settings()
+ACTIVE_STATUSES = (models.BuildStatus.pending.value, models.BuildStatus.running.value)
+
+admitted_total = registry.counter("build_admissions_total", "Build requests admitted into the queue")
+rejected_total = registry.counter("build_admission_rejections_total", "Build requests rejected by admission control")
+
+_capacity_lock = threading.Lock()
+_capacity: tuple[float, int, float] = (0.0, 1, 0.0)
+
+
+@dataclass
+class QueueEstimate:
+    position: int
+    estimated_start_seconds: int
+    build_seconds: float
+
+    @property
+    def headers(self) -> dict:
+        return {"X-Queue-Position": str(self.position), "X-Estimated-Start-Seconds": str(self.estimated_start_seconds)}
+
+
+def pending_count(db: Session) -> int:
+    return db.query(func.count(models.BuildJob.id)).filter(models.BuildJob.status == models.BuildStatus.pending.value).scalar()
+
+
+def live_slots(db: Session) -> int:
+    # Builders size their own concurrency, so capacity is the sum of the slots each live node reports.
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.builder_live_seconds)
+    return int(db.query(func.sum(models.BuilderNode.slots)).filter(models.BuilderNode.last_seen_at >= cutoff).scalar() or 0)
+
+
+def mean_build_seconds(db: Session) -> float:
+    since = datetime.utcnow().date() - timedelta(days=settings.build_estimate_days - 1)
+    count, total = db.query(
+        func.coalesce(func.sum(models.BuildStatsDaily.duration_count), 0),
+        func.coalesce(func.sum(models.BuildStatsDaily.duration_sum), 0),
+    ).filter(models.BuildStatsDaily.day >= since).one()
+    return float(total) / int(count) if count else settings.build_default_seconds
+
+
+def capacity(db: Session) -> tuple[int, float]:
+    # Slots and the mean duration move slowly, so accepted builds only pay for the pending count.
+    global _capacity
+    with _capacity_lock:
+        expires, slots, mean = _capacity
+        if time.monotonic() >= expires:
+            slots, mean = max(1, live_slots(db)), mean_build_seconds(db)
+            _capacity = (time.monotonic() + settings.build_estimate_cache_seconds, slots, mean)
+        return slots, mean
+
+
+def estimate(db: Session, position: int) -> QueueEstimate:
+    slots, mean = capacity(db)
+    waves = math.ceil(max(0, position - 1) / slots)
+    return QueueEstimate(position, int(waves * mean), mean)
+
+
+def _over_limit(db: Session, column, wanted: Counter, limit: int) -> bool:
+    if not limit:
+        return False
+    active = dict(
+        db.query(column, func.count(models.BuildJob.id))
+        .join(models.AppProject, models.AppProject.id == models.BuildJob.app_project_id)
+        .filter(models.BuildJob.status.in_(ACTIVE_STATUSES), column.in_(list(wanted)))
+        .group_by(column)
+        # A locking read sees jobs committed after this transaction's snapshot was taken.
+        .with_for_update(read=True)
+    )
+    return any(active.get(key, 0) + count > limit for key, count in wanted.items())
+
+
+def _lock_owners(db: Session, owners: Counter) -> None:
+    # Admissions for the same owner wait here until the previous one commits its jobs; ids are locked in
+    # order so batches spanning several owners cannot deadlock.
+    db.query(models.User.id).filter(models.User.id.in_(sorted(owners))).order_by(models.User.id).with_for_update().all()
+
+
+def _reject(reason: str, limit: int, queue: QueueEstimate, retry_after: float) -> HTTPException:
+    rejected_total.inc()
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail={
+            "message": reason,
+            "limit": limit,
+            "queue_position": queue.position,
+            "estimated_start_seconds": queue.estimated_start_seconds,
+        },
+        headers={"Retry-After": str(max(1, int(retry_after))), **queue.headers},
+    )
+
+
+def admit(db: Session, apps: Sequence[models.AppProject]) -> QueueEstimate:
+    count = len(apps)
+    pending = pending_count(db)
+    queue = estimate(db, pending + count)
+    if settings.build_queue_max and pending + count > settings.build_queue_max:
+        overflow = estimate(db, pending + count - settings.build_queue_max + 1)
+        raise _reject("Build queue is full", settings.build_queue_max, queue, overflow.estimated_start_seconds)
+    owners = Counter(app_project.owner_user_id for app_project in apps)
+    if settings.build_user_max_active or settings.build_app_max_active:
+        _lock_owners(db, owners)
+    if _over_limit(db, models.AppProject.owner_user_id, owners, settings.build_user_max_active):
+        raise _reject("Too many active builds for this user", settings.build_user_max_active, queue, queue.build_seconds)
+    app_ids = Counter(app_project.id for app_project in apps)
+    if _over_limit(db, models.BuildJob.app_project_id, app_ids, settings.build_app_max_active):
+        raise _reject("Too many active builds for this app", settings.build_app_max_active, queue, queue.build_seconds)
+    admitted_total.inc(count)
+    return queue
@@ -0,0 +1,195 @@
+import textwrap
+
+
+# Shared by the builder, which writes these files, and preflight, which checks them without touching disk.
+def render_project(app_project, keystore, sdk_root, spec, heap_mb: int = 2048) -> dict[str, str]:
+    package_path = "app/src/main/java/" + app_project.package_name.replace(".", "/")
+    files: dict[str, str] = {}
+    manifest = textwrap.dedent(
+        f"""
+        <manifest xmlns:android="http://schemas.android.com/apk/res/android" package="{app_project.package_name}">
+            <uses-permission android:name="android.permission.INTERNET" />
+            <application
+                android:label="{app_project.name}"
+                android:allowBackup="true"
+                android:icon="@android:drawable/sym_def_app_icon"
+                android:supportsRtl="true">
+                <activity
+                    android:name=".MainActivity"
+                    android:exported="true"
+                    android:theme="@style/Theme.AppCompat.Light.NoActionBar">
+                    <intent-filter>
+                        <action android:name="android.intent.action.MAIN" />
+                        <category android:name="android.intent.category.LAUNCHER" />
+                    </intent-filter>
+                </activity>
+            </application>
+        </manifest>
+        """
+    ).strip()
+    files["app/src/main/AndroidManifest.xml"] = manifest
+
+    main_activity = textwrap.dedent(
+        f"""
+        package {app_project.package_name}
+
+        import android.os.Bundle
+        import android.webkit.WebView
+        import android.webkit.WebViewClient
+        import androidx.appcompat.app.AppCompatActivity
+
+        class MainActivity : AppCompatActivity() {{
+            override fun onCreate(savedInstanceState: Bundle?) {{
+                super.onCreate(savedInstanceState)
+                val webView = WebView(this)
+                webView.settings.javaScriptEnabled = true
+                webView.webViewClient = WebViewClient()
+                webView.loadUrl("{app_project.url}")
+                setContentView(webView)
+            }}
+        }}
+        """
+    ).strip()
+    files[f"{package_path}/MainActivity.kt"] = main_activity
+
+    strings = textwrap.dedent(
+        f"""
+        <resources>
+            <string name="app_name">{app_project.name}</string>
+        </resources>
+        """
+    ).strip()
+    files["app/src/main/res/values/strings.xml"] = strings
+
+    styles = textwrap.dedent(
+        """
+        <resources>
+            <style name="Theme.AppCompat.Light.NoActionBar" parent="Theme.AppCompat.Light.NoActionBar" />
+        </resources>
+        """
+    ).strip()
+    files["app/src/main/res/values/themes.xml"] = styles
+
+    colors = """<resources><color name=\"placeholder\">#6200EE</color></resources>"""
+    files["app/src/main/res/values/colors.xml"] = colors
+
+    settings_gradle = textwrap.dedent(
+        f"""
+        rootProject.name = "webview-{app_project.id}"
+        include(":app")
+        """
+    ).strip()
+    files["settings.gradle"] = settings_gradle
+
+    gradle_root = textwrap.dedent(
+        """
+        buildscript {
+            repositories {
+                google()
+                mavenCentral()
+            }
+            dependencies {
+                classpath 'com.android.tools.build:gradle:8.1.4'
+                classpath 'org.jetbrains.kotlin:kotlin-gradle-plugin:1.9.10'
+            }
+        }
+
+        allprojects {
+            repositories {
+                google()
+                mavenCentral()
+            }
+        }
+
+        task clean(type: Delete) {
+            delete rootProject.buildDir
+        }
+        """
+    ).strip()
+    files["build.gradle"] = gradle_root
+
+    minify = "true" if spec.minify else "false"
+    splits = ""
+    if spec.abi_splits:
+        abis = ", ".join(f"'{abi}'" for abi in spec.abi_splits)
+        splits = f"""
+            splits {{
+                abi {{
+                    enable true
+                    reset()
+                    include {abis}
+                    universalApk true
+                }}
+            }}"""
+    module_build = textwrap.dedent(
+        f"""
+        apply plugin: 'com.android.application'
+        apply plugin: 'org.jetbrains.kotlin.android'
+
+        android {{
+            namespace "{app_project.package_name}"
+            compileSdkVersion {app_project.target_sdk}
+
+            defaultConfig {{
+                applicationId "{app_project.package_name}"
+                minSdkVersion {app_project.min_sdk}
+                targetSdkVersion {app_project.target_sdk}
+                versionCode {app_project.version_code}
+                versionName "{app_project.version_name}"
+            }}
+
+            signingConfigs {{
+                release {{
+                    storeFile file('{keystore.keystore_path}')
+                    storePassword '{keystore.store_password}'
+                    keyAlias '{keystore.alias}'
+                    keyPassword '{keystore.key_password}'
+                }}
+            }}
+
+            buildTypes {{
+                debug {{
+                    signingConfig signingConfigs.release
+                    minifyEnabled {minify}
+                    shrinkResources {minify}
+                    proguardFiles getDefaultProguardFile('proguard-android-optimize.txt')
+                }}
+                release {{
+                    signingConfig signingConfigs.release
+                    minifyEnabled {minify}
+                    shrinkResources {minify}
+                    proguardFiles getDefaultProguardFile('proguard-android-optimize.txt')
+                }}
+            }}
+            {splits}
+        }}
+
+        dependencies {{
+            implementation 'androidx.core:core-ktx:1.12.0'
+            implementation 'androidx.appcompat:appcompat:1.6.1'
+            implementation 'androidx.activity:activity-ktx:1.8.2'
+            implementation 'androidx.webkit:webkit:1.9.0'
+        }}
+        """
+    ).strip()
+    files["app/build.gradle"] = module_build
+
+    # Kotlin compiles inside the Gradle daemon so the builder's heap and memory limits cover it.
+    gradle_props = textwrap.dedent(
+        f"""
+        android.useAndroidX=true
+        android.enableJetifier=true
+        kotlin.compiler.execution.strategy=in-process
+        org.gradle.jvmargs=-Xmx{heap_mb}m -XX:MaxMetaspaceSize=512m -Dfile.encoding=UTF-8
+        """
+    ).strip()
+    files["gradle.properties"] = gradle_props
+
+    local_props = textwrap.dedent(
+        f"""
+        sdk.dir={sdk_root}
+        """
+    ).strip()
+    files["local.properties"] = local_props
+
+    return files
@@ -0,0 +1,115 @@
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import bindparam, delete, func, insert, literal, select, text
+from sqlalchemy.orm import Session
+
+from . import models
+from .artifacts import protected_job_ids
+from .config import get_settings
+from .metrics import registry
+
+settings = get_settings()
+HOT = models.BuildJob.__table__
+ARCHIVE = models.BuildJobArchive.__table__
+COLUMNS = [column.name for column in HOT.columns]
+FINISHED_STATUSES = (models.BuildStatus.success.value, models.BuildStatus.failed.value)
+
+archived_total = registry.counter("build_jobs_archived_total", "Finished build jobs moved to build_jobs_archive")
+archive_batch_seconds = registry.histogram("build_jobs_archive_batch_seconds", "Time spent moving one batch of build jobs")
+hot_rows = registry.gauge("build_jobs_rows", "Rows in build_jobs after the last archival run")
+archive_rows = registry.gauge("build_jobs_archive_rows", "Rows in build_jobs_archive after the last archival run")
+
+
+def archive_batch(db: Session, cutoff: datetime, after_id: int, protected: set[int]) -> tuple[int, Optional[int]]:
+    # Walk the primary key in small batches; SKIP LOCKED keeps concurrent runs and builders off each other's rows.
+    candidates = [
+        job_id
+        for (job_id,) in db.query(models.BuildJob.id)
+        .filter(
+            models.BuildJob.id > after_id,
+            models.BuildJob.status.in_(FINISHED_STATUSES),
+            models.BuildJob.created_at < cutoff,
+        )
+        .order_by(models.BuildJob.id)
+        .limit(settings.archive_batch_size)
+        .with_for_update(skip_locked=True)
+    ]
+    if not candidates:
+        db.rollback()
+        return 0, None
+    ids = [job_id for job_id in candidates if job_id not in protected]
+    if ids:
+        db.execute(
+            insert(ARCHIVE).from_select(
+                COLUMNS + ["archived_at"],
+                select(*(HOT.c[name] for name in COLUMNS), literal(datetime.utcnow())).where(HOT.c.id.in_(ids)),
+            )
+        )
+        db.execute(delete(HOT).where(HOT.c.id.in_(ids)))
+    db.commit()
+    archived_total.inc(len(ids))
+    return len(ids), candidates[-1]
+
+
+def run(db: Session, now: Optional[datetime] = None, max_batches: Optional[int] = None) -> dict:
+    if settings.archive_after_days <= 0:
+        return {"archived": 0, "batches": 0}
+    cutoff = (now or datetime.utcnow()) - timedelta(days=settings.archive_after_days)
+    # Artifacts the retention policy keeps stay with hot rows, so retention never loses track of them.
+    protected = protected_job_ids(db)
+    db.rollback()
+    archived = batches = 0
+    after_id = 0
+    max_batches = settings.archive_max_batches if max_batches is None else max_batches
+    while not max_batches or batches < max_batches:
+        started = time.perf_counter()
+        moved, after_id = archive_batch(db, cutoff, after_id, protected)
+        if after_id is None:
+            break
+        archive_batch_seconds.observe(time.perf_counter() - started)
+        archived += moved
+        batches += 1
+        time.sleep(settings.archive_batch_pause_seconds)
+    sizes = table_sizes(db)
+    hot_rows.set(sizes["build_jobs"]["rows"])
+    archive_rows.set(sizes["build_jobs_archive"]["rows"])
+    return {"archived": archived, "batches": batches, "cutoff": cutoff.isoformat(), "tables": sizes}
+
+
+def table_sizes(db: Session) -> dict:
+    if db.get_bind().dialect.name == "mysql":
+        # information_schema row counts are estimates, but reading them does not scan either table.
+        rows = db.execute(
+            text(
+                "SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH + INDEX_LENGTH FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN :names"
+            ).bindparams(bindparam("names", expanding=True)),
+            {"names": [HOT.name, ARCHIVE.name]},
+        )
+        return {name: {"rows": int(count or 0), "bytes": int(size or 0)} for name, count, size in rows}
+    return {table.name: {"rows": db.execute(select(func.count()).select_from(table)).scalar(), "bytes": None} for table in (HOT, ARCHIVE)}
+
+
+def find_build(db: Session, build_id: int):
+    return db.get(models.BuildJob, build_id) or db.get(models.BuildJobArchive, build_id)
+
+
+def main(argv=None) -> int:
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Move finished build jobs older than ARCHIVE_AFTER_DAYS to build_jobs_archive.")
+    parser.add_argument("--max-batches", type=int, default=0, help="Stop after this many batches (default: until done)")
+    args = parser.parse_args(argv)
+    with SessionLocal() as db:
+        summary = run(db, max_batches=args.max_batches)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
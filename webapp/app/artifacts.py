@@ -0,0 +1,192 @@
+import fcntl
+import logging
+import os
+import shutil
+import tarfile
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import get_settings
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+ACCESS_MARKER = ".last_access"
+
+hot_bytes = registry.gauge("artifact_hot_bytes", "Bytes of build artifacts on the hot volume after the last retention pass")
+evicted_total = registry.counter("artifact_evictions_total", "Build artifact directories evicted from the hot volume")
+rehydrated_total = registry.counter("artifact_rehydrations_total", "Build artifact directories restored from the cold tier")
+
+
+class DirectoryColdStore:
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _archive(self, key: str) -> Path:
+        return self.root / f"{key}.tar.gz"
+
+    def has(self, key: str) -> bool:
+        return self._archive(key).exists()
+
+    def put(self, key: str, source: Path) -> None:
+        archive = self._archive(key)
+        archive.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = archive.with_name(f".{archive.name}.{uuid.uuid4().hex}.tmp")
+        with tarfile.open(tmp_path, "w:gz") as tar:
+            for item in sorted(source.rglob("*")):
+                if item.is_file() and item.name != ACCESS_MARKER:
+                    tar.add(item, arcname=str(item.relative_to(source)))
+        tmp_path.replace(archive)
+
+    def restore(self, key: str, destination: Path) -> None:
+        destination.mkdir(parents=True, exist_ok=True)
+        with tarfile.open(self._archive(key), "r:gz") as tar:
+            tar.extractall(destination, filter="data")
+
+
+def cold_store() -> Optional[DirectoryColdStore]:
+    if not settings.artifact_cold_dir:
+        return None
+    return DirectoryColdStore(settings.artifact_cold_dir)
+
+
+def _job_key(job_dir: Path) -> str:
+    return str(job_dir.relative_to(settings.artifact_dir))
+
+
+def touch(path: str) -> None:
+    marker = Path(path).parent / ACCESS_MARKER
+    try:
+        marker.touch()
+    except OSError:
+        pass
+
+
+@contextmanager
+def _locked(job_dir: Path):
+    # A lock file next to the job directory is shared by the webapp's restores and every builder's evictions.
+    lock_path = job_dir.parent / f".{job_dir.name}.lock"
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        yield
+
+
+def ensure_hot(path: str) -> bool:
+    job_dir = Path(path).parent
+    try:
+        key = _job_key(job_dir)
+    except ValueError:
+        if os.path.exists(path):
+            touch(path)
+            return True
+        return False
+    with _locked(job_dir):
+        if not os.path.exists(path):
+            store = cold_store()
+            if store is None or not store.has(key):
+                return False
+            store.restore(key, job_dir)
+            rehydrated_total.inc()
+            logger.info("Rehydrated %s from cold storage", key)
+        # Eviction leaves a directory alone for ARTIFACT_EVICT_GRACE_SECONDS after this.
+        touch(path)
+    return os.path.exists(path)
+
+
+@dataclass
+class HotEntry:
+    job_id: Optional[int]
+    path: Path
+    size: int
+    last_access: float
+
+
+def scan_hot() -> list[HotEntry]:
+    entries = []
+    root = Path(settings.artifact_dir)
+    if not root.exists():
+        return entries
+    for app_dir in root.iterdir():
+        if not app_dir.is_dir():
+            continue
+        for job_dir in app_dir.iterdir():
+            if not job_dir.is_dir():
+                continue
+            size, last_access = 0, job_dir.stat().st_mtime
+            for item in job_dir.rglob("*"):
+                if item.is_file():
+                    stat = item.stat()
+                    size += stat.st_size
+                    last_access = max(last_access, stat.st_mtime)
+            entries.append(HotEntry(int(job_dir.name) if job_dir.name.isdigit() else None, job_dir, size, last_access))
+    return entries
+
+
+def protected_job_ids(db: Session) -> set[int]:
+    ranked = (
+        db.query(
+            models.BuildJob.id.label("id"),
+            models.BuildJob.released.label("released"),
+            func.row_number()
+            .over(partition_by=models.BuildJob.app_project_id, order_by=models.BuildJob.created_at.desc())
+            .label("position"),
+        )
+        .filter(models.BuildJob.status == models.BuildStatus.success.value)
+        .subquery()
+    )
+    rows = db.query(ranked.c.id).filter((ranked.c.released.is_(True)) | (ranked.c.position <= settings.artifact_keep_last))
+    return {job_id for (job_id,) in rows}
+
+
+def evict(entry: HotEntry) -> bool:
+    with _locked(entry.path):
+        # A download may have started since the scan; skip the directory until its grace window has passed.
+        try:
+            last_access = (entry.path / ACCESS_MARKER).stat().st_mtime
+        except OSError:
+            last_access = entry.last_access
+        if time.time() - last_access < settings.artifact_evict_grace_seconds or not entry.path.exists():
+            return False
+        store = cold_store()
+        if store is not None:
+            store.put(_job_key(entry.path), entry.path)
+        shutil.rmtree(entry.path, ignore_errors=True)
+    evicted_total.inc()
+    return True
+
+
+def enforce_retention(db: Session, now: Optional[float] = None) -> dict:
+    now = now or time.time()
+    entries = scan_hot()
+    protected = protected_job_ids(db)
+    candidates = sorted((e for e in entries if e.job_id not in protected), key=lambda e: e.last_access)
+    total = sum(e.size for e in entries)
+    evicted = []
+    if settings.artifact_max_age_days:
+        cutoff = now - settings.artifact_max_age_days * 86400
+        for entry in [e for e in candidates if e.last_access < cutoff]:
+            if evict(entry):
+                evicted.append(entry)
+                total -= entry.size
+        candidates = [e for e in candidates if e.last_access >= cutoff]
+    if settings.artifact_hot_budget_bytes:
+        for entry in candidates:
+            if total <= settings.artifact_hot_budget_bytes:
+                break
+            if evict(entry):
+                evicted.append(entry)
+                total -= entry.size
+        if total > settings.artifact_hot_budget_bytes:
+            logger.warning("Protected and recently used artifacts use %d bytes, above the %d byte budget", total, settings.artifact_hot_budget_bytes)
+    hot_bytes.set(total)
+    return {"scanned": len(entries), "evicted": len(evicted), "evicted_bytes": sum(e.size for e in evicted), "hot_bytes": total}
@@ -4,27 +4,18 @@ from typing import Optional
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 from . import models
 from .config import get_settings
 from .database import get_db
 from .dependencies import get_token
+from .hashing import get_password_hash, verify_password  # noqa: F401
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 settings = get_settings()
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=settings.access_token_expire_minutes))
@@ -33,14 +24,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(get_token)) -> models.User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    if token is None:
-        token = oauth2_scheme
+def user_from_token(db: Session, token) -> Optional[models.User]:
     try:
         if callable(token):
             token_value = token()
@@ -48,11 +32,22 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(get_tok
             token_value = token
         payload = jwt.decode(token_value, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
         user_id: int = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
     except Exception:
-        raise credentials_exception
-    user = db.get(models.User, user_id)
+        return None
+    if user_id is None:
+        return None
+    return db.get(models.User, user_id)
+
+
+def get_current_user(db: Session = Depends(get_db), token: str = Depends(get_token)) -> models.User:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    if token is None:
+        token = oauth2_scheme
+    user = user_from_token(db, token)
     if user is None:
         raise credentials_exception
     return user
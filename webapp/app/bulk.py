@@ -0,0 +1,52 @@
+import csv
+import json
+from typing import AsyncIterator, Optional
+
+from fastapi import Request
+
+from . import schemas
+
+
+async def iter_lines(request: Request) -> AsyncIterator[str]:
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8").rstrip("\r")
+
+
+async def iter_records(request: Request) -> AsyncIterator[tuple[int, Optional[dict], Optional[str]]]:
+    is_csv = "csv" in request.headers.get("content-type", "")
+    header: Optional[list[str]] = None
+    line_number = 0
+    async for line in iter_lines(request):
+        line_number += 1
+        if not line.strip():
+            continue
+        if is_csv:
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [value.strip() for value in values]
+                continue
+            if len(values) != len(header):
+                yield line_number, None, f"Expected {len(header)} columns, got {len(values)}"
+                continue
+            yield line_number, {key: value for key, value in zip(header, values) if value != ""}, None
+        else:
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield line_number, None, f"Invalid JSON: {exc}"
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, "Expected a JSON object"
+                continue
+            yield line_number, record, None
+
+
+def batch_result(results: list[schemas.BatchItemResult]) -> schemas.BatchResult:
+    failed = sum(1 for result in results if result.status == "error")
+    return schemas.BatchResult(succeeded=len(results) - failed, failed=failed, results=results)
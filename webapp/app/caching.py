@@ -0,0 +1,109 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+from .config import get_settings
+from .metrics import registry
+from .serialization import dumps
+
+settings = get_settings()
+
+not_modified_total = registry.counter("http_not_modified_total", "Conditional GETs answered with 304")
+cache_hits_total = registry.counter("response_cache_hits_total", "Responses served from the per-user response cache")
+cache_misses_total = registry.counter("response_cache_misses_total", "Cacheable responses that had to be serialized")
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple[str, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, etag: str) -> Optional[bytes]:
+        if not self.max_entries:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: tuple, etag: str, body: bytes) -> None:
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+
+response_cache = ResponseCache(settings.response_cache_entries)
+
+
+def make_etag(*parts) -> str:
+    return 'W/"' + hashlib.sha1(repr(parts).encode()).hexdigest()[:20] + '"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    opaque = etag[2:]
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+class Conditional:
+    def __init__(self, request: Request, user_id: int, etag: str, last_modified: Optional[datetime]):
+        self.request = request
+        self.etag = etag
+        self.last_modified = last_modified.replace(microsecond=0) if last_modified else None
+        self.key = (user_id, request.url.path, request.url.query)
+
+    @property
+    def headers(self) -> dict:
+        headers = {"ETag": self.etag, "Cache-Control": "private, no-cache"}
+        if self.last_modified:
+            headers["Last-Modified"] = format_datetime(self.last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+        return headers
+
+    def _not_modified(self) -> bool:
+        if_none_match = self.request.headers.get("if-none-match")
+        if if_none_match is not None:
+            return _etag_matches(if_none_match, self.etag)
+        if_modified_since = self.request.headers.get("if-modified-since")
+        if if_modified_since and self.last_modified:
+            try:
+                since = parsedate_to_datetime(if_modified_since).replace(tzinfo=None)
+            except (TypeError, ValueError):
+                return False
+            return self.last_modified <= since
+        return False
+
+    def cached_response(self) -> Optional[Response]:
+        if self._not_modified():
+            not_modified_total.inc()
+            return Response(status_code=304, headers=self.headers)
+        body = response_cache.get(self.key, self.etag)
+        if body is not None:
+            cache_hits_total.inc()
+            return Response(content=body, media_type="application/json", headers=self.headers)
+        return None
+
+    def respond(self, content) -> Response:
+        cache_misses_total.inc()
+        body = dumps(content)
+        response_cache.put(self.key, self.etag, body)
+        return Response(content=body, media_type="application/json", headers=self.headers)
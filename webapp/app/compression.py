@@ -0,0 +1,83 @@
+import gzip
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .config import get_settings
+from .metrics import registry
+
+try:
+    import brotli
+except ImportError:  # Without brotli, clients that also accept gzip still get compressed bodies.
+    brotli = None
+
+settings = get_settings()
+COMPRESSIBLE_TYPES = ("application/json", "text/html", "text/plain", "text/css", "application/javascript", "image/svg+xml")
+
+compressed_total = registry.counter("http_compressed_responses_total", "Responses sent with a gzip or br content-encoding")
+compression_saved_bytes = registry.counter("http_compression_saved_bytes_total", "Bytes saved by response compression")
+
+
+def supported_codings() -> tuple[str, ...]:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    # Highest q-value wins; on a tie br is preferred, it is smaller than gzip at a similar CPU cost.
+    best, best_weight = None, 0.0
+    for coding in supported_codings():
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=settings.compression_brotli_quality)
+    return gzip.compress(body, compresslevel=settings.compression_gzip_level, mtime=0)
+
+
+def compressible(response: Response) -> bool:
+    if response.status_code < 200 or response.status_code in (204, 206, 304) or "content-encoding" in response.headers:
+        return False
+    # Streams (server-sent events, file downloads) carry no length up front and are left alone.
+    length = response.headers.get("content-length")
+    media_type = response.headers.get("content-type", "").split(";")[0].strip()
+    return length is not None and int(length) >= settings.compression_min_bytes and media_type in COMPRESSIBLE_TYPES
+
+
+async def compress_response(request: Request, response: Response) -> Response:
+    if not settings.compression_min_bytes or not compressible(response):
+        return response
+    coding = negotiate(request.headers.get("accept-encoding", ""))
+    vary = response.headers.get("vary")
+    if "accept-encoding" not in (vary or "").lower():
+        response.headers["Vary"] = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+    if coding is None:
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    data = compress(body, coding)
+    compressed = Response(content=data, status_code=response.status_code, background=response.background)
+    compressed.raw_headers = [(name, value) for name, value in response.raw_headers if name != b"content-length"]
+    compressed.raw_headers.append((b"content-length", str(len(data)).encode()))
+    compressed.headers["Content-Encoding"] = coding
+    compressed_total.inc()
+    compression_saved_bytes.inc(len(body) - len(data))
+    return compressed
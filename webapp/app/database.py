@@ -1,10 +1,12 @@
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from .config import get_settings
+from . import querycount
+from .pooling import create_pooled_engine
 
 
 settings = get_settings()
-engine = create_engine(settings.database_url, pool_pre_ping=True, future=True)
+engine = create_pooled_engine(settings.database_url, settings.db_pool_size, settings.db_max_overflow, settings.db_pool_timeout)
+querycount.install(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
 Base = declarative_base()
 
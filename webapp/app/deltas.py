@@ -0,0 +1,151 @@
+import hashlib
+import io
+import os
+import struct
+import threading
+import zipfile
+from pathlib import Path
+from typing import Iterator, Optional
+
+MAGIC = b"WVDELTA1"
+_HEADER = struct.Struct(">32s32sQ")
+_COPY = struct.Struct(">QQ")
+_LENGTH = struct.Struct(">Q")
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+
+
+class DeltaError(ValueError):
+    pass
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def artifact_sha256(path: str) -> str:
+    sidecar = Path(path + ".sha256")
+    if sidecar.exists() and sidecar.stat().st_mtime >= os.stat(path).st_mtime:
+        return sidecar.read_text().strip()
+    value = sha256_file(path)
+    _write_atomic(sidecar, value.encode())
+    return value
+
+
+def delta_path_for(target_path: str, base_build_id: int) -> Path:
+    target = Path(target_path)
+    return target.parent / "deltas" / f"from-{base_build_id}-{target.name}.delta"
+
+
+def _entry_segments(data: bytes) -> list[tuple[int, int]]:
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            infos = sorted(zf.infolist(), key=lambda info: info.header_offset)
+    except zipfile.BadZipFile:
+        return []
+    segments = []
+    for info in infos:
+        start = info.header_offset
+        (signature, _, flags, _, _, _, _, _, _, name_length, extra_length) = _LOCAL_HEADER.unpack_from(data, start)
+        if signature != b"PK\x03\x04":
+            return []
+        end = start + _LOCAL_HEADER.size + name_length + extra_length + info.compress_size
+        if flags & 0x08:
+            end += 16 if data[end:end + 4] == _DATA_DESCRIPTOR_SIGNATURE else 12
+        segments.append((start, end))
+    return segments
+
+
+def _ops(old: bytes, new: bytes) -> Iterator[tuple[str, int, int]]:
+    old_entries = {}
+    for start, end in _entry_segments(old):
+        old_entries.setdefault(hashlib.sha1(old[start:end]).digest(), (start, end - start))
+    cursor = 0
+    for start, end in _entry_segments(new):
+        if start < cursor:
+            continue
+        if start > cursor:
+            yield "I", cursor, start - cursor
+        match = old_entries.get(hashlib.sha1(new[start:end]).digest())
+        if match and old[match[0]:match[0] + match[1]] == new[start:end]:
+            yield "C", match[0], match[1]
+        else:
+            yield "I", start, end - start
+        cursor = end
+    if cursor < len(new):
+        yield "I", cursor, len(new) - cursor
+
+
+def _merged_ops(old: bytes, new: bytes) -> list[tuple[str, int, int]]:
+    merged: list[tuple[str, int, int]] = []
+    for op, offset, length in _ops(old, new):
+        if merged and merged[-1][0] == op and merged[-1][1] + merged[-1][2] == offset:
+            merged[-1] = (op, merged[-1][1], merged[-1][2] + length)
+        else:
+            merged.append((op, offset, length))
+    return merged
+
+
+def build_delta(old_path: str, new_path: str) -> bytes:
+    old = Path(old_path).read_bytes()
+    new = Path(new_path).read_bytes()
+    parts = [MAGIC, _HEADER.pack(hashlib.sha256(old).digest(), hashlib.sha256(new).digest(), len(new))]
+    for op, offset, length in _merged_ops(old, new):
+        if op == "C":
+            parts.append(b"C" + _COPY.pack(offset, length))
+        else:
+            parts.append(b"I" + _LENGTH.pack(length) + new[offset:offset + length])
+    parts.append(b"E")
+    return b"".join(parts)
+
+
+def apply_delta(old_path: str, delta: bytes) -> bytes:
+    if not delta.startswith(MAGIC):
+        raise DeltaError("Not a delta file")
+    old = Path(old_path).read_bytes()
+    pos = len(MAGIC)
+    old_sha, new_sha, new_size = _HEADER.unpack_from(delta, pos)
+    pos += _HEADER.size
+    if hashlib.sha256(old).digest() != old_sha:
+        raise DeltaError("Base artifact does not match the delta")
+    out = bytearray()
+    while True:
+        op = delta[pos:pos + 1]
+        pos += 1
+        if op == b"C":
+            offset, length = _COPY.unpack_from(delta, pos)
+            pos += _COPY.size
+            out += old[offset:offset + length]
+        elif op == b"I":
+            (length,) = _LENGTH.unpack_from(delta, pos)
+            pos += _LENGTH.size
+            out += delta[pos:pos + length]
+            pos += length
+        elif op == b"E":
+            break
+        else:
+            raise DeltaError("Corrupt delta")
+    if len(out) != new_size or hashlib.sha256(out).digest() != new_sha:
+        raise DeltaError("Reconstructed artifact failed verification")
+    return bytes(out)
+
+
+def _write_atomic(path: Path, content: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(content)
+    tmp_path.replace(path)
+
+
+def ensure_delta(base_path: str, base_build_id: int, target_path: str) -> Optional[Path]:
+    delta_path = delta_path_for(target_path, base_build_id)
+    if delta_path.exists():
+        return delta_path
+    if not (os.path.exists(base_path) and os.path.exists(target_path)):
+        return None
+    _write_atomic(delta_path, build_delta(base_path, target_path))
+    return delta_path
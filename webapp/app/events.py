@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .config import get_settings
+from .database import SessionLocal
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+TERMINAL_STATUSES = {models.BuildStatus.success.value, models.BuildStatus.failed.value}
+
+subscribers_gauge = registry.gauge("build_event_subscribers", "Open build event streams (SSE and WebSocket)")
+polls_total = registry.counter("build_event_polls_total", "Shared build status polls issued by the event broker")
+events_total = registry.counter("build_events_published_total", "Build status events fanned out to subscribers")
+
+
+def build_event(build: models.BuildJob, owner_user_id: int) -> dict:
+    return {
+        "id": build.id,
+        "app_project_id": build.app_project_id,
+        "owner_user_id": owner_user_id,
+        "status": build.status,
+        "stage": build.stage,
+        "updated_at": build.updated_at.isoformat() if build.updated_at else None,
+        "finished_at": build.finished_at.isoformat() if build.finished_at else None,
+    }
+
+
+class BuildEventBroker:
+    def __init__(self, poll_seconds: float):
+        self.poll_seconds = poll_seconds
+        self._by_build: dict[int, set[asyncio.Queue]] = {}
+        self._by_user: dict[Optional[int], set[asyncio.Queue]] = {}
+        self._published: dict[int, tuple] = {}
+        self._last_seen: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def _subscribe(self, channels: dict, key) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=100)
+        channels.setdefault(key, set()).add(queue)
+        subscribers_gauge.inc()
+        self._wakeup.set()
+        return queue
+
+    def _unsubscribe(self, channels: dict, key, queue: asyncio.Queue) -> None:
+        queues = channels.get(key)
+        if queues and queue in queues:
+            queues.discard(queue)
+            subscribers_gauge.dec()
+            if not queues:
+                del channels[key]
+
+    def subscribe_build(self, build_id: int) -> asyncio.Queue:
+        return self._subscribe(self._by_build, build_id)
+
+    def unsubscribe_build(self, build_id: int, queue: asyncio.Queue) -> None:
+        self._unsubscribe(self._by_build, build_id, queue)
+
+    def subscribe_user(self, user_id: Optional[int]) -> asyncio.Queue:
+        # user_id None receives every build (admins).
+        return self._subscribe(self._by_user, user_id)
+
+    def unsubscribe_user(self, user_id: Optional[int], queue: asyncio.Queue) -> None:
+        self._unsubscribe(self._by_user, user_id, queue)
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._by_build or self._by_user)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            if not self.has_subscribers:
+                self._last_seen = None
+                self._published.clear()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            try:
+                rows = await run_in_threadpool(self._poll)
+            except Exception:  # noqa: BLE001
+                logger.exception("Build event poll failed")
+                rows = []
+            for event in rows:
+                self._publish(event)
+            await asyncio.sleep(self.poll_seconds)
+
+    def _poll(self) -> list[dict]:
+        polls_total.inc()
+        if self._last_seen is None:
+            # Look back a little so transitions racing a new subscriber's initial snapshot are not lost.
+            self._last_seen = datetime.utcnow() - timedelta(seconds=max(5.0, self.poll_seconds * 2))
+        with SessionLocal() as db:
+            rows = (
+                db.query(models.BuildJob, models.AppProject.owner_user_id)
+                .join(models.AppProject, models.BuildJob.app_project_id == models.AppProject.id)
+                .filter(models.BuildJob.updated_at >= self._last_seen)
+                .order_by(models.BuildJob.updated_at.asc())
+                .all()
+            )
+            events = [build_event(build, owner_user_id) for build, owner_user_id in rows]
+        if rows:
+            self._last_seen = rows[-1][0].updated_at
+        self._published = {
+            build_id: snapshot for build_id, snapshot in self._published.items() if snapshot[0] >= self._last_seen
+        }
+        return events
+
+    def _publish(self, event: dict) -> None:
+        snapshot = (datetime.fromisoformat(event["updated_at"]), event["status"], event["stage"])
+        if self._published.get(event["id"]) == snapshot:
+            return
+        self._published[event["id"]] = snapshot
+        queues = (
+            self._by_build.get(event["id"], set())
+            | self._by_user.get(event["owner_user_id"], set())
+            | self._by_user.get(None, set())
+        )
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+                events_total.inc()
+            except asyncio.QueueFull:
+                logger.warning("Dropping build event for slow subscriber")
+
+
+broker = BuildEventBroker(settings.build_events_poll_seconds)
@@ -0,0 +1,115 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from .config import get_settings
+from .metrics import registry
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+settings = get_settings()
+
+hash_latency = registry.histogram("password_hash_seconds", "Wall time of password hash/verify calls, including queue wait")
+hash_inflight = registry.gauge("password_hash_inflight", "Password hash/verify calls admitted to the pool")
+hash_queue_depth = registry.gauge("password_hash_queue_depth", "Admitted password hash/verify calls waiting for a worker")
+hash_rejected = registry.counter("password_hash_rejected_total", "Password hash/verify calls rejected because the pool was saturated")
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+class PasswordHashPool:
+    def __init__(self, workers: int, queue_limit: int, timeout_seconds: float):
+        self.workers = workers
+        self.timeout_seconds = timeout_seconds
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._inflight = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _track(self, delta: int) -> None:
+        with self._lock:
+            self._inflight += delta
+            hash_inflight.set(self._inflight)
+            hash_queue_depth.set(max(0, self._inflight - self.workers))
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            hash_rejected.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication is busy, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        self._track(1)
+        start = time.perf_counter()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        # The slot stays taken until the work is really done, so timed-out calls still count against the bound.
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout_seconds)
+        except FutureTimeoutError:
+            future.cancel()
+            hash_rejected.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication timed out, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        except BrokenProcessPool:
+            self.shutdown()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication is restarting, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        finally:
+            hash_latency.observe(time.perf_counter() - start)
+
+    def _release(self, future=None) -> None:
+        self._track(-1)
+        self._slots.release()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+hash_pool = PasswordHashPool(
+    workers=settings.password_hash_workers,
+    queue_limit=settings.password_hash_queue_limit,
+    timeout_seconds=settings.password_hash_timeout_seconds,
+)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return hash_pool.run(_verify, plain_password, hashed_password)
+
+
+def get_password_hash(password: str) -> str:
+    return hash_pool.run(_hash, password)
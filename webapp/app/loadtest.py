@@ -0,0 +1,291 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+OPERATIONS = ("login", "dashboard", "list_apps", "get_build", "create_build", "download")
+DEFAULT_MIX = "login=5,dashboard=10,list_apps=25,get_build=40,create_build=5,download=15"
+PASSWORD = "loadtest-password"
+
+
+def prepare_environment(workdir: str) -> None:
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/loadtest.sqlite")
+    os.environ.setdefault("ARTIFACT_DIR", f"{workdir}/artifacts")
+    os.environ.setdefault("KEYSTORE_DIR", f"{workdir}/keystores")
+    os.environ.setdefault("ICON_DIR", f"{workdir}/icons")
+    os.environ.setdefault("TEMPLATE_CACHE_DIR", f"{workdir}/jinja-cache")
+    os.environ.setdefault("AUTH_RATE_LIMIT", "1000000000")
+
+
+def seed_database(args) -> dict:
+    from sqlalchemy import func, select, update
+
+    from . import models, queryplans
+    from .database import Base, engine
+    from .hashing import _hash
+
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        first_user = conn.execute(select(func.coalesce(func.max(models.User.id), 0))).scalar_one() + 1
+        queryplans.seed(conn, args.users, args.apps_per_user, args.builds_per_app)
+        artifact = Path(os.environ["ARTIFACT_DIR"]) / "loadtest" / "app.apk"
+        artifact.parent.mkdir(parents=True, exist_ok=True)
+        artifact.write_bytes(random.Random(args.seed).randbytes(args.artifact_bytes))
+        # Preflight only reads the keystore header, so a PKCS#12-looking stub is enough to enqueue builds.
+        keystore = Path(os.environ["KEYSTORE_DIR"]) / "loadtest.keystore"
+        keystore.parent.mkdir(parents=True, exist_ok=True)
+        keystore.write_bytes(b"\x30" + random.Random(args.seed).randbytes(1024))
+        conn.execute(update(models.User.__table__).where(models.User.id >= first_user).values(password_hash=_hash(PASSWORD)))
+        seeded_apps = select(models.AppProject.id).where(models.AppProject.owner_user_id >= first_user)
+        conn.execute(
+            update(models.Keystore.__table__)
+            .where(models.Keystore.app_project_id.in_(seeded_apps))
+            .values(keystore_path=str(keystore))
+        )
+        conn.execute(
+            update(models.BuildJob.__table__)
+            .where(
+                models.BuildJob.status == models.BuildStatus.success.value,
+                models.BuildJob.app_project_id.in_(seeded_apps),
+            )
+            .values(apk_path=str(artifact), aab_path=str(artifact))
+        )
+        conn.commit()
+        users = conn.execute(
+            select(models.User.id, models.User.email).where(models.User.id >= first_user)
+        ).all()
+        apps = conn.execute(
+            select(models.AppProject.id, models.AppProject.owner_user_id).where(
+                models.AppProject.owner_user_id >= first_user
+            )
+        ).all()
+        builds = conn.execute(
+            select(models.BuildJob.id, models.BuildJob.app_project_id, models.BuildJob.status)
+            .join(models.AppProject, models.AppProject.id == models.BuildJob.app_project_id)
+            .where(models.AppProject.owner_user_id >= first_user)
+        ).all()
+    app_owner = {app_id: owner for app_id, owner in apps}
+    fixtures = {user_id: {"email": email, "apps": [], "builds": [], "artifacts": []} for user_id, email in users}
+    for app_id, owner in apps:
+        fixtures[owner]["apps"].append(app_id)
+    for build_id, app_id, status in builds:
+        fixtures[app_owner[app_id]]["builds"].append(build_id)
+        if status == "success":
+            fixtures[app_owner[app_id]]["artifacts"].append(build_id)
+    return fixtures
+
+
+class Server:
+    def __init__(self):
+        import uvicorn
+
+        from .main import app
+
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> int:
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self.server.servers[0].sockets[0].getsockname()[1]
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join()
+        return False
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[tuple[float, int, int]]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float, status: int, queries: int) -> None:
+        with self._lock:
+            self.samples[name].append((seconds, status, queries))
+
+
+class VirtualUser:
+    def __init__(self, port: int, fixture: dict, recorder: Recorder, rng: random.Random):
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        self.fixture = fixture
+        self.recorder = recorder
+        self.rng = rng
+        self.token = None
+
+    def call(self, name: str, method: str, path: str, body: bytes = None, headers: dict = None) -> tuple[int, bytes]:
+        headers = dict(headers or {})
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        started = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.recorder.add(name, time.perf_counter() - started, 0, 0)
+            return 0, b""
+        self.recorder.add(name, time.perf_counter() - started, response.status, int(response.getheader("X-DB-Query-Count", "0")))
+        return response.status, payload
+
+    def login(self) -> None:
+        body = urllib.parse.urlencode({"username": self.fixture["email"], "password": PASSWORD}).encode()
+        status, payload = self.call("login", "POST", "/auth/login", body, {"Content-Type": "application/x-www-form-urlencoded"})
+        if status == 200:
+            self.token = json.loads(payload)["access_token"]
+
+    def dashboard(self) -> None:
+        self.call("dashboard", "GET", "/dashboard")
+
+    def list_apps(self) -> None:
+        self.call("list_apps", "GET", "/apps")
+
+    def get_build(self) -> None:
+        if self.fixture["builds"]:
+            self.call("get_build", "GET", f"/builds/{self.rng.choice(self.fixture['builds'])}")
+
+    def create_build(self) -> None:
+        if not self.fixture["apps"]:
+            return
+        status, payload = self.call("create_build", "POST", f"/apps/{self.rng.choice(self.fixture['apps'])}/build")
+        if status == 200:
+            self.fixture["builds"].append(json.loads(payload)["id"])
+
+    def download(self) -> None:
+        if self.fixture["artifacts"]:
+            self.call("download", "GET", f"/builds/{self.rng.choice(self.fixture['artifacts'])}/download/apk")
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def run_user(port: int, fixture: dict, recorder: Recorder, mix: dict[str, float], requests: int, seed: int) -> None:
+    rng = random.Random(seed)
+    user = VirtualUser(port, fixture, recorder, rng)
+    user.login()
+    names, weights = list(mix), list(mix.values())
+    for _ in range(requests):
+        getattr(user, rng.choices(names, weights)[0])()
+    user.conn.close()
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for name, samples in sorted(recorder.samples.items()):
+        latencies = [seconds * 1000 for seconds, _, _ in samples]
+        errors = sum(1 for _, status, _ in samples if status == 0 or status >= 400)
+        endpoints[name] = {
+            "requests": len(samples),
+            "rps": round(len(samples) / elapsed, 1),
+            "error_rate": round(errors / len(samples), 4),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "queries_mean": round(sum(queries for _, _, queries in samples) / len(samples), 2),
+        }
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return {"elapsed_seconds": round(elapsed, 2), "requests": total, "rps": round(total / elapsed, 1), "endpoints": endpoints}
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    if report["rps"] * tolerance < baseline["rps"]:
+        regressions.append(f"throughput {report['rps']} rps vs baseline {baseline['rps']} rps")
+    for name, base in baseline["endpoints"].items():
+        current = report["endpoints"].get(name)
+        if current is None:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * tolerance and current["p95_ms"] - base["p95_ms"] > 5:
+            regressions.append(f"{name}: p95 {current['p95_ms']} ms vs baseline {base['p95_ms']} ms")
+        if current["queries_mean"] > base["queries_mean"] + 0.5:
+            regressions.append(f"{name}: {current['queries_mean']} queries/request vs baseline {base['queries_mean']}")
+        if current["error_rate"] > base["error_rate"] + 0.01:
+            regressions.append(f"{name}: error rate {current['error_rate']} vs baseline {base['error_rate']}")
+    return regressions
+
+
+def print_report(report: dict) -> None:
+    print(f"{'endpoint':<14}{'requests':>10}{'rps':>9}{'errors':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}")
+    for name, endpoint in report["endpoints"].items():
+        print(
+            f"{name:<14}{endpoint['requests']:>10}{endpoint['rps']:>9}{endpoint['error_rate']:>9.2%}"
+            f"{endpoint['p50_ms']:>10}{endpoint['p95_ms']:>10}{endpoint['p99_ms']:>10}{endpoint['queries_mean']:>9}"
+        )
+    print(f"total: {report['requests']} requests in {report['elapsed_seconds']}s ({report['rps']} rps)")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Seed a local database, boot the webapp and drive a reproducible request mix against it.")
+    parser.add_argument("--users", type=int, default=50, help="Synthetic users to seed")
+    parser.add_argument("--apps-per-user", type=int, default=5)
+    parser.add_argument("--builds-per-app", type=int, default=20)
+    parser.add_argument("--artifact-bytes", type=int, default=256 * 1024)
+    parser.add_argument("--concurrency", type=int, default=8, help="Virtual users running at the same time")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per virtual user after logging in")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", default=None, help="Directory for the default SQLite database and artifacts")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--baseline", help="Compare against this JSON report and exit non-zero on regressions")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed latency/throughput factor versus the baseline")
+    args = parser.parse_args(argv)
+
+    prepare_environment(args.workdir or tempfile.mkdtemp(prefix="webapp-loadtest-"))
+    fixtures = seed_database(args)
+    users = list(fixtures.values())
+    recorder = Recorder()
+    with Server() as port:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [
+                pool.submit(run_user, port, users[i % len(users)], recorder, args.mix, args.requests, args.seed + i)
+                for i in range(args.concurrency)
+            ]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+    report = summarize(recorder, elapsed)
+    report["parameters"] = {
+        key: getattr(args, key) for key in ("users", "apps_per_user", "builds_per_app", "concurrency", "requests", "seed")
+    }
+    report["database"] = os.environ["DATABASE_URL"].split(":", 1)[0]
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline.get("parameters") != report["parameters"]:
+            print(f"warning: baseline was recorded with {baseline.get('parameters')}", file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,91 @@
-import os
+import logging
+import time
 from fastapi import FastAPI, Depends, Request
-from fastapi.responses import RedirectResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 
-from .database import engine, Base
+from . import IMPORT_STARTED, compression, profiling, querycount
 from .auth import get_current_user
-from .routers import auth_routes, app_routes, keystore_routes, admin_routes, build_routes
+from .config import get_settings
+from .events import broker
+from .hashing import hash_pool
+from .metrics import registry
+from .routers import auth_routes, app_routes, keystore_routes, admin_routes, build_routes, signed_routes, webhook_routes
+from .serialization import FastJSONResponse
+from .templating import precompile, templates
 
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+import_seconds = registry.gauge("app_import_seconds", "Time to import the application module")
+startup_seconds = registry.gauge("app_startup_seconds", "Time spent in startup hooks, including template warm-up")
+
+app = FastAPI(title="WebView App Generator", default_response_class=FastJSONResponse)
+app.router.route_class = profiling.ProfiledRoute
+settings = get_settings()
+
+
+@app.middleware("http")
+async def compress_responses(request: Request, call_next):
+    return await compression.compress_response(request, await call_next(request))
+
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    trigger = await profiling.trigger_for(request)
+    if trigger is None:
+        return await call_next(request)
+    with profiling.RequestProfile(request, trigger) as profile:
+        response = await call_next(request)
+    profile.status_code = response.status_code
+    if profile.worth_keeping():
+        await run_in_threadpool(profiling.save, profile.to_dict())
+        response.headers["X-Profile-Id"] = profile.id
+    return response
+
+
+@app.middleware("http")
+async def count_queries(request: Request, call_next):
+    with querycount.track_queries() as stats:
+        response = await call_next(request)
+    querycount.queries_per_request.observe(stats.count)
+    querycount.db_seconds_per_request.observe(stats.seconds)
+    response.headers["X-DB-Query-Count"] = str(stats.count)
+    response.headers["X-DB-Time-Ms"] = f"{stats.seconds * 1000:.1f}"
+    querycount.check_budget(stats, settings.db_query_budget, settings.db_query_budget_strict, f"{request.method} {request.url.path}")
+    return response
 
-app = FastAPI(title="WebView App Generator")
 
 app.include_router(auth_routes.router)
 app.include_router(app_routes.router)
 app.include_router(keystore_routes.router)
 app.include_router(admin_routes.router)
 app.include_router(build_routes.router)
+app.include_router(signed_routes.router)
+app.include_router(webhook_routes.router)
 
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
-templates = Jinja2Templates(directory="app/templates")
+
+import_seconds.set(time.perf_counter() - IMPORT_STARTED)
+
+
+@app.on_event("startup")
+async def report_startup():
+    started = time.perf_counter()
+    precompile()
+    broker.start()
+    startup_seconds.set(time.perf_counter() - started)
+    logger.info("Imported in %.3fs, started in %.3fs", import_seconds.value, startup_seconds.value)
+
+
+@app.on_event("shutdown")
+async def shutdown_background_workers():
+    await broker.stop()
+    hash_pool.shutdown()
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(registry.render())
 
 
 @app.get("/")
@@ -3,16 +3,26 @@ from datetime import datetime
 from sqlalchemy import (
     Column,
     Integer,
+    BigInteger,
     String,
+    Date,
     DateTime,
+    Float,
     ForeignKey,
     Boolean,
     Text,
+    Index,
+    JSON,
+    Table,
+    literal_column,
 )
 from sqlalchemy.orm import relationship
 
 from .database import Base
 
+# Bumped by every UPDATE, including bulk ones, so ETags change even when updated_at (whole seconds on MySQL) does not.
+ROW_VERSION = literal_column("version") + 1
+
 
 class UserRole(str, enum.Enum):
     admin = "admin"
@@ -49,7 +59,7 @@ class AppProject(Base):
     __tablename__ = "app_projects"
 
     id = Column(Integer, primary_key=True)
-    owner_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    owner_user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     name = Column(String(255), nullable=False)
     package_name = Column(String(255), unique=True, nullable=False)
     url = Column(String(1024), nullable=False)
@@ -60,6 +70,7 @@ class AppProject(Base):
     icon_path = Column(String(1024), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=0, server_default="0", onupdate=ROW_VERSION)
 
     owner = relationship("User", back_populates="app_projects")
     keystore = relationship("Keystore", back_populates="app_project", uselist=False)
@@ -84,27 +95,61 @@ class Keystore(Base):
 
 class BuildJob(Base):
     __tablename__ = "build_jobs"
+    __table_args__ = (
+        Index("ix_build_jobs_status_created_at", "status", "created_at"),
+        Index("ix_build_jobs_app_project_id_created_at", "app_project_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     app_project_id = Column(Integer, ForeignKey("app_projects.id"), nullable=False)
     status = Column(String(20), nullable=False, default=BuildStatus.pending.value)
+    stage = Column(String(50), nullable=True)
     log = Column(Text, nullable=True)
     apk_path = Column(String(1024), nullable=True)
     aab_path = Column(String(1024), nullable=True)
+    released = Column(Boolean, nullable=False, default=False)
+    outputs = Column(String(10), nullable=False, default="both")
+    variant = Column(String(10), nullable=False, default="release")
+    minify = Column(Boolean, nullable=False, default=False)
+    abi_splits = Column(JSON, nullable=True)
+    builder_node = Column(String(100), nullable=True)
+    traceparent = Column(String(55), nullable=True)
+    trace_spans = Column(JSON, nullable=True)
+    validation = Column(JSON, nullable=True)
+    heap_mb = Column(Integer, nullable=True)
+    max_workers = Column(Integer, nullable=True)
+    peak_rss_bytes = Column(BigInteger, nullable=True)
+    cpu_seconds = Column(Float, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    version = Column(Integer, nullable=False, default=0, server_default="0", onupdate=ROW_VERSION)
+    started_at = Column(DateTime, nullable=True)
     finished_at = Column(DateTime, nullable=True)
 
     app_project = relationship("AppProject", back_populates="build_jobs")
 
 
+# Finished jobs past ARCHIVE_AFTER_DAYS are moved here by app.archive; same columns as build_jobs plus archived_at.
+class BuildJobArchive(Base):
+    __table__ = Table(
+        "build_jobs_archive",
+        Base.metadata,
+        *(
+            Column(column.name, column.type, primary_key=column.primary_key, autoincrement=False, nullable=column.nullable)
+            for column in BuildJob.__table__.columns
+        ),
+        Column("archived_at", DateTime, nullable=False, default=datetime.utcnow, index=True),
+        Index("ix_build_jobs_archive_app_project_id_created_at", "app_project_id", "created_at"),
+    )
+
+
 class KeystoreDownloadRequest(Base):
     __tablename__ = "keystore_download_requests"
 
     id = Column(Integer, primary_key=True)
     keystore_id = Column(Integer, ForeignKey("keystores.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    status = Column(String(20), nullable=False, default=RequestStatus.pending.value)
+    status = Column(String(20), nullable=False, default=RequestStatus.pending.value, index=True)
     admin_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     decision_at = Column(DateTime, nullable=True)
@@ -112,3 +157,141 @@ class KeystoreDownloadRequest(Base):
     keystore = relationship("Keystore", back_populates="download_requests")
     requester = relationship("User", foreign_keys=[user_id])
     admin = relationship("User", foreign_keys=[admin_id])
+
+
+class BuilderNode(Base):
+    __tablename__ = "builder_nodes"
+
+    id = Column(String(100), primary_key=True)
+    platforms = Column(JSON, nullable=False, default=list)
+    gradle_versions = Column(JSON, nullable=False, default=list)
+    warm_daemons = Column(JSON, nullable=False, default=list)
+    current_job_id = Column(Integer, nullable=True)
+    jobs_claimed = Column(Integer, nullable=False, default=0)
+    cache_hits = Column(Integer, nullable=False, default=0)
+    cache_misses = Column(Integer, nullable=False, default=0)
+    jobs_stolen = Column(Integer, nullable=False, default=0)
+    slots = Column(Integer, nullable=False, default=1)
+    running_jobs = Column(Integer, nullable=False, default=0)
+    memory_bytes = Column(BigInteger, nullable=True)
+    cpus = Column(Integer, nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    last_seen_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    @property
+    def cache_miss_rate(self) -> float:
+        claims = self.cache_hits + self.cache_misses
+        return self.cache_misses / claims if claims else 0.0
+
+
+class BuildStatsDaily(Base):
+    __tablename__ = "build_stats_daily"
+
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    enqueued = Column(Integer, nullable=False, default=0)
+    started = Column(Integer, nullable=False, default=0)
+    succeeded = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    duration_count = Column(Integer, nullable=False, default=0)
+    duration_sum = Column(Float, nullable=False, default=0.0)
+
+
+class BuildDurationBucket(Base):
+    __tablename__ = "build_duration_buckets"
+
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    bucket = Column(Integer, primary_key=True, autoincrement=False)
+    count = Column(Integer, nullable=False, default=0)
+
+
+# Fleet-wide counters are split over STAT_SHARDS rows each; a write bumps one shard picked at random and reads sum
+# them, so concurrent transitions rarely wait on the same row and the dashboard never aggregates per-user rows.
+class BuildStatsFleetDaily(Base):
+    __tablename__ = "build_stats_fleet_daily"
+
+    day = Column(Date, primary_key=True)
+    shard = Column(Integer, primary_key=True, autoincrement=False)
+    enqueued = Column(Integer, nullable=False, default=0)
+    started = Column(Integer, nullable=False, default=0)
+    succeeded = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    duration_count = Column(Integer, nullable=False, default=0)
+    duration_sum = Column(Float, nullable=False, default=0.0)
+
+
+class BuildFleetDurationBucket(Base):
+    __tablename__ = "build_fleet_duration_buckets"
+
+    day = Column(Date, primary_key=True)
+    shard = Column(Integer, primary_key=True, autoincrement=False)
+    bucket = Column(Integer, primary_key=True, autoincrement=False)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class BuildStatusCount(Base):
+    __tablename__ = "build_status_counts"
+
+    status = Column(String(20), primary_key=True)
+    shard = Column(Integer, primary_key=True, autoincrement=False)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class UsedDownloadNonce(Base):
+    __tablename__ = "used_download_nonces"
+
+    nonce = Column(String(32), primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class WebhookStatus(str, enum.Enum):
+    pending = "pending"
+    delivered = "delivered"
+    dead = "dead"
+
+
+class WebhookSubscription(Base):
+    __tablename__ = "webhook_subscriptions"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    # Null subscribes to every app the user owns.
+    app_project_id = Column(Integer, ForeignKey("app_projects.id"), nullable=True)
+    url = Column(String(1024), nullable=False)
+    # Kept in plaintext because every delivery is HMAC-signed with it. It only authenticates this service to the
+    # subscriber, so a leaked secret lets someone forge webhooks to that endpoint but grants no access here.
+    secret = Column(String(64), nullable=False)
+    events = Column(JSON, nullable=False, default=list)
+    active = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Written in the same transaction as the status change it describes; app.webhooks fans it out to deliveries.
+class WebhookEvent(Base):
+    __tablename__ = "webhook_outbox"
+
+    id = Column(Integer, primary_key=True)
+    event_type = Column(String(50), nullable=False)
+    user_id = Column(Integer, nullable=False)
+    app_project_id = Column(Integer, nullable=True)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    dispatched_at = Column(DateTime, nullable=True, index=True)
+
+
+class WebhookDelivery(Base):
+    __tablename__ = "webhook_deliveries"
+    __table_args__ = (Index("ix_webhook_deliveries_status_next_attempt_at", "status", "next_attempt_at"),)
+
+    id = Column(Integer, primary_key=True)
+    subscription_id = Column(Integer, ForeignKey("webhook_subscriptions.id"), nullable=False, index=True)
+    event_id = Column(Integer, ForeignKey("webhook_outbox.id"), nullable=False)
+    status = Column(String(20), nullable=False, default=WebhookStatus.pending.value)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    delivered_at = Column(DateTime, nullable=True)
+
+    event = relationship("WebhookEvent")
@@ -0,0 +1,45 @@
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from .metrics import registry
+
+checkout_wait = registry.histogram("db_pool_checkout_wait_seconds", "Time spent waiting to check a connection out of the pool")
+checkout_timeouts = registry.counter("db_pool_checkout_timeouts_total", "Pool checkouts that gave up after pool_timeout")
+checked_out = registry.gauge("db_pool_checked_out", "Connections currently checked out of the pool")
+overflow = registry.gauge("db_pool_overflow", "Connections open beyond pool_size")
+
+
+class InstrumentedQueuePool(QueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            checkout_timeouts.inc()
+            raise
+        finally:
+            checkout_wait.observe(time.perf_counter() - start)
+
+
+def create_pooled_engine(url: str, pool_size: int, max_overflow: int, pool_timeout: float) -> Engine:
+    engine = create_engine(
+        url,
+        pool_pre_ping=True,
+        future=True,
+        poolclass=InstrumentedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+    )
+
+    @event.listens_for(engine, "checkout")
+    @event.listens_for(engine, "checkin")
+    def _update_gauges(*args):
+        checked_out.set(engine.pool.checkedout())
+        overflow.set(max(0, engine.pool.overflow()))
+
+    return engine
@@ -0,0 +1,159 @@
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+
+from .android_project import render_project
+from .metrics import registry
+
+KOTLIN_KEYWORDS = frozenset(
+    "as break class continue do else false for fun if in interface is null object package return super this throw "
+    "true try typealias typeof val var when while".split()
+)
+JAVA_KEYWORDS = frozenset(
+    "abstract assert boolean break byte case catch char class const continue default do double else enum extends "
+    "final finally float for goto if implements import instanceof int interface long native new package private "
+    "protected public return short static strictfp super switch synchronized this throw throws transient try void "
+    "volatile while true false null".split()
+)
+PACKAGE_SEGMENT = re.compile(r"^[A-Za-z][A-Za-z0-9_]*$")
+XML_FILES = (
+    "app/src/main/AndroidManifest.xml",
+    "app/src/main/res/values/strings.xml",
+    "app/src/main/res/values/themes.xml",
+    "app/src/main/res/values/colors.xml",
+)
+ANDROID_NS = "{http://schemas.android.com/apk/res/android}"
+# keytool writes JKS, JCEKS or PKCS#12 (a DER sequence); anything else is the placeholder or a damaged file.
+KEYSTORE_MAGIC = (b"\xfe\xed\xfe\xed", b"\xce\xce\xce\xce", b"\x30")
+
+preflight_rejections_total = registry.counter("build_preflight_rejections_total", "Builds rejected by preflight validation")
+
+
+@dataclass(frozen=True)
+class Issue:
+    level: str
+    field: str
+    message: str
+
+    def to_dict(self) -> dict:
+        return {"level": self.level, "field": self.field, "message": self.message}
+
+
+def _error(field: str, message: str) -> Issue:
+    return Issue("error", field, message)
+
+
+def _plain_literal(value: str) -> bool:
+    # Safe inside a double-quoted Kotlin or Groovy string without escaping or template expansion.
+    return not any(char in value for char in '"\\$\n\r')
+
+
+def check_package_name(package_name: str) -> list[Issue]:
+    segments = package_name.split(".")
+    if len(segments) < 2:
+        return [_error("package_name", "Package name needs at least two dot-separated segments")]
+    issues = []
+    for segment in segments:
+        if not PACKAGE_SEGMENT.match(segment):
+            issues.append(_error("package_name", f"Segment {segment!r} must start with a letter and contain only letters, digits or _"))
+        elif segment in KOTLIN_KEYWORDS or segment in JAVA_KEYWORDS:
+            issues.append(_error("package_name", f"Segment {segment!r} is a Kotlin or Java keyword"))
+    return issues
+
+
+def check_app(app_project) -> list[Issue]:
+    issues = check_package_name(app_project.package_name)
+    if app_project.min_sdk < 1:
+        issues.append(_error("min_sdk", "min_sdk must be at least 1"))
+    if app_project.min_sdk > app_project.target_sdk:
+        issues.append(_error("min_sdk", f"min_sdk ({app_project.min_sdk}) is greater than target_sdk ({app_project.target_sdk})"))
+    if app_project.version_code < 1:
+        issues.append(_error("version_code", "version_code must be a positive integer"))
+    if not app_project.version_name or not _plain_literal(app_project.version_name):
+        issues.append(_error("version_name", 'version_name must be non-empty and cannot contain ", \\, $ or line breaks'))
+    name = app_project.name
+    if not name.strip():
+        issues.append(_error("name", "App name is empty"))
+    elif any(char in name for char in "<>&\"'\\\n\r") or name[0] in "@?":
+        issues.append(_error("name", "App name cannot contain < > & \" ' \\ or line breaks, or start with @ or ?"))
+    try:
+        url = urlsplit(app_project.url)
+    except ValueError:
+        # Unbalanced IPv6 brackets and the like.
+        issues.append(_error("url", "URL is malformed"))
+        return issues
+    if url.scheme not in ("http", "https") or not url.netloc:
+        issues.append(_error("url", "URL must be an absolute http(s) URL"))
+    elif not _plain_literal(app_project.url) or any(char.isspace() for char in app_project.url):
+        issues.append(_error("url", "URL cannot contain \", \\, $ or whitespace; percent-encode them"))
+    elif url.scheme == "http":
+        issues.append(Issue("warning", "url", "Cleartext http URLs are blocked by Android's default network security config"))
+    return issues
+
+
+def check_keystore(keystore) -> list[Issue]:
+    if keystore is None:
+        return [_error("keystore", "App has no keystore")]
+    try:
+        with open(keystore.keystore_path, "rb") as handle:
+            head = handle.read(4)
+    except OSError as exc:
+        return [_error("keystore", f"Keystore file is not readable: {exc.strerror}")]
+    if not head.startswith(KEYSTORE_MAGIC):
+        return [_error("keystore", "Keystore file is not a JKS or PKCS#12 keystore; regenerate it")]
+    if any(not _plain_literal(value) or "'" in value for value in (keystore.alias, keystore.store_password, keystore.key_password)):
+        return [_error("keystore", "Keystore alias or passwords cannot be quoted into the signing config")]
+    return []
+
+
+def check_project(files: dict[str, str], app_project) -> list[Issue]:
+    issues = []
+    parsed = {}
+    for path in XML_FILES:
+        try:
+            parsed[path] = ET.fromstring(files[path])
+        except ET.ParseError as exc:
+            issues.append(_error(path, f"Generated XML is malformed: {exc}"))
+    manifest = parsed.get(XML_FILES[0])
+    if manifest is not None:
+        label = manifest.find("application").get(f"{ANDROID_NS}label")
+        if manifest.get("package") != app_project.package_name or label != app_project.name:
+            issues.append(_error(XML_FILES[0], "Generated manifest does not round-trip the package name and label"))
+    strings = parsed.get(XML_FILES[1])
+    if strings is not None and strings.findtext("string[@name='app_name']") != app_project.name:
+        issues.append(_error(XML_FILES[1], "Generated app_name does not round-trip the app name"))
+    activity = files[f"app/src/main/java/{app_project.package_name.replace('.', '/')}/MainActivity.kt"]
+    match = re.search(r'webView\.loadUrl\("(.*)"\)\n', activity)
+    if not match or match.group(1) != app_project.url or not _plain_literal(match.group(1)):
+        issues.append(_error("MainActivity.kt", "Generated loadUrl literal does not round-trip the URL"))
+    module = files["app/build.gradle"]
+    if module.count("{") != module.count("}"):
+        issues.append(_error("app/build.gradle", "Generated build script has unbalanced braces"))
+    return issues
+
+
+def dry_run(app_project, keystore, spec, sdk_root: str = "") -> tuple[list[Issue], dict[str, str]]:
+    issues = check_app(app_project) + check_keystore(keystore)
+    if has_errors(issues):
+        return issues, {}
+    files = render_project(app_project, keystore, sdk_root, spec)
+    return issues + check_project(files, app_project), files
+
+
+def validate(app_project, keystore, spec, sdk_root: str = "") -> list[Issue]:
+    return dry_run(app_project, keystore, spec, sdk_root)[0]
+
+
+def has_errors(issues: list[Issue]) -> bool:
+    return any(issue.level == "error" for issue in issues)
+
+
+def report(issues: list[Issue]) -> list[dict]:
+    return [issue.to_dict() for issue in issues]
+
+
+def summary(issues: list[Issue]) -> Optional[str]:
+    errors = [f"{issue.field}: {issue.message}" for issue in issues if issue.level == "error"]
+    return "; ".join(errors) or None
@@ -0,0 +1,246 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from fastapi import Request
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+
+from . import models, querycount
+from .auth import user_from_token
+from .config import get_settings
+from .database import SessionLocal
+from .dependencies import get_token
+from .metrics import registry
+
+settings = get_settings()
+APP_DIR = str(Path(__file__).resolve().parent)
+CATEGORIES = (
+    ("sql", ("sqlalchemy", "pymysql")),
+    ("template", ("jinja2", "templating.py")),
+    ("password_hash", ("hashing.py", "passlib", "bcrypt")),
+    ("serialization", ("pydantic", "encoders.py")),
+)
+
+profiles_written = registry.counter("profiles_written_total", "Request profiles stored on disk")
+_active: contextvars.ContextVar[Optional["Sampler"]] = contextvars.ContextVar("active_sampler", default=None)
+
+
+class Sampler(threading.Thread):
+    def __init__(self, interval: float):
+        super().__init__(daemon=True, name="request-profiler")
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        # (thread ident, task or None) pairs currently running this request's code; see ProfiledRoute.
+        self._running: set[tuple[int, Optional[asyncio.Task]]] = set()
+        self._stopped = threading.Event()
+
+    @contextmanager
+    def tracking(self, task: Optional[asyncio.Task]):
+        entry = (threading.get_ident(), task)
+        self._running.add(entry)
+        try:
+            yield
+        finally:
+            self._running.discard(entry)
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            running = list(self._running)
+            if not running:
+                continue
+            frames = sys._current_frames()
+            for ident, task in running:
+                frame = frames.get(ident)
+                # The event loop thread only counts while it is stepping this request's task.
+                if frame is None or (task is not None and asyncio.current_task(task.get_loop()) is not task):
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                self.stacks[tuple(f"{code.co_filename}:{code.co_name}" for code in reversed(codes))] += 1
+
+    def stop(self) -> Counter:
+        self._stopped.set()
+        self.join()
+        return self.stacks
+
+
+def _tracked(func):
+    if getattr(func, "_profiled", False):
+        return func
+
+    @functools.wraps(func)
+    def tracked(*args, **kwargs):
+        sampler = _active.get()
+        if sampler is None:
+            return func(*args, **kwargs)
+        with sampler.tracking(None):
+            return func(*args, **kwargs)
+
+    tracked._profiled = True
+    return tracked
+
+
+async def in_threadpool(func, *args, **kwargs):
+    # For async routes offloading work: a plain run_in_threadpool call runs on a thread the sampler does not know.
+    return await run_in_threadpool(_tracked(func), *args, **kwargs)
+
+
+class ProfiledRoute(APIRoute):
+    # Registers where a profiled request runs: its route handler's task on the event loop, and the threadpool
+    # thread of a sync endpoint or of in_threadpool calls. Sync dependencies run on other threadpool threads
+    # and are not sampled.
+    def __init__(self, path: str, endpoint, **kwargs):
+        # Async endpoints run in the route handler's task, which get_route_handler tracks.
+        super().__init__(path, endpoint if asyncio.iscoroutinefunction(endpoint) else _tracked(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def tracked_handler(request: Request):
+            sampler = _active.get()
+            if sampler is None:
+                return await handler(request)
+            with sampler.tracking(asyncio.current_task()):
+                return await handler(request)
+
+        return tracked_handler
+
+
+def _category(stack: tuple[str, ...]) -> str:
+    for frame in reversed(stack):
+        for name, markers in CATEGORIES:
+            if any(marker in frame for marker in markers):
+                return name
+    return "other"
+
+
+def _short(frame: str) -> str:
+    filename, _, function = frame.rpartition(":")
+    if filename.startswith(APP_DIR):
+        filename = "app" + filename[len(APP_DIR):]
+    else:
+        filename = os.path.basename(filename)
+    return f"{filename}:{function}"
+
+
+def _admin_requested(request: Request) -> bool:
+    token = get_token(token=request.cookies.get("token"), authorization=request.headers.get("authorization"))
+    if token is None:
+        return False
+    with SessionLocal() as db:
+        user = user_from_token(db, token)
+        return user is not None and user.role == models.UserRole.admin.value
+
+
+async def trigger_for(request: Request) -> Optional[str]:
+    if request.headers.get("x-profile") == "1" or request.query_params.get("_profile") == "1":
+        if await run_in_threadpool(_admin_requested, request):
+            return "flag"
+        return None
+    if settings.profile_sample_rate and random.random() < settings.profile_sample_rate:
+        return "sample"
+    return None
+
+
+class RequestProfile:
+    def __init__(self, request: Request, trigger: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = request.method
+        self.path = request.url.path
+        self.trigger = trigger
+        self.started_at = datetime.utcnow().replace(microsecond=0)
+        self.status_code: Optional[int] = None
+        self.duration = 0.0
+        self._sampler = Sampler(settings.profile_interval_ms / 1000)
+        self._started = 0.0
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self._token = _active.set(self._sampler)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration = time.perf_counter() - self._started
+        self.stacks = self._sampler.stop()
+        _active.reset(self._token)
+        return False
+
+    def worth_keeping(self) -> bool:
+        return self.trigger == "flag" or self.duration * 1000 >= settings.profile_slow_ms
+
+    def to_dict(self) -> dict:
+        interval_ms = settings.profile_interval_ms
+        breakdown: Counter = Counter()
+        functions: Counter = Counter()
+        for stack, count in self.stacks.items():
+            breakdown[_category(stack)] += count * interval_ms
+            functions[_short(stack[-1])] += count
+        stats = querycount.current_stats()
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "trigger": self.trigger,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 1),
+            "sql": {"count": stats.count, "ms": round(stats.seconds * 1000, 1)} if stats else None,
+            "samples": sum(self.stacks.values()),
+            "interval_ms": interval_ms,
+            "breakdown_ms": dict(breakdown),
+            "top_functions": functions.most_common(25),
+            "stacks": [
+                {"stack": ";".join(_short(frame) for frame in stack), "samples": count}
+                for stack, count in self.stacks.most_common(200)
+            ],
+        }
+
+
+def save(data: dict) -> Path:
+    directory = Path(settings.profile_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{data['started_at'].replace(':', '')}-{data['id']}.json"
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(data))
+    tmp_path.replace(path)
+    profiles_written.inc()
+    if settings.profile_keep:
+        for old in sorted(directory.glob("*.json"))[:-settings.profile_keep]:
+            old.unlink(missing_ok=True)
+    return path
+
+
+def list_profiles() -> list[dict]:
+    directory = Path(settings.profile_dir)
+    summaries = []
+    for path in sorted(directory.glob("*.json"), reverse=True):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        data.pop("stacks", None)
+        data.pop("top_functions", None)
+        summaries.append(data)
+    return summaries
+
+
+def load_profile(profile_id: str) -> Optional[dict]:
+    for path in Path(settings.profile_dir).glob(f"*-{profile_id}.json"):
+        return json.loads(path.read_text())
+    return None
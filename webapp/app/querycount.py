@@ -0,0 +1,73 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+queries_per_request = registry.histogram(
+    "db_queries_per_request",
+    "SQL statements executed per HTTP request",
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+db_seconds_per_request = registry.histogram("db_seconds_per_request", "Time spent in SQL statements per HTTP request")
+query_budget_exceeded = registry.counter("db_query_budget_exceeded_total", "Requests that executed more SQL statements than DB_QUERY_BUDGET")
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: list[str] = []
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+@contextmanager
+def track_queries():
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def install(engine: Engine) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+            stats.statements.append(statement)
+
+
+def check_budget(stats: QueryStats, budget: int, strict: bool, label: str) -> None:
+    if not budget or stats.count <= budget:
+        return
+    query_budget_exceeded.inc()
+    message = f"{label} executed {stats.count} SQL statements (budget {budget})"
+    if strict:
+        raise QueryBudgetExceeded(message + ":\n" + "\n".join(stats.statements))
+    logger.warning(message)
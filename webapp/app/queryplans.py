@@ -0,0 +1,192 @@
+import argparse
+import random
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.engine import Connection
+
+from . import models
+from .database import engine
+
+HOT_QUERIES = {
+    "builder_pending_poll": (
+        "build_jobs",
+        select(models.BuildJob.id, models.BuildJob.created_at, models.AppProject.target_sdk)
+        .join(models.AppProject, models.AppProject.id == models.BuildJob.app_project_id)
+        .where(models.BuildJob.status == models.BuildStatus.pending.value)
+        .order_by(models.BuildJob.created_at.asc())
+        .limit(20),
+    ),
+    "app_build_history": (
+        "build_jobs",
+        select(models.BuildJob.id, models.BuildJob.status)
+        .where(models.BuildJob.app_project_id == 1)
+        .order_by(models.BuildJob.created_at.desc()),
+    ),
+    "list_apps_for_owner": (
+        "app_projects",
+        select(models.AppProject.id, models.AppProject.name).where(models.AppProject.owner_user_id == 1),
+    ),
+    "pending_keystore_requests": (
+        "keystore_download_requests",
+        select(models.KeystoreDownloadRequest.id).where(
+            models.KeystoreDownloadRequest.status == models.RequestStatus.pending.value
+        ),
+    ),
+}
+
+
+def explain(conn: Connection, stmt) -> list[str]:
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "mysql":
+        rows = conn.execute(text(f"EXPLAIN {sql}")).mappings().all()
+        return [
+            f"table={row['table']} type={row['type']} key={row['key']} rows={row['rows']} extra={row['Extra']}"
+            for row in rows
+        ]
+    if conn.dialect.name == "sqlite":
+        return [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    raise RuntimeError(f"EXPLAIN checks are not implemented for {conn.dialect.name}")
+
+
+def plan_problems(dialect: str, table: str, plan: list[str]) -> list[str]:
+    problems = []
+    for line in plan:
+        if dialect == "mysql":
+            if f"table={table} " in line and " type=ALL " in line:
+                problems.append(f"full table scan: {line}")
+            if "Using filesort" in line:
+                problems.append(f"filesort: {line}")
+        else:
+            if line.startswith(f"SCAN {table}") and "USING" not in line:
+                problems.append(f"full table scan: {line}")
+            if "TEMP B-TREE FOR ORDER BY" in line:
+                problems.append(f"filesort: {line}")
+    return problems
+
+
+def _chunks(rows: list[dict], size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def seed(conn: Connection, users: int, apps_per_user: int, builds_per_app: int, chunk_size: int = 5000) -> None:
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    user_offset = conn.execute(select(func.coalesce(func.max(models.User.id), 0))).scalar_one()
+    app_offset = conn.execute(select(func.coalesce(func.max(models.AppProject.id), 0))).scalar_one()
+    keystore_offset = conn.execute(select(func.coalesce(func.max(models.Keystore.id), 0))).scalar_one()
+
+    user_rows = [
+        {
+            "id": user_offset + i + 1,
+            "email": f"seed{user_offset + i}@example.com",
+            "password_hash": "x",
+            "role": models.UserRole.user.value,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(users)
+    ]
+    app_rows, keystore_rows, build_rows, request_rows = [], [], [], []
+    app_id, keystore_id = app_offset, keystore_offset
+    for user in user_rows:
+        for _ in range(apps_per_user):
+            app_id += 1
+            keystore_id += 1
+            app_rows.append(
+                {
+                    "id": app_id,
+                    "owner_user_id": user["id"],
+                    "name": f"Seed {app_id}",
+                    "package_name": f"com.seed.app{app_id}",
+                    "url": "https://example.com",
+                    "min_sdk": 21,
+                    "target_sdk": 34,
+                    "version_code": 1,
+                    "version_name": "1.0",
+                    "created_at": now,
+                    "updated_at": now,
+                }
+            )
+            keystore_rows.append(
+                {
+                    "id": keystore_id,
+                    "app_project_id": app_id,
+                    "keystore_path": f"/data/keystores/{app_id}.keystore",
+                    "alias": f"com.seed.app{app_id}.alias",
+                    "store_password": "x",
+                    "key_password": "x",
+                    "download_allowed": False,
+                    "created_at": now,
+                }
+            )
+            for _ in range(builds_per_app):
+                created = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+                status = rng.choices(
+                    [s.value for s in models.BuildStatus], weights=[1, 1, 80, 18]
+                )[0]
+                build_rows.append(
+                    {
+                        "app_project_id": app_id,
+                        "status": status,
+                        "created_at": created,
+                        "updated_at": created,
+                    }
+                )
+            request_rows.append(
+                {
+                    "keystore_id": keystore_id,
+                    "user_id": user["id"],
+                    "status": rng.choices([s.value for s in models.RequestStatus], weights=[2, 90, 8])[0],
+                    "created_at": now,
+                }
+            )
+
+    for table, rows in (
+        (models.User.__table__, user_rows),
+        (models.AppProject.__table__, app_rows),
+        (models.Keystore.__table__, keystore_rows),
+        (models.BuildJob.__table__, build_rows),
+        (models.KeystoreDownloadRequest.__table__, request_rows),
+    ):
+        for chunk in _chunks(rows, chunk_size):
+            conn.execute(insert(table), chunk)
+            conn.commit()
+    if conn.dialect.name == "mysql":
+        for table in ("users", "app_projects", "keystores", "build_jobs", "keystore_download_requests"):
+            conn.execute(text(f"ANALYZE TABLE {table}"))
+    else:
+        conn.execute(text("ANALYZE"))
+    conn.commit()
+
+
+def check(conn: Connection) -> int:
+    failures = 0
+    for name, (table, stmt) in HOT_QUERIES.items():
+        plan = explain(conn, stmt)
+        problems = plan_problems(conn.dialect.name, table, plan)
+        print(f"[{'FAIL' if problems else 'ok'}] {name}")
+        for line in plan:
+            print(f"    {line}")
+        for problem in problems:
+            print(f"    !! {problem}")
+        failures += bool(problems)
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check EXPLAIN plans of hot queries against the configured database.")
+    parser.add_argument("--seed-users", type=int, default=0, help="Insert synthetic users before checking")
+    parser.add_argument("--apps-per-user", type=int, default=5)
+    parser.add_argument("--builds-per-app", type=int, default=50)
+    args = parser.parse_args(argv)
+    with engine.connect() as conn:
+        if args.seed_users:
+            seed(conn, args.seed_users, args.apps_per_user, args.builds_per_app)
+        return 1 if check(conn) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
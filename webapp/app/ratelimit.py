@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Optional
+
+from fastapi import HTTPException, Request, status
+
+from .config import get_settings
+from .metrics import registry
+
+settings = get_settings()
+rate_limited_total = registry.counter("auth_rate_limited_total", "Authentication attempts rejected by the rate limiter")
+
+
+class SlidingWindowLimiter:
+    def __init__(self, limit: int, window_seconds: float):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._hits: dict[str, deque] = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def hit(self, key: str) -> Optional[float]:
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits[key]
+            while hits and now - hits[0] >= self.window_seconds:
+                hits.popleft()
+            if len(hits) >= self.limit:
+                return self.window_seconds - (now - hits[0])
+            hits.append(now)
+            if len(self._hits) > 10000:
+                self._prune(now)
+        return None
+
+    def _prune(self, now: float) -> None:
+        stale = [key for key, hits in self._hits.items() if not hits or now - hits[-1] >= self.window_seconds]
+        for key in stale:
+            del self._hits[key]
+
+
+auth_limiter = SlidingWindowLimiter(settings.auth_rate_limit, settings.auth_rate_window_seconds)
+
+
+def check_auth_rate_limit(request: Request, email: Optional[str] = None) -> None:
+    keys = []
+    if request.client:
+        keys.append(f"ip:{request.client.host}")
+    if email:
+        keys.append(f"email:{email.lower()}")
+    for key in keys:
+        retry_after = auth_limiter.hit(key)
+        if retry_after is not None:
+            rate_limited_total.inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many authentication attempts",
+                headers={"Retry-After": str(max(1, int(retry_after + 0.5)))},
+            )
@@ -0,0 +1,147 @@
+from collections import defaultdict
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Column-projected rows for the read endpoints and views. Writes keep going through the ORM entities;
+# these skip the identity map, instrumentation and unused columns (a listed build never loads its log).
+
+
+@dataclass(slots=True)
+class KeystoreRow:
+    id: int
+    alias: str
+    download_allowed: bool
+    created_at: datetime
+
+
+@dataclass(slots=True)
+class BuildRow:
+    id: int
+    app_project_id: int
+    status: str
+    stage: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime]
+    apk_path: Optional[str]
+    aab_path: Optional[str]
+    released: bool
+    outputs: str
+    variant: str
+    minify: bool
+    abi_splits: Optional[list]
+    builder_node: Optional[str]
+    traceparent: Optional[str]
+    validation: Optional[list]
+    heap_mb: Optional[int]
+    max_workers: Optional[int]
+    peak_rss_bytes: Optional[int]
+    cpu_seconds: Optional[float]
+    log: Optional[str] = None
+
+
+@dataclass(slots=True)
+class AppRow:
+    id: int
+    owner_user_id: int
+    name: str
+    package_name: str
+    url: str
+    min_sdk: int
+    target_sdk: int
+    version_code: int
+    version_name: str
+    icon_path: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+    keystore: Optional[KeystoreRow] = None
+    build_jobs: list = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class KeystoreRequestRow:
+    id: int
+    keystore_id: int
+    user_id: int
+    status: str
+    admin_id: Optional[int]
+    created_at: datetime
+    decision_at: Optional[datetime]
+
+
+def _names(row_type, exclude=()) -> tuple[str, ...]:
+    return tuple(f.name for f in fields(row_type) if f.name not in exclude)
+
+
+KEYSTORE_COLUMNS = _names(KeystoreRow)
+BUILD_COLUMNS = _names(BuildRow, exclude=("log",))
+APP_COLUMNS = _names(AppRow, exclude=("keystore", "build_jobs"))
+REQUEST_COLUMNS = _names(KeystoreRequestRow)
+
+
+def _columns(model, names: tuple[str, ...]) -> list:
+    return [getattr(model, name) for name in names]
+
+
+def builds_for_apps(db: Session, app_ids: list[int]) -> dict[int, list[BuildRow]]:
+    grouped = defaultdict(list)
+    if not app_ids:
+        return grouped
+    rows = db.execute(
+        select(*_columns(models.BuildJob, BUILD_COLUMNS))
+        .where(models.BuildJob.app_project_id.in_(app_ids))
+        .order_by(models.BuildJob.created_at.desc())
+    )
+    for row in rows:
+        grouped[row.app_project_id].append(BuildRow(*row))
+    return grouped
+
+
+def list_builds(db: Session, app_id: int) -> list[BuildRow]:
+    return builds_for_apps(db, [app_id])[app_id]
+
+
+def get_build(db: Session, model, build_id: int) -> Optional[BuildRow]:
+    # The single-build read is the only one that returns the log; model is BuildJob or BuildJobArchive.
+    row = db.execute(select(*_columns(model, BUILD_COLUMNS + ("log",))).where(model.id == build_id)).first()
+    return BuildRow(*row) if row else None
+
+
+def list_apps(db: Session, owner_user_id: Optional[int] = None, app_id: Optional[int] = None) -> list[AppRow]:
+    query = select(*_columns(models.AppProject, APP_COLUMNS), *_columns(models.Keystore, KEYSTORE_COLUMNS)).outerjoin(
+        models.Keystore, models.Keystore.app_project_id == models.AppProject.id
+    )
+    if owner_user_id is not None:
+        query = query.where(models.AppProject.owner_user_id == owner_user_id)
+    if app_id is not None:
+        query = query.where(models.AppProject.id == app_id)
+    apps = []
+    split = len(APP_COLUMNS)
+    for row in db.execute(query.order_by(models.AppProject.id)):
+        keystore = KeystoreRow(*row[split:]) if row[split] is not None else None
+        apps.append(AppRow(*row[:split], keystore=keystore))
+    builds = builds_for_apps(db, [app.id for app in apps])
+    for app in apps:
+        app.build_jobs = builds.get(app.id, [])
+    return apps
+
+
+def get_app(db: Session, app_id: int) -> Optional[AppRow]:
+    apps = list_apps(db, app_id=app_id)
+    return apps[0] if apps else None
+
+
+def pending_keystore_requests(db: Session) -> list[KeystoreRequestRow]:
+    rows = db.execute(
+        select(*_columns(models.KeystoreDownloadRequest, REQUEST_COLUMNS)).where(
+            models.KeystoreDownloadRequest.status == models.RequestStatus.pending.value
+        )
+    )
+    return [KeystoreRequestRow(*row) for row in rows]
+
@@ -1,39 +1,96 @@
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.templating import Jinja2Templates
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
 from fastapi import Request
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 
-from .. import models, schemas
+from .. import archive, models, profiling, readmodels, schemas, stats, webhooks
 from ..auth import get_current_admin
+from ..bulk import batch_result
 from ..database import get_db
+from ..serialization import FastJSONResponse, trusted_many
+from ..templating import templates
 
-router = APIRouter(prefix="/admin", tags=["admin"])
-templates = Jinja2Templates(directory="app/templates")
+router = APIRouter(prefix="/admin", tags=["admin"], route_class=profiling.ProfiledRoute)
 
 
 @router.get("/keystore-requests", response_model=list[schemas.KeystoreRequestOut])
 def list_requests(db: Session = Depends(get_db), admin: models.User = Depends(get_current_admin)):
-    return db.query(models.KeystoreDownloadRequest).filter(models.KeystoreDownloadRequest.status == models.RequestStatus.pending.value).all()
+    return FastJSONResponse(trusted_many(schemas.KeystoreRequestOut, readmodels.pending_keystore_requests(db)))
+
+
+@router.get("/builders", response_model=schemas.BuilderFleetOut)
+def list_builders(db: Session = Depends(get_db), admin: models.User = Depends(get_current_admin)):
+    nodes = db.query(models.BuilderNode).order_by(models.BuilderNode.last_seen_at.desc()).all()
+    hits = sum(node.cache_hits for node in nodes)
+    misses = sum(node.cache_misses for node in nodes)
+    return schemas.BuilderFleetOut(
+        cache_hits=hits,
+        cache_misses=misses,
+        cache_miss_rate=misses / (hits + misses) if hits + misses else 0.0,
+        nodes=nodes,
+    )
+
+
+@router.get("/archive")
+def archive_status(db: Session = Depends(get_db), admin: models.User = Depends(get_current_admin)):
+    return {
+        "archive_after_days": archive.settings.archive_after_days,
+        "archived_total": archive.archived_total.value,
+        "tables": archive.table_sizes(db),
+    }
+
+
+@router.get("/stats")
+def build_stats(
+    days: int = Query(14, ge=1, le=366),
+    user_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    admin: models.User = Depends(get_current_admin),
+):
+    return stats.summary(db, days, user_id)
+
+
+@router.get("/stats/view")
+def view_build_stats(request: Request, days: int = Query(14, ge=1, le=366), db: Session = Depends(get_db), admin: models.User = Depends(get_current_admin)):
+    return templates.TemplateResponse("admin_stats.html", {"request": request, "stats": stats.summary(db, days)})
+
+
+@router.get("/profiles")
+def list_profiles(admin: models.User = Depends(get_current_admin)):
+    return profiling.list_profiles()
+
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: str = Path(..., regex="^[0-9a-f]{16}$"), admin: models.User = Depends(get_current_admin)):
+    profile = profiling.load_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
 
 
 @router.get("/keystore-requests/view")
 def view_requests(request: Request, db: Session = Depends(get_db), admin: models.User = Depends(get_current_admin)):
-    reqs = db.query(models.KeystoreDownloadRequest).filter(models.KeystoreDownloadRequest.status == models.RequestStatus.pending.value).all()
+    reqs = readmodels.pending_keystore_requests(db)
     return templates.TemplateResponse("admin_keystore_requests.html", {"request": request, "requests": reqs})
 
 
 @router.post("/keystore-requests/{request_id}/approve")
 def approve_request(request_id: int, db: Session = Depends(get_db), admin: models.User = Depends(get_current_admin)):
-    req = db.get(models.KeystoreDownloadRequest, request_id)
+    req = db.get(
+        models.KeystoreDownloadRequest,
+        request_id,
+        options=[joinedload(models.KeystoreDownloadRequest.keystore).joinedload(models.Keystore.app_project)],
+    )
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
     req.status = models.RequestStatus.approved.value
     req.admin_id = admin.id
     req.decision_at = datetime.utcnow()
-    keystore = db.get(models.Keystore, req.keystore_id)
+    keystore = req.keystore
     if keystore:
         keystore.download_allowed = True
+    webhooks.enqueue_keystore_request(db, req)
     db.commit()
     return {"status": "approved"}
 
@@ -46,5 +103,33 @@ def reject_request(request_id: int, db: Session = Depends(get_db), admin: models
     req.status = models.RequestStatus.rejected.value
     req.admin_id = admin.id
     req.decision_at = datetime.utcnow()
+    webhooks.enqueue_keystore_request(db, req)
     db.commit()
     return {"status": "rejected"}
+
+
+@router.post("/keystore-requests/batch", response_model=schemas.BatchResult)
+def decide_requests_batch(batch: schemas.KeystoreRequestBatch, db: Session = Depends(get_db), admin: models.User = Depends(get_current_admin)):
+    reqs = {
+        req.id: req
+        for req in db.query(models.KeystoreDownloadRequest)
+        .options(joinedload(models.KeystoreDownloadRequest.keystore).joinedload(models.Keystore.app_project))
+        .filter(models.KeystoreDownloadRequest.id.in_(batch.request_ids))
+    }
+    status_value = models.RequestStatus.approved.value if batch.action == "approve" else models.RequestStatus.rejected.value
+    now = datetime.utcnow()
+    results = []
+    for request_id in batch.request_ids:
+        req = reqs.get(request_id)
+        if not req:
+            results.append(schemas.BatchItemResult(item=request_id, status="error", detail="Request not found"))
+            continue
+        req.status = status_value
+        req.admin_id = admin.id
+        req.decision_at = now
+        if batch.action == "approve" and req.keystore:
+            req.keystore.download_allowed = True
+        webhooks.enqueue_keystore_request(db, req)
+        results.append(schemas.BatchItemResult(item=request_id, status=status_value, id=request_id))
+    db.commit()
+    return batch_result(results)
@@ -1,17 +1,22 @@
 import os
+from pathlib import Path
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.templating import Jinja2Templates
 from fastapi import Request
+from pydantic import ValidationError
+from sqlalchemy import case, func, select, true
 from sqlalchemy.orm import Session
 
-from .. import models, schemas
+from .. import models, profiling, readmodels, schemas
 from ..auth import get_current_user
+from ..bulk import batch_result, iter_records
+from ..caching import Conditional, make_etag, response_cache
 from ..config import get_settings
 from ..database import get_db
-from .keystore_routes import generate_keystore_for_app
+from ..serialization import trusted, trusted_many
+from ..templating import templates
+from .keystore_routes import generate_keystore_for_app, new_keystore
 
-router = APIRouter(prefix="/apps", tags=["apps"])
-templates = Jinja2Templates(directory="app/templates")
+router = APIRouter(prefix="/apps", tags=["apps"], route_class=profiling.ProfiledRoute)
 settings = get_settings()
 
 
@@ -28,22 +33,145 @@ def create_app_project(app: schemas.AppProjectCreate, db: Session = Depends(get_
     return db_app
 
 
+def insert_app_chunk(db: Session, chunk: list[tuple[int, schemas.AppProjectCreate]], owner_user_id: int) -> list[schemas.BatchItemResult]:
+    names = [app.package_name for _, app in chunk]
+    taken = {name for (name,) in db.query(models.AppProject.package_name).filter(models.AppProject.package_name.in_(names))}
+    results, created = [], []
+    for line_number, app in chunk:
+        if app.package_name in taken:
+            results.append(schemas.BatchItemResult(item=line_number, status="error", detail="Package name already exists"))
+            continue
+        taken.add(app.package_name)
+        db_app = models.AppProject(owner_user_id=owner_user_id, **app.dict())
+        db.add(db_app)
+        created.append((line_number, db_app))
+    try:
+        db.flush()
+        rows = [(line_number, db_app.id, db_app.name, db_app.package_name) for line_number, db_app in created]
+        db.commit()
+    except Exception as exc:  # noqa: BLE001
+        db.rollback()
+        return results + _chunk_failed(created, exc)
+    # keytool runs once per app, so it runs after the apps commit rather than while their rows are locked.
+    keystores = []
+    try:
+        for _, app_id, name, package_name in rows:
+            keystores.append(new_keystore(app_id, name, package_name))
+        db.add_all(keystores)
+        db.commit()
+    except Exception as exc:  # noqa: BLE001
+        db.rollback()
+        for keystore in keystores:
+            Path(keystore.keystore_path).unlink(missing_ok=True)
+        # An app without a keystore can never be built, so the chunk's apps are removed again.
+        db.query(models.AppProject).filter(models.AppProject.id.in_([app_id for _, app_id, _, _ in rows])).delete(
+            synchronize_session=False
+        )
+        db.commit()
+        return results + _chunk_failed(created, exc)
+    return results + [schemas.BatchItemResult(item=line_number, status="created", id=app_id) for line_number, app_id, _, _ in rows]
+
+
+def _chunk_failed(created: list, exc: Exception) -> list[schemas.BatchItemResult]:
+    return [
+        schemas.BatchItemResult(item=line_number, status="error", detail=f"Chunk failed: {exc.__class__.__name__}")
+        for line_number, _ in created
+    ]
+
+
+@router.post("/import", response_model=schemas.BatchResult)
+async def import_apps(request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    owner_user_id = current_user.id
+    results: list[schemas.BatchItemResult] = []
+    chunk: list[tuple[int, schemas.AppProjectCreate]] = []
+    async for line_number, record, error in iter_records(request):
+        if error is None:
+            try:
+                chunk.append((line_number, schemas.AppProjectCreate.parse_obj(record)))
+            except ValidationError as exc:
+                error = "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors())
+        if error is not None:
+            results.append(schemas.BatchItemResult(item=line_number, status="error", detail=error))
+        if len(chunk) >= settings.bulk_chunk_size:
+            results.extend(await profiling.in_threadpool(insert_app_chunk, db, chunk, owner_user_id))
+            chunk = []
+    if chunk:
+        results.extend(await profiling.in_threadpool(insert_app_chunk, db, chunk, owner_user_id))
+    results.sort(key=lambda result: result.item)
+    return batch_result(results)
+
+
+def app_list_validator(db: Session, owner_user_id):
+    def scoped(stmt):
+        if owner_user_id is None:
+            return stmt
+        return stmt.where(models.AppProject.owner_user_id == owner_user_id)
+
+    apps = scoped(
+        select(func.count(models.AppProject.id), func.max(models.AppProject.updated_at), func.sum(models.AppProject.version))
+    ).subquery()
+    builds = scoped(
+        select(func.count(models.BuildJob.id), func.max(models.BuildJob.updated_at), func.sum(models.BuildJob.version)).join(
+            models.AppProject, models.BuildJob.app_project_id == models.AppProject.id
+        )
+    ).subquery()
+    keystores = scoped(
+        select(
+            func.count(models.Keystore.id),
+            func.sum(case((models.Keystore.download_allowed.is_(True), 1), else_=0)),
+        ).join(
+            models.AppProject, models.Keystore.app_project_id == models.AppProject.id
+        )
+    ).subquery()
+    joined = apps.join(builds, true()).join(keystores, true())
+    return tuple(db.execute(select(apps, builds, keystores).select_from(joined)).one())
+
+
+def app_detail_validator(db: Session, app_id: int):
+    return (
+        db.query(
+            models.AppProject.owner_user_id,
+            models.AppProject.updated_at,
+            models.Keystore.id,
+            models.Keystore.download_allowed,
+            func.count(models.BuildJob.id),
+            func.max(models.BuildJob.updated_at),
+            models.AppProject.version,
+            func.sum(models.BuildJob.version),
+        )
+        .outerjoin(models.Keystore, models.Keystore.app_project_id == models.AppProject.id)
+        .outerjoin(models.BuildJob, models.BuildJob.app_project_id == models.AppProject.id)
+        .filter(models.AppProject.id == app_id)
+        .group_by(models.AppProject.id, models.Keystore.id)
+        .first()
+    )
+
+
 @router.get("", response_model=list[schemas.AppProjectDetail])
-def list_apps(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    query = db.query(models.AppProject)
-    if current_user.role != models.UserRole.admin.value:
-        query = query.filter(models.AppProject.owner_user_id == current_user.id)
-    return query.all()
+def list_apps(request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    owner_user_id = None if current_user.role == models.UserRole.admin.value else current_user.id
+    validator = app_list_validator(db, owner_user_id)
+    last_modified = max((value for value in (validator[1], validator[4]) if value), default=None)
+    conditional = Conditional(request, current_user.id, make_etag("apps", owner_user_id, *validator), last_modified)
+    cached = conditional.cached_response()
+    if cached is not None:
+        return cached
+    return conditional.respond(trusted_many(schemas.AppProjectDetail, readmodels.list_apps(db, owner_user_id)))
 
 
 @router.get("/{app_id}", response_model=schemas.AppProjectDetail)
-def get_app_detail(app_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    app_project = db.get(models.AppProject, app_id)
-    if not app_project:
+def get_app_detail(app_id: int, request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    validator = app_detail_validator(db, app_id)
+    if not validator:
         raise HTTPException(status_code=404, detail="Not found")
-    if current_user.role != models.UserRole.admin.value and app_project.owner_user_id != current_user.id:
+    if current_user.role != models.UserRole.admin.value and validator[0] != current_user.id:
         raise HTTPException(status_code=403, detail="Forbidden")
-    return app_project
+    last_modified = max((value for value in (validator[1], validator[5]) if value), default=None)
+    conditional = Conditional(request, current_user.id, make_etag("app", app_id, *validator), last_modified)
+    cached = conditional.cached_response()
+    if cached is not None:
+        return cached
+    return conditional.respond(trusted(schemas.AppProjectDetail, readmodels.get_app(db, app_id)))
 
 
 @router.put("/{app_id}", response_model=schemas.AppProjectDetail)
@@ -56,6 +184,7 @@ def update_app(app_id: int, update: schemas.AppProjectUpdate, db: Session = Depe
     for field, value in update.dict(exclude_unset=True).items():
         setattr(app_project, field, value)
     db.commit()
+    response_cache.invalidate_user(app_project.owner_user_id)
     db.refresh(app_project)
     return app_project
 
@@ -74,12 +203,13 @@ def upload_icon(app_id: int, file: UploadFile = File(...), db: Session = Depends
         f.write(file.file.read())
     app_project.icon_path = path
     db.commit()
+    response_cache.invalidate_user(app_project.owner_user_id)
     return {"icon_path": path}
 
 
 @router.get("/{app_id}/view")
 def view_app(app_id: int, request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    app_project = db.get(models.AppProject, app_id)
+    app_project = readmodels.get_app(db, app_id)
     if not app_project:
         raise HTTPException(status_code=404, detail="Not found")
     if current_user.role != models.UserRole.admin.value and app_project.owner_user_id != current_user.id:
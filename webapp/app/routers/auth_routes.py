@@ -3,16 +3,15 @@ from fastapi import APIRouter, Depends, HTTPException, status, Form
 from fastapi.responses import JSONResponse, RedirectResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from fastapi.templating import Jinja2Templates
 from fastapi import Request
 
-from .. import models, schemas
+from .. import models, profiling, schemas
 from ..auth import create_access_token, get_password_hash, verify_password
 from ..database import get_db
+from ..ratelimit import check_auth_rate_limit
+from ..templating import templates
 
-router = APIRouter(prefix="/auth", tags=["auth"])
-
-templates = Jinja2Templates(directory="app/templates")
+router = APIRouter(prefix="/auth", tags=["auth"], route_class=profiling.ProfiledRoute)
 
 
 @router.get("/login")
@@ -26,7 +25,8 @@ def register_page(request: Request):
 
 
 @router.post("/register", response_model=schemas.UserOut)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+def register_user(user: schemas.UserCreate, request: Request, db: Session = Depends(get_db)):
+    check_auth_rate_limit(request)
     existing = db.query(models.User).filter(models.User.email == user.email).first()
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
@@ -39,7 +39,8 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    check_auth_rate_limit(request, form_data.username)
     user = db.query(models.User).filter(models.User.email == form_data.username).first()
     if not user or not verify_password(form_data.password, user.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password")
@@ -49,7 +50,8 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
 
 
 @router.post("/login/form")
-def login_form(email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
+def login_form(request: Request, email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
+    check_auth_rate_limit(request, email)
     user = db.query(models.User).filter(models.User.email == email).first()
     if not user or not verify_password(password, user.password_hash):
         return JSONResponse(status_code=401, content={"detail": "Invalid credentials"})
@@ -60,7 +62,8 @@ def login_form(email: str = Form(...), password: str = Form(...), db: Session =
 
 
 @router.post("/register/form")
-def register_form(email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
+def register_form(request: Request, email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
+    check_auth_rate_limit(request)
     existing = db.query(models.User).filter(models.User.email == email).first()
     if existing:
         return JSONResponse(status_code=400, content={"detail": "Email already exists"})
@@ -1,73 +1,430 @@
+import asyncio
+import json
 import os
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Path, Query, Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.orm import Session, joinedload
 
-from .. import models, schemas
-from ..auth import get_current_user
+from .. import admission, archive, models, preflight, profiling, readmodels, schemas, signing, stats, tracing
+from ..artifacts import ensure_hot
+from ..auth import get_current_user, user_from_token
+from ..bulk import batch_result
+from ..caching import Conditional, make_etag, response_cache
 from ..config import get_settings
-from ..database import get_db
+from ..database import SessionLocal, get_db
+from ..deltas import artifact_sha256, ensure_delta
+from ..dependencies import get_token
+from ..events import TERMINAL_STATUSES, broker, build_event
+from ..serialization import FastJSONResponse, trusted, trusted_many
 
-router = APIRouter(tags=["builds"])
+router = APIRouter(tags=["builds"], route_class=profiling.ProfiledRoute)
 settings = get_settings()
+# Single-build reads fall through to the archive once a job has been moved out of build_jobs.
+BUILD_MODELS = (models.BuildJob, models.BuildJobArchive)
+
+
+def query_build(db: Session, build_id: int, columns):
+    for model in BUILD_MODELS:
+        row = (
+            db.query(*columns(model))
+            .join(models.AppProject, model.app_project_id == models.AppProject.id)
+            .filter(model.id == build_id)
+            .first()
+        )
+        if row:
+            return model, row
+    return None, None
+
+
+def get_build_with_owner(db: Session, build_id: int, include_archive: bool = True):
+    if not include_archive:
+        return (
+            db.query(models.BuildJob, models.AppProject.owner_user_id)
+            .join(models.AppProject, models.BuildJob.app_project_id == models.AppProject.id)
+            .filter(models.BuildJob.id == build_id)
+            .first()
+        ) or (None, None)
+    _, row = query_build(db, build_id, lambda model: (model, models.AppProject.owner_user_id))
+    return row or (None, None)
 
 
 @router.post("/apps/{app_id}/build", response_model=schemas.BuildJobOut)
-def create_build(app_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    app_project = db.get(models.AppProject, app_id)
+def create_build(
+    app_id: int,
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    spec: Optional[schemas.BuildSpec] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    app_project = db.get(models.AppProject, app_id, options=[joinedload(models.AppProject.keystore)])
     if not app_project:
         raise HTTPException(status_code=404, detail="App not found")
-    if current_user.role != models.UserRole.admin.value and app_project.owner_user_id != current_user.id:
+    owner_user_id = app_project.owner_user_id
+    if current_user.role != models.UserRole.admin.value and owner_user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
-    job = models.BuildJob(app_project_id=app_project.id, status=models.BuildStatus.pending.value)
+    spec = spec or schemas.BuildSpec()
+    issues = preflight.validate(app_project, app_project.keystore, spec)
+    if preflight.has_errors(issues):
+        preflight.preflight_rejections_total.inc()
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={"message": "Preflight validation failed", "issues": preflight.report(issues)},
+        )
+    queue = admission.admit(db, [app_project])
+    trace = tracing.Trace("webapp", tracing.parse_traceparent(request.headers.get("traceparent")))
+    span = trace.start_span("create_build", **{"app.id": app_project.id})
+    job = models.BuildJob(
+        app_project_id=app_project.id,
+        status=models.BuildStatus.pending.value,
+        traceparent=span.context.traceparent,
+        validation=preflight.report(issues),
+        **spec.dict(),
+    )
     db.add(job)
+    stats.record_enqueued(db, owner_user_id)
     db.commit()
+    response_cache.invalidate_user(owner_user_id)
     db.refresh(job)
+    span.attributes["build.id"] = job.id
+    trace.finish()
+    # An OTLP export can block for its whole timeout, so it runs after the response is sent.
+    background_tasks.add_task(trace.export)
+    response.headers.update(queue.headers)
+    response.headers["traceparent"] = span.context.traceparent
     return job
 
 
-@router.get("/apps/{app_id}/builds", response_model=list[schemas.BuildJobOut])
-def list_builds(app_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    app_project = db.get(models.AppProject, app_id)
+@router.post("/apps/{app_id}/build/dry-run", response_model=schemas.PreflightOut)
+def dry_run_build(
+    app_id: int,
+    spec: Optional[schemas.BuildSpec] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    app_project = db.get(models.AppProject, app_id, options=[joinedload(models.AppProject.keystore)])
     if not app_project:
         raise HTTPException(status_code=404, detail="App not found")
     if current_user.role != models.UserRole.admin.value and app_project.owner_user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
-    return app_project.build_jobs
+    issues, files = preflight.dry_run(app_project, app_project.keystore, spec or schemas.BuildSpec())
+    return {"ok": not preflight.has_errors(issues), "issues": preflight.report(issues), "files": sorted(files)}
+
+
+@router.post("/builds/batch", response_model=schemas.BatchResult)
+def create_builds_batch(
+    spec: schemas.BuildBatchCreate,
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    if spec.app_ids is None and spec.owner_user_id is None and not spec.package_prefix:
+        # An unfiltered batch would rebuild every visible app, for an admin the whole fleet.
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Select apps with app_ids, owner_user_id or package_prefix"
+        )
+    query = db.query(models.AppProject).options(joinedload(models.AppProject.keystore))
+    if current_user.role != models.UserRole.admin.value:
+        query = query.filter(models.AppProject.owner_user_id == current_user.id)
+    if spec.owner_user_id is not None:
+        query = query.filter(models.AppProject.owner_user_id == spec.owner_user_id)
+    if spec.app_ids is not None:
+        query = query.filter(models.AppProject.id.in_(spec.app_ids))
+    if spec.package_prefix:
+        query = query.filter(models.AppProject.package_name.startswith(spec.package_prefix, autoescape=True))
+    apps = query.order_by(models.AppProject.id).all()
+    matched = {app_project.id for app_project in apps}
+    results = [
+        schemas.BatchItemResult(item=app_id, status="error", detail="App not found")
+        for app_id in (spec.app_ids or [])
+        if app_id not in matched
+    ]
+    admitted = []
+    validations = {}
+    for app_project in apps:
+        issues = preflight.validate(app_project, app_project.keystore, spec.spec)
+        if preflight.has_errors(issues):
+            preflight.preflight_rejections_total.inc()
+            results.append(
+                schemas.BatchItemResult(item=app_project.id, status="error", detail=f"Preflight failed: {preflight.summary(issues)}")
+            )
+            continue
+        admitted.append(app_project)
+        validations[app_project.id] = preflight.report(issues)
+    if admitted:
+        admission.admit(db, admitted)
+        owners = Counter(app_project.owner_user_id for app_project in admitted)
+        trace = tracing.Trace("webapp", tracing.parse_traceparent(request.headers.get("traceparent")))
+        span = trace.start_span("create_builds_batch", **{"build.count": len(admitted)})
+        now = datetime.utcnow()
+        jobs = [
+            models.BuildJob(
+                app_project_id=app_project.id,
+                status=models.BuildStatus.pending.value,
+                created_at=now,
+                updated_at=now,
+                traceparent=span.context.traceparent,
+                validation=validations[app_project.id],
+                **spec.spec.dict(),
+            )
+            for app_project in admitted
+        ]
+        db.add_all(jobs)
+        # The flush reads each job's id back from its insert.
+        db.flush()
+        for owner_user_id, count in owners.items():
+            stats.record_enqueued(db, owner_user_id, count, now)
+        results.extend(schemas.BatchItemResult(item=job.app_project_id, status="enqueued", id=job.id) for job in jobs)
+        db.commit()
+        trace.finish()
+        background_tasks.add_task(trace.export)
+        response.headers["traceparent"] = span.context.traceparent
+    return batch_result(results)
+
+
+@router.get("/apps/{app_id}/builds", response_model=list[schemas.BuildJobOut])
+def list_builds(app_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    owner_user_id = db.query(models.AppProject.owner_user_id).filter(models.AppProject.id == app_id).scalar()
+    if owner_user_id is None:
+        raise HTTPException(status_code=404, detail="App not found")
+    if current_user.role != models.UserRole.admin.value and owner_user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return FastJSONResponse(trusted_many(schemas.BuildJobOut, readmodels.list_builds(db, app_id)))
 
 
 @router.get("/builds/{build_id}", response_model=schemas.BuildJobOut)
-def get_build(build_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    build = db.get(models.BuildJob, build_id)
+def get_build(build_id: int, request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    model, validator = query_build(
+        db, build_id, lambda model: (models.AppProject.owner_user_id, model.updated_at, model.status, model.stage, model.version)
+    )
+    if not validator:
+        raise HTTPException(status_code=404, detail="Build not found")
+    if current_user.role != models.UserRole.admin.value and validator[0] != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    conditional = Conditional(request, current_user.id, make_etag("build", build_id, *validator[1:]), validator[1])
+    cached = conditional.cached_response()
+    if cached is not None:
+        return cached
+    return conditional.respond(trusted(schemas.BuildJobOut, readmodels.get_build(db, model, build_id)))
+
+
+@router.get("/builds/{build_id}/trace", response_model=schemas.BuildTraceOut)
+def get_build_trace(build_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    _, row = query_build(db, build_id, lambda model: (models.AppProject.owner_user_id, model.traceparent, model.trace_spans))
+    if not row:
+        raise HTTPException(status_code=404, detail="Build not found")
+    owner_user_id, traceparent, spans = row
+    if current_user.role != models.UserRole.admin.value and owner_user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    context = tracing.parse_traceparent(traceparent)
+    return {"build_id": build_id, "trace_id": context.trace_id if context else None, "spans": spans or []}
+
+
+def authorize_build_events(build_id: int, token: Optional[str]) -> dict:
+    # Authorize in a short-lived session so the stream does not pin a pooled connection.
+    with SessionLocal() as db:
+        current_user = user_from_token(db, token) if token else None
+        if current_user is None:
+            raise HTTPException(status_code=401, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+        build, owner_user_id = get_build_with_owner(db, build_id)
+        if not build:
+            raise HTTPException(status_code=404, detail="Build not found")
+        if current_user.role != models.UserRole.admin.value and owner_user_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Not authorized")
+        return build_event(build, owner_user_id)
+
+
+def socket_channel(token: Optional[str]) -> tuple[bool, Optional[int]]:
+    with SessionLocal() as db:
+        user = user_from_token(db, token) if token else None
+        if user is None:
+            return False, None
+        return True, None if user.role == models.UserRole.admin.value else user.id
+
+
+@router.get("/builds/{build_id}/events")
+async def build_events(build_id: int, request: Request, token: Optional[str] = Depends(get_token)):
+    # The database reads are blocking, so they run in the threadpool rather than on the event loop.
+    initial = await profiling.in_threadpool(authorize_build_events, build_id, token)
+
+    async def stream():
+        queue = broker.subscribe_build(build_id)
+        try:
+            event = initial
+            while True:
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"event: status\ndata: {json.dumps(event)}\n\n"
+                    if event["status"] in TERMINAL_STATUSES:
+                        return
+                if await request.is_disconnected():
+                    return
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    event = None
+        finally:
+            broker.unsubscribe_build(build_id, queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.websocket("/ws/builds")
+async def build_events_socket(websocket: WebSocket):
+    token = websocket.cookies.get("token") or websocket.query_params.get("token")
+    authorized, channel = await profiling.in_threadpool(socket_channel, token)
+    if not authorized:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    queue = broker.subscribe_user(channel)
+
+    async def forward():
+        while True:
+            await websocket.send_json(await queue.get())
+
+    async def receive():
+        # Clients never send anything; reading is how a disconnect on an idle channel is noticed.
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.create_task(forward()), asyncio.create_task(receive())]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+        broker.unsubscribe_user(channel, queue)
+
+
+def set_released(build_id: int, released: bool, db: Session, current_user: models.User) -> models.BuildJob:
+    build, owner_user_id = get_build_with_owner(db, build_id, include_archive=False)
     if not build:
         raise HTTPException(status_code=404, detail="Build not found")
-    app_project = db.get(models.AppProject, build.app_project_id)
-    if current_user.role != models.UserRole.admin.value and app_project.owner_user_id != current_user.id:
+    if current_user.role != models.UserRole.admin.value and owner_user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
+    if build.status != models.BuildStatus.success.value:
+        raise HTTPException(status_code=400, detail="Build not successful")
+    build.released = released
+    db.commit()
+    db.refresh(build)
+    response_cache.invalidate_user(owner_user_id)
     return build
 
 
+@router.post("/builds/{build_id}/release", response_model=schemas.BuildJobOut)
+def release_build(build_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    return set_released(build_id, True, db, current_user)
+
+
+@router.delete("/builds/{build_id}/release", response_model=schemas.BuildJobOut)
+def unrelease_build(build_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    return set_released(build_id, False, db, current_user)
+
+
+def artifact_path(build: models.BuildJob, kind: str, abi: Optional[str]) -> Optional[str]:
+    path = getattr(build, f"{kind}_path")
+    if abi is None or not path:
+        return path
+    if abi not in (build.abi_splits or []):
+        return None
+    return os.path.join(os.path.dirname(path), f"app-{abi}.apk")
+
+
+def artifact_response(build: models.BuildJob, kind: str, from_build_id: Optional[int], db: Session, abi: Optional[str] = None) -> FileResponse:
+    path = artifact_path(build, kind, abi)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"No {abi} split for this build")
+    if not ensure_hot(path):
+        raise HTTPException(status_code=410, detail="Artifact has been evicted")
+    if from_build_id is None:
+        return FileResponse(path, filename=os.path.basename(path), headers={"X-Checksum-SHA256": artifact_sha256(path)})
+    base = archive.find_build(db, from_build_id)
+    base_path = artifact_path(base, kind, abi) if base else None
+    if not base or base.app_project_id != build.app_project_id or base.status != models.BuildStatus.success.value or not base_path:
+        raise HTTPException(status_code=404, detail="Base build not found")
+    ensure_hot(base_path)
+    delta_path = ensure_delta(base_path, base.id, path)
+    if delta_path is None:
+        raise HTTPException(status_code=404, detail="Artifacts no longer available")
+    return FileResponse(
+        delta_path,
+        media_type="application/octet-stream",
+        filename=f"build-{base.id}-to-{build.id}.{kind}.delta",
+        headers={
+            "X-Delta-Base-Build": str(base.id),
+            "X-Delta-Base-SHA256": artifact_sha256(base_path),
+            "X-Checksum-SHA256": artifact_sha256(path),
+            "X-Delta-SHA256": artifact_sha256(str(delta_path)),
+        },
+    )
+
+
 @router.get("/builds/{build_id}/download/apk")
-def download_apk(build_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    build = db.get(models.BuildJob, build_id)
+def download_apk(
+    build_id: int,
+    from_build_id: Optional[int] = Query(None, alias="from"),
+    abi: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    build, owner_user_id = get_build_with_owner(db, build_id)
     if not build or not build.apk_path:
         raise HTTPException(status_code=404, detail="APK not found")
-    app_project = db.get(models.AppProject, build.app_project_id)
-    if current_user.role != models.UserRole.admin.value and app_project.owner_user_id != current_user.id:
+    if current_user.role != models.UserRole.admin.value and owner_user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
     if build.status != models.BuildStatus.success.value:
         raise HTTPException(status_code=400, detail="Build not successful")
-    return FileResponse(build.apk_path, filename=os.path.basename(build.apk_path))
+    return artifact_response(build, "apk", from_build_id, db, abi)
 
 
 @router.get("/builds/{build_id}/download/aab")
-def download_aab(build_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    build = db.get(models.BuildJob, build_id)
+def download_aab(
+    build_id: int,
+    from_build_id: Optional[int] = Query(None, alias="from"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    build, owner_user_id = get_build_with_owner(db, build_id)
     if not build or not build.aab_path:
         raise HTTPException(status_code=404, detail="AAB not found")
-    app_project = db.get(models.AppProject, build.app_project_id)
-    if current_user.role != models.UserRole.admin.value and app_project.owner_user_id != current_user.id:
+    if current_user.role != models.UserRole.admin.value and owner_user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if build.status != models.BuildStatus.success.value:
+        raise HTTPException(status_code=400, detail="Build not successful")
+    return artifact_response(build, "aab", from_build_id, db)
+
+
+@router.post("/builds/{build_id}/download/{kind}/sign", response_model=schemas.SignedURLOut)
+def sign_download(
+    build_id: int,
+    request: Request,
+    kind: str = Path(..., regex="^(apk|aab)$"),
+    abi: Optional[str] = None,
+    options: Optional[schemas.SignedURLCreate] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    build, owner_user_id = get_build_with_owner(db, build_id)
+    if not build or not getattr(build, f"{kind}_path"):
+        raise HTTPException(status_code=404, detail=f"{kind.upper()} not found")
+    if current_user.role != models.UserRole.admin.value and owner_user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
     if build.status != models.BuildStatus.success.value:
         raise HTTPException(status_code=400, detail="Build not successful")
-    return FileResponse(build.aab_path, filename=os.path.basename(build.aab_path))
+    path = artifact_path(build, kind, abi if kind == "apk" else None)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"No {abi} split for this build")
+    options = options or schemas.SignedURLCreate()
+    return signing.sign("artifacts", path, str(request.base_url), options.ttl_seconds, options.single_use)
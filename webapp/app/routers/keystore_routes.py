@@ -2,27 +2,38 @@ import os
 import secrets
 import subprocess
 from pathlib import Path
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 
-from .. import models, schemas
+from .. import models, profiling, schemas, signing
 from ..auth import get_current_user
+from ..caching import Conditional, make_etag
 from ..config import get_settings
 from ..database import get_db
 
-router = APIRouter(prefix="/apps", tags=["keystore"])
+router = APIRouter(prefix="/apps", tags=["keystore"], route_class=profiling.ProfiledRoute)
 settings = get_settings()
 
 
 def generate_keystore_for_app(app_project: models.AppProject, db: Session) -> models.Keystore:
+    keystore = new_keystore(app_project.id, app_project.name, app_project.package_name)
+    db.add(keystore)
+    db.commit()
+    db.refresh(keystore)
+    return keystore
+
+
+def new_keystore(app_id: int, name: str, package_name: str) -> models.Keystore:
+    # Runs keytool and returns the unsaved row; the caller owns the file if the row is never committed.
     os.makedirs(settings.keystore_dir, exist_ok=True)
-    alias = f"{app_project.package_name}.alias"
+    alias = f"{package_name}.alias"
     store_password = secrets.token_urlsafe(12)
     key_password = secrets.token_urlsafe(12)
-    keystore_filename = f"{app_project.id}_{secrets.token_hex(4)}.keystore"
+    keystore_filename = f"{app_id}_{secrets.token_hex(4)}.keystore"
     keystore_path = os.path.join(settings.keystore_dir, keystore_filename)
-    dname = f"CN={app_project.name}, OU=AppGen, O=AppGen, L=Remote, S=Remote, C=US"
+    dname = f"CN={name}, OU=AppGen, O=AppGen, L=Remote, S=Remote, C=US"
 
     try:
         subprocess.run(
@@ -53,22 +64,18 @@ def generate_keystore_for_app(app_project: models.AppProject, db: Session) -> mo
         )
     except Exception:
         Path(keystore_path).write_text("Failed to invoke keytool; placeholder keystore created.\n")
-    keystore = models.Keystore(
-        app_project_id=app_project.id,
+    return models.Keystore(
+        app_project_id=app_id,
         keystore_path=keystore_path,
         alias=alias,
         store_password=store_password,
         key_password=key_password,
     )
-    db.add(keystore)
-    db.commit()
-    db.refresh(keystore)
-    return keystore
 
 
 @router.get("/{app_id}/keystore", response_model=schemas.KeystoreMeta)
-def get_keystore_metadata(app_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    app_project = db.get(models.AppProject, app_id)
+def get_keystore_metadata(app_id: int, request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    app_project = db.get(models.AppProject, app_id, options=[joinedload(models.AppProject.keystore)])
     if not app_project:
         raise HTTPException(status_code=404, detail="App not found")
     if current_user.role != models.UserRole.admin.value and app_project.owner_user_id != current_user.id:
@@ -77,12 +84,19 @@ def get_keystore_metadata(app_id: int, db: Session = Depends(get_db), current_us
         keystore = generate_keystore_for_app(app_project, db)
     else:
         keystore = app_project.keystore
-    return keystore
+    # Approval flips download_allowed without touching any timestamp on the keystore, so only the ETag validates.
+    conditional = Conditional(
+        request,
+        current_user.id,
+        make_etag("keystore", keystore.id, keystore.alias, keystore.download_allowed, keystore.created_at),
+        None,
+    )
+    return conditional.cached_response() or conditional.respond(schemas.KeystoreMeta.from_orm(keystore))
 
 
 @router.post("/{app_id}/keystore/request-download", response_model=schemas.KeystoreRequestOut)
 def request_keystore_download(app_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    app_project = db.get(models.AppProject, app_id)
+    app_project = db.get(models.AppProject, app_id, options=[joinedload(models.AppProject.keystore)])
     if not app_project:
         raise HTTPException(status_code=404, detail="App not found")
     if current_user.role != models.UserRole.admin.value and app_project.owner_user_id != current_user.id:
@@ -101,7 +115,7 @@ def request_keystore_download(app_id: int, db: Session = Depends(get_db), curren
 
 @router.get("/{app_id}/keystore/download")
 def download_keystore(app_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    app_project = db.get(models.AppProject, app_id)
+    app_project = db.get(models.AppProject, app_id, options=[joinedload(models.AppProject.keystore)])
     if not app_project or not app_project.keystore:
         raise HTTPException(status_code=404, detail="Keystore not found")
     if app_project.owner_user_id != current_user.id:
@@ -109,3 +123,22 @@ def download_keystore(app_id: int, db: Session = Depends(get_db), current_user:
     if not app_project.keystore.download_allowed:
         raise HTTPException(status_code=403, detail="Download not approved")
     return FileResponse(app_project.keystore.keystore_path, filename=os.path.basename(app_project.keystore.keystore_path))
+
+
+@router.post("/{app_id}/keystore/download/sign", response_model=schemas.SignedURLOut)
+def sign_keystore_download(
+    app_id: int,
+    request: Request,
+    options: Optional[schemas.SignedURLCreate] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    app_project = db.get(models.AppProject, app_id, options=[joinedload(models.AppProject.keystore)])
+    if not app_project or not app_project.keystore:
+        raise HTTPException(status_code=404, detail="Keystore not found")
+    if app_project.owner_user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Only owners can download")
+    if not app_project.keystore.download_allowed:
+        raise HTTPException(status_code=403, detail="Download not approved")
+    options = options or schemas.SignedURLCreate()
+    return signing.sign("keystores", app_project.keystore.keystore_path, str(request.base_url), options.ttl_seconds, options.single_use)
@@ -0,0 +1,22 @@
+import os
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+
+from .. import profiling, signing
+from ..artifacts import ensure_hot
+from ..deltas import artifact_sha256
+
+router = APIRouter(prefix="/signed", tags=["downloads"], route_class=profiling.ProfiledRoute)
+
+
+# No session or user dependency: the signature is the authorization.
+@router.get("/{scope}/{path:path}")
+def signed_download(scope: str, path: str, expires: int, sig: str, nonce: str = "", once: bool = False):
+    full_path = signing.verify(scope, path, expires, nonce, once, sig)
+    if scope == "artifacts":
+        if not ensure_hot(full_path):
+            raise HTTPException(status_code=410, detail="Artifact has been evicted")
+        return FileResponse(full_path, filename=os.path.basename(full_path), headers={"X-Checksum-SHA256": artifact_sha256(full_path)})
+    if not os.path.isfile(full_path):
+        raise HTTPException(status_code=404, detail="Keystore not found")
+    return FileResponse(full_path, filename=os.path.basename(full_path))
@@ -0,0 +1,111 @@
+import secrets
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from .. import models, profiling, schemas, webhooks
+from ..auth import get_current_user
+from ..database import get_db
+
+router = APIRouter(prefix="/webhooks", tags=["webhooks"], route_class=profiling.ProfiledRoute)
+
+
+def get_subscription(subscription_id: int, db: Session, current_user: models.User) -> models.WebhookSubscription:
+    subscription = db.get(models.WebhookSubscription, subscription_id)
+    if not subscription or subscription.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Webhook not found")
+    return subscription
+
+
+@router.post("", response_model=schemas.WebhookCreated)
+def create_webhook(webhook: schemas.WebhookCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    if webhook.app_id is not None:
+        app_project = db.get(models.AppProject, webhook.app_id)
+        if not app_project:
+            raise HTTPException(status_code=404, detail="App not found")
+        if app_project.owner_user_id != current_user.id:
+            raise HTTPException(status_code=403, detail="Not authorized")
+    error = webhooks.check_url(webhook.url)
+    if error is not None:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=error)
+    subscription = models.WebhookSubscription(
+        user_id=current_user.id,
+        app_project_id=webhook.app_id,
+        url=webhook.url,
+        secret=secrets.token_hex(32),
+        events=sorted(set(webhook.events)),
+    )
+    db.add(subscription)
+    db.commit()
+    db.refresh(subscription)
+    # The secret is only returned once; receivers use it to check the X-Webhook-Signature header.
+    return schemas.WebhookCreated(**schemas.WebhookOut.from_orm(subscription).dict(), secret=subscription.secret)
+
+
+@router.get("", response_model=list[schemas.WebhookOut])
+def list_webhooks(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    return db.query(models.WebhookSubscription).filter(models.WebhookSubscription.user_id == current_user.id).all()
+
+
+@router.delete("/{subscription_id}")
+def delete_webhook(subscription_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    subscription = get_subscription(subscription_id, db, current_user)
+    # Deactivate rather than delete so delivery history and dead letters stay inspectable.
+    subscription.active = False
+    db.query(models.WebhookDelivery).filter(
+        models.WebhookDelivery.subscription_id == subscription.id,
+        models.WebhookDelivery.status == models.WebhookStatus.pending.value,
+    ).update({models.WebhookDelivery.status: models.WebhookStatus.dead.value, models.WebhookDelivery.last_error: "Subscription deleted"})
+    db.commit()
+    return {"status": "deleted"}
+
+
+@router.get("/{subscription_id}/dead-letters", response_model=list[schemas.WebhookDeliveryOut])
+def list_dead_letters(subscription_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    subscription = get_subscription(subscription_id, db, current_user)
+    rows = (
+        db.query(models.WebhookDelivery, models.WebhookEvent)
+        .join(models.WebhookEvent, models.WebhookEvent.id == models.WebhookDelivery.event_id)
+        .filter(
+            models.WebhookDelivery.subscription_id == subscription.id,
+            models.WebhookDelivery.status == models.WebhookStatus.dead.value,
+        )
+        .order_by(models.WebhookDelivery.id)
+    )
+    return [
+        schemas.WebhookDeliveryOut(
+            id=delivery.id,
+            event_id=event.id,
+            event_type=event.event_type,
+            payload=event.payload,
+            status=delivery.status,
+            attempts=delivery.attempts,
+            last_error=delivery.last_error,
+            created_at=delivery.created_at,
+        )
+        for delivery, event in rows
+    ]
+
+
+@router.post("/{subscription_id}/dead-letters/retry")
+def retry_dead_letters(subscription_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    subscription = get_subscription(subscription_id, db, current_user)
+    if not subscription.active:
+        raise HTTPException(status_code=400, detail="Webhook has been deleted")
+    requeued = (
+        db.query(models.WebhookDelivery)
+        .filter(
+            models.WebhookDelivery.subscription_id == subscription.id,
+            models.WebhookDelivery.status == models.WebhookStatus.dead.value,
+        )
+        .update(
+            {
+                models.WebhookDelivery.status: models.WebhookStatus.pending.value,
+                models.WebhookDelivery.attempts: 0,
+                models.WebhookDelivery.next_attempt_at: datetime.utcnow(),
+            },
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return {"requeued": requeued}
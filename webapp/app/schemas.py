@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import Optional, List
-from pydantic import BaseModel, EmailStr, constr
+from pydantic import BaseModel, EmailStr, conint, constr
 
 
 class UserCreate(BaseModel):
@@ -55,20 +55,71 @@ class KeystoreMeta(BaseModel):
         orm_mode = True
 
 
+ABI = constr(regex=r"^(armeabi-v7a|arm64-v8a|x86|x86_64)$")
+
+
+class BuildSpec(BaseModel):
+    outputs: constr(regex=r"^(apk|aab|both)$") = "both"
+    variant: constr(regex=r"^(release|debug)$") = "release"
+    minify: bool = False
+    abi_splits: Optional[List[ABI]]
+
+
+class PreflightIssue(BaseModel):
+    level: str
+    field: str
+    message: str
+
+
+class PreflightOut(BaseModel):
+    ok: bool
+    issues: List[PreflightIssue]
+    files: List[str]
+
+
 class BuildJobOut(BaseModel):
     id: int
     status: str
+    stage: Optional[str]
     created_at: datetime
     updated_at: datetime
     finished_at: Optional[datetime]
     apk_path: Optional[str]
     aab_path: Optional[str]
+    released: bool = False
+    outputs: str = "both"
+    variant: str = "release"
+    minify: bool = False
+    abi_splits: Optional[List[str]]
+    builder_node: Optional[str]
+    traceparent: Optional[str]
+    validation: Optional[List[PreflightIssue]]
+    heap_mb: Optional[int]
+    max_workers: Optional[int]
+    peak_rss_bytes: Optional[int]
+    cpu_seconds: Optional[float]
     log: Optional[str]
 
     class Config:
         orm_mode = True
 
 
+class SpanOut(BaseModel):
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start: datetime
+    duration_ms: float
+    status: str
+    attributes: dict = {}
+
+
+class BuildTraceOut(BaseModel):
+    build_id: int
+    trace_id: Optional[str]
+    spans: List[SpanOut]
+
+
 class AppProjectDetail(AppProjectBase):
     id: int
     owner_user_id: int
@@ -93,3 +144,104 @@ class KeystoreRequestOut(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class BuilderNodeOut(BaseModel):
+    id: str
+    platforms: List[str]
+    gradle_versions: List[str]
+    warm_daemons: List[str]
+    current_job_id: Optional[int]
+    jobs_claimed: int
+    cache_hits: int
+    cache_misses: int
+    jobs_stolen: int
+    cache_miss_rate: float
+    slots: int = 1
+    running_jobs: int = 0
+    memory_bytes: Optional[int]
+    cpus: Optional[int]
+    started_at: datetime
+    last_seen_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
+class BuilderFleetOut(BaseModel):
+    cache_hits: int
+    cache_misses: int
+    cache_miss_rate: float
+    nodes: List[BuilderNodeOut]
+
+
+class BuildBatchCreate(BaseModel):
+    app_ids: Optional[List[int]]
+    owner_user_id: Optional[int]
+    package_prefix: Optional[str]
+    spec: BuildSpec = BuildSpec()
+
+
+class SignedURLCreate(BaseModel):
+    ttl_seconds: Optional[conint(ge=1)]
+    single_use: bool = False
+
+
+class SignedURLOut(BaseModel):
+    url: str
+    expires_at: datetime
+    single_use: bool
+
+
+class KeystoreRequestBatch(BaseModel):
+    action: constr(regex=r"^(approve|reject)$")
+    request_ids: List[int]
+
+
+class BatchItemResult(BaseModel):
+    item: int
+    status: str
+    id: Optional[int]
+    detail: Optional[str]
+
+
+class BatchResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BatchItemResult]
+
+
+WEBHOOK_EVENT = constr(regex=r"^(build\.(succeeded|failed)|keystore_request\.(approved|rejected))$")
+
+
+class WebhookCreate(BaseModel):
+    url: constr(regex=r"^https?://\S+$", max_length=1024)
+    app_id: Optional[int]
+    events: List[WEBHOOK_EVENT] = []
+
+
+class WebhookOut(BaseModel):
+    id: int
+    app_project_id: Optional[int]
+    url: str
+    events: List[str]
+    active: bool
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
+class WebhookCreated(WebhookOut):
+    secret: str
+
+
+class WebhookDeliveryOut(BaseModel):
+    id: int
+    event_id: int
+    event_type: str
+    payload: dict
+    status: str
+    attempts: int
+    last_error: Optional[str]
+    created_at: datetime
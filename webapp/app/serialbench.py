@@ -0,0 +1,127 @@
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+from . import compression, models, schemas, serialization
+
+ENDPOINTS = ("list_apps", "list_builds", "list_requests")
+
+
+def build_rows(count: int, builds_per_app: int) -> dict[str, list]:
+    # Transient ORM objects: the benchmark measures serialization only, never the database.
+    created = datetime(2024, 1, 1)
+    jobs = [
+        models.BuildJob(
+            id=i + 1,
+            app_project_id=1,
+            status=models.BuildStatus.success.value,
+            stage="collect_artifacts",
+            created_at=created + timedelta(minutes=i),
+            updated_at=created + timedelta(minutes=i, seconds=90),
+            finished_at=created + timedelta(minutes=i, seconds=90),
+            apk_path=f"/data/artifacts/{i + 1}/app-release.apk",
+            aab_path=f"/data/artifacts/{i + 1}/app-release.aab",
+            released=i % 10 == 0,
+            outputs="both",
+            variant="release",
+            minify=False,
+            abi_splits=["arm64-v8a", "x86_64"] if i % 2 else None,
+            builder_node="builder-1",
+            traceparent=f"00-{i:032x}-{i + 1:016x}-01",
+            validation=[{"level": "warning", "field": "url", "message": "Cleartext http URLs are blocked"}],
+        )
+        for i in range(count)
+    ]
+    apps = [
+        models.AppProject(
+            id=i + 1,
+            owner_user_id=1 + i % 50,
+            name=f"App {i}",
+            package_name=f"com.example.app{i}",
+            url=f"https://example.com/{i}",
+            min_sdk=21,
+            target_sdk=34,
+            version_code=i + 1,
+            version_name="1.0",
+            created_at=created,
+            updated_at=created,
+            keystore=models.Keystore(id=i + 1, alias="release", download_allowed=bool(i % 2), created_at=created),
+            build_jobs=jobs[:builds_per_app],
+        )
+        for i in range(count)
+    ]
+    requests = [
+        models.KeystoreDownloadRequest(
+            id=i + 1, keystore_id=i + 1, user_id=1 + i % 50, status=models.RequestStatus.pending.value, created_at=created
+        )
+        for i in range(count)
+    ]
+    return {"list_apps": apps, "list_builds": jobs, "list_requests": requests}
+
+
+SCHEMAS = {
+    "list_apps": schemas.AppProjectDetail,
+    "list_builds": schemas.BuildJobOut,
+    "list_requests": schemas.KeystoreRequestOut,
+}
+
+
+def before(schema, rows) -> bytes:
+    # What the endpoints did before: validate every row through from_orm, jsonable_encoder, then json.dumps.
+    content = jsonable_encoder([schema.from_orm(row) for row in rows])
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+def after(schema, rows) -> bytes:
+    return serialization.dumps(serialization.trusted_many(schema, rows))
+
+
+def timed(function, repeat: int) -> tuple[float, bytes]:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def run(rows: int, builds_per_app: int, repeat: int) -> dict:
+    fixtures = build_rows(rows, builds_per_app)
+    report = {"rows": rows, "builds_per_app": builds_per_app, "orjson": serialization.orjson is not None, "endpoints": {}}
+    per_thousand = 1000 / rows * 1000
+    for endpoint in ENDPOINTS:
+        schema, objects = SCHEMAS[endpoint], fixtures[endpoint]
+        before_seconds, old_body = timed(lambda: before(schema, objects), repeat)
+        after_seconds, new_body = timed(lambda: after(schema, objects), repeat)
+        if json.loads(old_body) != json.loads(new_body):
+            raise SystemExit(f"{endpoint}: trusted serializer output differs from the validated output")
+        entry = {
+            "before_ms_per_1000": round(before_seconds * per_thousand, 2),
+            "after_ms_per_1000": round(after_seconds * per_thousand, 2),
+            "speedup": round(before_seconds / after_seconds, 1),
+            "bytes": len(new_body),
+        }
+        for coding in compression.supported_codings():
+            seconds, compressed = timed(lambda: compression.compress(new_body, coding), repeat)
+            entry[f"{coding}_bytes"] = len(compressed)
+            entry[f"{coding}_ms_per_1000"] = round(seconds * per_thousand, 2)
+        report["endpoints"][endpoint] = entry
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Time response serialization per 1,000 rows, before and after the trusted serializers.")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--builds-per-app", type=int, default=3, help="Builds nested in each list_apps row")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the fastest is reported")
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.rows, args.builds_per_app, args.repeat), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
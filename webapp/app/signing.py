@@ -0,0 +1,97 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from datetime import datetime
+from typing import Optional
+from urllib.parse import quote, urlencode
+
+from fastapi import HTTPException
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+
+from . import models
+from .config import get_settings
+from .database import SessionLocal
+from .metrics import registry
+
+settings = get_settings()
+SCOPES = {"artifacts": settings.artifact_dir, "keystores": settings.keystore_dir}
+
+signed_issued_total = registry.counter("signed_urls_issued_total", "Signed download URLs issued")
+signed_served_total = registry.counter("signed_downloads_total", "Downloads served from signed URLs")
+signed_rejected_total = registry.counter("signed_download_rejections_total", "Signed download URLs rejected as invalid, expired or reused")
+
+
+def _secret() -> bytes:
+    # Never JWT_SECRET: this key is meant to be shared with a proxy, which must not be able to mint sessions.
+    if not settings.signed_url_secret:
+        raise HTTPException(status_code=503, detail="Signed downloads are not configured")
+    return settings.signed_url_secret.encode()
+
+
+def signature(scope: str, path: str, expires: int, nonce: str, once: bool) -> str:
+    # The message is deliberately plain text so a proxy can recompute it with the same secret.
+    message = f"/signed/{scope}/{path}\n{expires}\n{nonce}\n{int(once)}"
+    digest = hmac.new(_secret(), message.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def relative_path(scope: str, path: str) -> Optional[str]:
+    root = os.path.realpath(SCOPES[scope])
+    resolved = os.path.realpath(path)
+    if os.path.commonpath([root, resolved]) != root or resolved == root:
+        return None
+    return os.path.relpath(resolved, root).replace(os.sep, "/")
+
+
+def sign(scope: str, path: str, base_url: str, ttl_seconds: Optional[int] = None, single_use: bool = False) -> dict:
+    relative = relative_path(scope, path)
+    if relative is None:
+        raise HTTPException(status_code=409, detail="File is not served from a signable location")
+    ttl = min(ttl_seconds or settings.signed_url_ttl_seconds, settings.signed_url_max_ttl_seconds)
+    expires = int(time.time()) + ttl
+    nonce = secrets.token_hex(8) if single_use else ""
+    query = {"expires": expires, "sig": signature(scope, relative, expires, nonce, single_use)}
+    if single_use:
+        query.update(nonce=nonce, once=1)
+    signed_issued_total.inc()
+    return {
+        "url": f"{(settings.signed_url_base or base_url).rstrip('/')}/signed/{scope}/{quote(relative)}?{urlencode(query)}",
+        "expires_at": datetime.utcfromtimestamp(expires),
+        "single_use": single_use,
+    }
+
+
+def _reject(status_code: int, detail: str) -> HTTPException:
+    signed_rejected_total.inc()
+    return HTTPException(status_code=status_code, detail=detail)
+
+
+def verify(scope: str, path: str, expires: int, nonce: str, once: bool, sig: str) -> str:
+    if scope not in SCOPES or not hmac.compare_digest(sig.encode(), signature(scope, path, expires, nonce, once).encode()):
+        raise _reject(403, "Invalid signature")
+    if expires < time.time():
+        raise _reject(410, "Link has expired")
+    full_path = os.path.join(SCOPES[scope], path)
+    if relative_path(scope, full_path) != path:
+        raise _reject(403, "Invalid signature")
+    if once:
+        consume(nonce, expires)
+    signed_served_total.inc()
+    return full_path
+
+
+def consume(nonce: str, expires: int) -> None:
+    # Single-use links are the only signed downloads that touch the database.
+    with SessionLocal() as db:
+        db.add(models.UsedDownloadNonce(nonce=nonce, expires_at=datetime.utcfromtimestamp(expires)))
+        try:
+            db.flush()
+        except IntegrityError:
+            db.rollback()
+            raise _reject(410, "Link has already been used")
+        db.execute(delete(models.UsedDownloadNonce).where(models.UsedDownloadNonce.expires_at < datetime.utcnow()))
+        db.commit()
@@ -0,0 +1,279 @@
+import argparse
+import itertools
+import random
+import sys
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, insert
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+
+DURATION_BUCKETS = (15, 30, 60, 90, 120, 180, 240, 300, 450, 600, 900, 1200, 1800, 2700, 3600)
+COUNTERS = ("enqueued", "started", "succeeded", "failed", "duration_count", "duration_sum")
+# Shard rows per fleet counter. Reads sum every shard, so the number can be changed at any time.
+STAT_SHARDS = 16
+
+
+def _upsert(db: Session, model, keys: dict, deltas: dict) -> None:
+    table = model.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(table).values(**keys, **deltas)
+        stmt = stmt.on_duplicate_key_update({column: table.c[column] + value for column, value in deltas.items()})
+    else:
+        module = postgresql if dialect == "postgresql" else sqlite
+        stmt = module.insert(table).values(**keys, **deltas).on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: table.c[column] + value for column, value in deltas.items()},
+        )
+    db.execute(stmt)
+
+
+def _bump(db: Session, day: date, user_id: int, **deltas) -> None:
+    _upsert(db, models.BuildStatsDaily, {"day": day, "user_id": user_id}, deltas)
+    _upsert(db, models.BuildStatsFleetDaily, {"day": day, "shard": random.randrange(STAT_SHARDS)}, deltas)
+
+
+def _move(db: Session, **deltas) -> None:
+    for status, delta in deltas.items():
+        _upsert(db, models.BuildStatusCount, {"status": status, "shard": random.randrange(STAT_SHARDS)}, {"count": delta})
+
+
+def bucket_for(seconds: float) -> int:
+    return bisect_left(DURATION_BUCKETS, seconds)
+
+
+def record_enqueued(db: Session, owner_user_id: int, count: int = 1, at: Optional[datetime] = None) -> None:
+    _bump(db, (at or datetime.utcnow()).date(), owner_user_id, enqueued=count)
+    _move(db, pending=count)
+
+
+def record_started(db: Session, owner_user_id: int, at: Optional[datetime] = None) -> None:
+    _bump(db, (at or datetime.utcnow()).date(), owner_user_id, started=1)
+    _move(db, pending=-1, running=1)
+
+
+def record_finished(db: Session, owner_user_id: int, status: str, started_at: Optional[datetime], finished_at: datetime) -> None:
+    day = finished_at.date()
+    if status == models.BuildStatus.success.value and started_at is not None:
+        duration = (finished_at - started_at).total_seconds()
+        _bump(db, day, owner_user_id, succeeded=1, duration_count=1, duration_sum=duration)
+        bucket = bucket_for(duration)
+        _upsert(db, models.BuildDurationBucket, {"day": day, "user_id": owner_user_id, "bucket": bucket}, {"count": 1})
+        _upsert(
+            db,
+            models.BuildFleetDurationBucket,
+            {"day": day, "shard": random.randrange(STAT_SHARDS), "bucket": bucket},
+            {"count": 1},
+        )
+    else:
+        _bump(db, day, owner_user_id, **{"succeeded" if status == models.BuildStatus.success.value else "failed": 1})
+    _move(db, running=-1, **{status: 1})
+
+
+def status_counts(db: Session) -> dict[str, int]:
+    # Archived jobs keep counting under their final status.
+    rows = db.query(models.BuildStatusCount.status, func.sum(models.BuildStatusCount.count)).group_by(models.BuildStatusCount.status)
+    return {status: int(count) for status, count in rows}
+
+
+def _counters(values) -> dict:
+    # SUM() comes back as Decimal on MySQL.
+    return {name: float(value or 0) if name == "duration_sum" else int(value or 0) for name, value in zip(COUNTERS, values)}
+
+
+def quantile(buckets: dict[int, int], q: float) -> Optional[float]:
+    total = sum(buckets.values())
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for bucket in sorted(buckets):
+        count = buckets[bucket]
+        if seen + count >= rank:
+            lower = DURATION_BUCKETS[bucket - 1] if bucket else 0
+            if bucket >= len(DURATION_BUCKETS):
+                return float(lower)
+            return lower + (DURATION_BUCKETS[bucket] - lower) * (rank - seen) / count
+        seen += count
+    return float(DURATION_BUCKETS[-1])
+
+
+def _row_summary(counters: dict, buckets: dict[int, int]) -> dict:
+    finished = counters["succeeded"] + counters["failed"]
+    return {
+        "enqueued": counters["enqueued"],
+        "started": counters["started"],
+        "succeeded": counters["succeeded"],
+        "failed": counters["failed"],
+        "success_rate": round(counters["succeeded"] / finished, 4) if finished else None,
+        "duration_mean_seconds": round(counters["duration_sum"] / counters["duration_count"], 1) if counters["duration_count"] else None,
+        "duration_p50_seconds": _rounded(quantile(buckets, 0.5)),
+        "duration_p95_seconds": _rounded(quantile(buckets, 0.95)),
+    }
+
+
+def _rounded(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+
+def _empty_counters() -> dict:
+    return {name: 0 for name in COUNTERS}
+
+
+def summary(db: Session, days: int = 14, user_id: Optional[int] = None, top_users: int = 20) -> dict:
+    start = datetime.utcnow().date() - timedelta(days=days - 1)
+    queue = status_counts(db)
+
+    # One user's rows, or the fleet's shard rows: either way a bounded number of rows per day.
+    daily_model = models.BuildStatsDaily if user_id is not None else models.BuildStatsFleetDaily
+    bucket_model = models.BuildDurationBucket if user_id is not None else models.BuildFleetDurationBucket
+    rows = db.query(daily_model.day, *(func.sum(getattr(daily_model, name)) for name in COUNTERS)).filter(daily_model.day >= start)
+    bucket_rows = db.query(bucket_model.day, bucket_model.bucket, func.sum(bucket_model.count)).filter(bucket_model.day >= start)
+    if user_id is not None:
+        rows = rows.filter(models.BuildStatsDaily.user_id == user_id)
+        bucket_rows = bucket_rows.filter(models.BuildDurationBucket.user_id == user_id)
+    daily: dict[date, dict] = defaultdict(_empty_counters)
+    for day, *values in rows.group_by(daily_model.day):
+        daily[day] = _counters(values)
+    daily_buckets: dict[date, dict[int, int]] = defaultdict(dict)
+    for day, bucket, count in bucket_rows.group_by(bucket_model.day, bucket_model.bucket):
+        daily_buckets[day][bucket] = int(count)
+
+    window = _empty_counters()
+    window_buckets: dict[int, int] = defaultdict(int)
+    day_rows = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        counters = daily[day]
+        for name in COUNTERS:
+            window[name] += counters[name]
+        for bucket, count in daily_buckets[day].items():
+            window_buckets[bucket] += count
+        day_rows.append({"day": day.isoformat(), **_row_summary(counters, daily_buckets[day])})
+
+    result = {
+        "queue": {
+            "pending": queue.get(models.BuildStatus.pending.value, 0),
+            "running": queue.get(models.BuildStatus.running.value, 0),
+        },
+        "status_totals": queue,
+        "window_days": days,
+        "user_id": user_id,
+        "window": _row_summary(window, window_buckets),
+        "days": day_rows,
+    }
+    if user_id is None:
+        result["users"] = user_summaries(db, start, top_users)
+    return result
+
+
+def user_summaries(db: Session, start: date, limit: int) -> list[dict]:
+    # Ranked in the database; only the top users' totals come back.
+    enqueued = func.sum(models.BuildStatsDaily.enqueued)
+    rows = (
+        db.query(models.BuildStatsDaily.user_id, *(func.sum(getattr(models.BuildStatsDaily, name)) for name in COUNTERS))
+        .filter(models.BuildStatsDaily.day >= start)
+        .group_by(models.BuildStatsDaily.user_id)
+        .order_by(enqueued.desc(), models.BuildStatsDaily.user_id)
+        .limit(limit)
+    )
+    per_user = {user_id: _counters(values) for user_id, *values in rows}
+    top = list(per_user)
+    buckets: dict[int, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    if top:
+        for user_id, bucket, count in db.query(
+            models.BuildDurationBucket.user_id, models.BuildDurationBucket.bucket, models.BuildDurationBucket.count
+        ).filter(models.BuildDurationBucket.user_id.in_(top), models.BuildDurationBucket.day >= start):
+            buckets[user_id][bucket] += count
+    emails = dict(db.query(models.User.id, models.User.email).filter(models.User.id.in_(top))) if top else {}
+    return [
+        {"user_id": user_id, "email": emails.get(user_id), **_row_summary(per_user[user_id], buckets[user_id])}
+        for user_id in top
+    ]
+
+
+def rebuild(db: Session) -> int:
+    daily: dict[tuple[date, int], dict] = defaultdict(_empty_counters)
+    buckets: dict[tuple[date, int, int], int] = defaultdict(int)
+    statuses: dict[str, int] = defaultdict(int)
+    rows = itertools.chain.from_iterable(
+        db.query(model.app_project_id, model.status, model.created_at, model.started_at, model.finished_at).yield_per(5000)
+        for model in (models.BuildJob, models.BuildJobArchive)
+    )
+    owners = dict(db.query(models.AppProject.id, models.AppProject.owner_user_id))
+    total = 0
+    for app_project_id, status, created_at, started_at, finished_at in rows:
+        owner_user_id = owners[app_project_id]
+        total += 1
+        statuses[status] += 1
+        daily[(created_at.date(), owner_user_id)]["enqueued"] += 1
+        if status != models.BuildStatus.pending.value:
+            daily[((started_at or created_at).date(), owner_user_id)]["started"] += 1
+        if status == models.BuildStatus.failed.value:
+            daily[((finished_at or created_at).date(), owner_user_id)]["failed"] += 1
+        if status == models.BuildStatus.success.value:
+            counters = daily[((finished_at or created_at).date(), owner_user_id)]
+            counters["succeeded"] += 1
+            if started_at and finished_at:
+                duration = (finished_at - started_at).total_seconds()
+                counters["duration_count"] += 1
+                counters["duration_sum"] += duration
+                buckets[(finished_at.date(), owner_user_id, bucket_for(duration))] += 1
+    fleet: dict[date, dict] = defaultdict(_empty_counters)
+    for (day, _), counters in daily.items():
+        for name in COUNTERS:
+            fleet[day][name] += counters[name]
+    fleet_buckets: dict[tuple[date, int], int] = defaultdict(int)
+    for (day, _, bucket), count in buckets.items():
+        fleet_buckets[(day, bucket)] += count
+    for model in (
+        models.BuildStatsDaily,
+        models.BuildDurationBucket,
+        models.BuildStatsFleetDaily,
+        models.BuildFleetDurationBucket,
+        models.BuildStatusCount,
+    ):
+        db.execute(delete(model))
+    # Rebuilt totals go to shard 0; later writes spread over the other shards again.
+    for model, rows in (
+        (models.BuildStatsDaily, [{"day": day, "user_id": key, **counters} for (day, key), counters in daily.items()]),
+        (
+            models.BuildDurationBucket,
+            [{"day": day, "user_id": key, "bucket": bucket, "count": count} for (day, key, bucket), count in buckets.items()],
+        ),
+        (models.BuildStatsFleetDaily, [{"day": day, "shard": 0, **counters} for day, counters in fleet.items()]),
+        (
+            models.BuildFleetDurationBucket,
+            [{"day": day, "shard": 0, "bucket": bucket, "count": count} for (day, bucket), count in fleet_buckets.items()],
+        ),
+        (models.BuildStatusCount, [{"status": status, "shard": 0, "count": count} for status, count in statuses.items()]),
+    ):
+        if rows:
+            db.execute(insert(model), rows)
+    db.commit()
+    return total
+
+
+def main(argv=None) -> int:
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain the build statistics rollups.")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute all rollups from build_jobs and build_jobs_archive")
+    args = parser.parse_args(argv)
+    if not args.rebuild:
+        parser.print_help()
+        return 2
+    with SessionLocal() as db:
+        count = rebuild(db)
+    print(f"Rebuilt build statistics from {count} jobs", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
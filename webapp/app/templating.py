@@ -0,0 +1,39 @@
+import os
+import sys
+from pathlib import Path
+
+import jinja2
+from fastapi.templating import Jinja2Templates
+
+from .config import get_settings
+
+settings = get_settings()
+TEMPLATE_DIR = Path(__file__).resolve().parent / "templates"
+
+
+def build_environment() -> jinja2.Environment:
+    bytecode_cache = None
+    if settings.template_cache_dir:
+        os.makedirs(settings.template_cache_dir, exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(settings.template_cache_dir)
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader(str(TEMPLATE_DIR)),
+        autoescape=True,
+        bytecode_cache=bytecode_cache,
+        auto_reload=settings.template_auto_reload,
+    )
+
+
+templates = Jinja2Templates(env=build_environment())
+
+
+def precompile() -> int:
+    names = templates.env.list_templates(extensions=["html"])
+    for name in names:
+        templates.env.get_template(name)
+    return len(names)
+
+
+if __name__ == "__main__":
+    count = precompile()
+    print(f"Compiled {count} templates into {settings.template_cache_dir or 'memory'}", file=sys.stderr)
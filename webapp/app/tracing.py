@@ -0,0 +1,223 @@
+import importlib
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+
+from .config import get_settings
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+spans_exported_total = registry.counter("trace_spans_exported_total", "Spans handed to the trace exporter")
+export_failures_total = registry.counter("trace_export_failures_total", "Trace exports that raised")
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    trace_id: str
+    span_id: str
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    match = TRACEPARENT.match((value or "").strip().lower())
+    if not match or set(match.group(1)) == {"0"} or set(match.group(2)) == {"0"}:
+        return None
+    return SpanContext(match.group(1), match.group(2))
+
+
+@dataclass
+class Span:
+    name: str
+    context: SpanContext
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: Optional[int] = None
+    attributes: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        if self.end_ns is None:
+            self.end_ns = end_ns or time.time_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "start": datetime.utcfromtimestamp(self.start_ns / 1e9).isoformat(),
+            "duration_ms": round(self.duration_ms, 1),
+            "status": "error" if self.error else "ok",
+            "attributes": self.attributes,
+        }
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attributes(attributes: dict) -> list[dict]:
+    converted = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            converted.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            converted.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            converted.append({"key": key, "value": {"doubleValue": value}})
+        else:
+            converted.append({"key": key, "value": {"stringValue": str(value)}})
+    return converted
+
+
+def otlp_payload(service: str, spans: list[Span]) -> dict:
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": _otlp_attributes({"service.name": service})},
+                "scopeSpans": [{"scope": {"name": "appgenerator"}, "spans": [span.to_otlp() for span in spans]}],
+            }
+        ]
+    }
+
+
+class Trace:
+    def __init__(self, service: str, parent: Optional[SpanContext] = None):
+        self.service = service
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.parent_id = parent.span_id if parent else None
+        self.spans: list[Span] = []
+        self._stack: list[Span] = []
+
+    def start_span(self, name: str, parent: Optional[Span] = None, start_ns: Optional[int] = None, **attributes) -> Span:
+        parent = parent or (self._stack[-1] if self._stack else None)
+        span = Span(
+            name=name,
+            context=SpanContext(self.trace_id, secrets.token_hex(8)),
+            parent_id=parent.context.span_id if parent else self.parent_id,
+            start_ns=start_ns or time.time_ns(),
+            attributes=attributes,
+        )
+        self.spans.append(span)
+        return span
+
+    def enter(self, span: Span) -> None:
+        self._stack.append(span)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = self.start_span(name, **attributes)
+        self._stack.append(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.error = str(exc) or type(exc).__name__
+            raise
+        finally:
+            self._stack.remove(span)
+            span.end()
+
+    def finish(self, error: Optional[BaseException] = None) -> list[dict]:
+        for span in self.spans:
+            if span.end_ns is None:
+                if error is not None:
+                    span.error = str(error) or type(error).__name__
+                span.end()
+        return [span.to_dict() for span in self.spans]
+
+    def export(self) -> None:
+        finished = [span for span in self.spans if span.end_ns is not None]
+        if not finished:
+            return
+        try:
+            exporter().export(self.service, finished)
+            spans_exported_total.inc(len(finished))
+        except Exception:  # noqa: BLE001
+            export_failures_total.inc()
+            logger.exception("Trace export failed")
+
+
+# One OTLP/JSON export request per line: the format the OpenTelemetry collector's otlpjsonfile receiver reads.
+class FileExporter:
+    def __init__(self, path: str, max_bytes: int = 0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def export(self, service: str, spans: list[Span]) -> None:
+        line = json.dumps(otlp_payload(service, spans), separators=(",", ":"))
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._lock:
+            try:
+                full = self.max_bytes and os.path.getsize(self.path) >= self.max_bytes
+            except OSError:
+                full = False
+            if full:
+                # One previous generation is kept, so the files never hold more than twice the cap.
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "a") as handle:
+                handle.write(line + "\n")
+
+
+class OTLPHttpExporter:
+    def __init__(self, endpoint: str, timeout: float = 2.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+
+    def export(self, service: str, spans: list[Span]) -> None:
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(otlp_payload(service, spans)).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class NullExporter:
+    def export(self, service: str, spans: list[Span]) -> None:
+        pass
+
+
+@lru_cache()
+def exporter():
+    name = settings.trace_exporter
+    if name == "file":
+        return FileExporter(settings.trace_file, settings.trace_file_max_bytes)
+    if name == "otlp":
+        return OTLPHttpExporter(settings.trace_otlp_endpoint)
+    if name == "none":
+        return NullExporter()
+    module, _, attribute = name.partition(":")
+    return getattr(importlib.import_module(module), attribute)()
@@ -0,0 +1,440 @@
+import argparse
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import json
+import logging
+import random
+import socket
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from sqlalchemy import delete, exists, select
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import get_settings
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+BUILD_EVENTS = {models.BuildStatus.success.value: "build.succeeded", models.BuildStatus.failed.value: "build.failed"}
+KEYSTORE_EVENTS = {
+    models.RequestStatus.approved.value: "keystore_request.approved",
+    models.RequestStatus.rejected.value: "keystore_request.rejected",
+}
+SIGNATURE_HEADER = "X-Webhook-Signature"
+LEASE_SECONDS = 60
+# Delivery errors are shown to the subscriber in dead letters, so they never echo resolver or socket details.
+BLOCKED_ERROR = "Destination address is not allowed"
+CONNECT_ERROR = "Connection failed"
+# Not sent because an earlier batch to the same endpoint failed in this pass.
+DEFERRED = "Deferred behind a failed batch"
+
+events_total = registry.counter("webhook_events_total", "Events written to the webhook outbox")
+deliveries_total = registry.counter("webhook_deliveries_total", "Webhook deliveries acknowledged by their endpoint")
+failures_total = registry.counter("webhook_delivery_failures_total", "Webhook batch POSTs that failed and will be retried")
+dead_letters_total = registry.counter("webhook_dead_letters_total", "Webhook deliveries moved to the dead-letter queue")
+batch_seconds = registry.histogram("webhook_batch_seconds", "Time spent POSTing one webhook batch")
+
+
+def _has_subscribers(db: Session, user_id: int) -> bool:
+    return db.query(
+        exists().where(models.WebhookSubscription.user_id == user_id, models.WebhookSubscription.active.is_(True))
+    ).scalar()
+
+
+def enqueue(db: Session, event_type: str, user_id: int, app_project_id: Optional[int], payload: dict) -> None:
+    # Called inside the caller's transaction, so the event commits or rolls back with the status change.
+    if not _has_subscribers(db, user_id):
+        return
+    db.add(models.WebhookEvent(event_type=event_type, user_id=user_id, app_project_id=app_project_id, payload=payload))
+    events_total.inc()
+
+
+def enqueue_build(db: Session, build_id: int, app_project_id: int, owner_user_id: int, status: str, finished_at: datetime, **extra) -> None:
+    event_type = BUILD_EVENTS.get(status)
+    if event_type is None:
+        return
+    payload = {"build_id": build_id, "app_id": app_project_id, "status": status, "finished_at": finished_at.isoformat(), **extra}
+    enqueue(db, event_type, owner_user_id, app_project_id, payload)
+
+
+def enqueue_keystore_request(db: Session, req: models.KeystoreDownloadRequest) -> None:
+    keystore = req.keystore
+    if keystore is None:
+        return
+    payload = {
+        "request_id": req.id,
+        "keystore_id": req.keystore_id,
+        "app_id": keystore.app_project_id,
+        "requester_id": req.user_id,
+        "status": req.status,
+        "decision_at": req.decision_at.isoformat() if req.decision_at else None,
+    }
+    enqueue(db, KEYSTORE_EVENTS[req.status], keystore.app_project.owner_user_id, keystore.app_project_id, payload)
+
+
+def sign(secret: str, timestamp: int, body: bytes) -> str:
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def verify(secret: str, header: str, body: bytes, tolerance_seconds: int = 300) -> bool:
+    parts = dict(part.split("=", 1) for part in header.split(",") if "=" in part)
+    try:
+        timestamp = int(parts["t"])
+    except (KeyError, ValueError):
+        return False
+    if abs(time.time() - timestamp) > tolerance_seconds:
+        return False
+    return hmac.compare_digest(sign(secret, timestamp, body), f"t={timestamp},v1={parts.get('v1', '')}")
+
+
+def is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def check_url(url: str) -> Optional[str]:
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return "Webhook URL must be an http(s) URL with a host"
+    if settings.webhook_allow_private_targets:
+        return None
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port or 443, type=socket.SOCK_STREAM)}
+    except (OSError, UnicodeError, ValueError):
+        return "Webhook host could not be resolved"
+    if not all(is_public(address) for address in addresses):
+        return "Webhook host must resolve to public addresses only"
+    return None
+
+
+def _public_connection(address, *args, **kwargs) -> socket.socket:
+    # Checked on the connected socket, so DNS changes after subscribing and redirects are covered too.
+    sock = socket.create_connection(address, *args, **kwargs)
+    if not settings.webhook_allow_private_targets and not is_public(sock.getpeername()[0]):
+        sock.close()
+        raise PermissionError(BLOCKED_ERROR)
+    return sock
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _public_connection
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+# No proxies: the address check has to see the endpoint itself.
+opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), PublicHTTPHandler, PublicHTTPSHandler)
+
+
+def backoff_seconds(attempts: int) -> float:
+    delay = min(settings.webhook_backoff_max_seconds, settings.webhook_backoff_base_seconds * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def dispatch(db: Session, now: datetime) -> int:
+    # Fan outbox events out into one delivery per matching subscription.
+    events = (
+        db.query(models.WebhookEvent)
+        .filter(models.WebhookEvent.dispatched_at.is_(None))
+        .order_by(models.WebhookEvent.id)
+        .limit(settings.webhook_claim_limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not events:
+        db.rollback()
+        return 0
+    subscriptions = defaultdict(list)
+    for subscription in db.query(models.WebhookSubscription).filter(
+        models.WebhookSubscription.user_id.in_({event.user_id for event in events}),
+        models.WebhookSubscription.active.is_(True),
+    ):
+        subscriptions[subscription.user_id].append(subscription)
+    for event in events:
+        for subscription in subscriptions[event.user_id]:
+            if subscription.app_project_id not in (None, event.app_project_id):
+                continue
+            if subscription.events and event.event_type not in subscription.events:
+                continue
+            db.add(models.WebhookDelivery(subscription_id=subscription.id, event_id=event.id, next_attempt_at=now))
+        event.dispatched_at = now
+    db.commit()
+    return len(events)
+
+
+@dataclass
+class Batch:
+    subscription_id: int
+    url: str
+    secret: str
+    deliveries: list[dict] = field(default_factory=list)
+    attempts: dict[int, int] = field(default_factory=dict)
+
+    @property
+    def body(self) -> bytes:
+        return json.dumps({"deliveries": self.deliveries}, separators=(",", ":")).encode()
+
+
+def claim(db: Session, now: datetime) -> list[Batch]:
+    rows = (
+        db.query(models.WebhookDelivery, models.WebhookEvent, models.WebhookSubscription.url, models.WebhookSubscription.secret)
+        .join(models.WebhookEvent, models.WebhookEvent.id == models.WebhookDelivery.event_id)
+        .join(models.WebhookSubscription, models.WebhookSubscription.id == models.WebhookDelivery.subscription_id)
+        .filter(
+            models.WebhookDelivery.status == models.WebhookStatus.pending.value,
+            models.WebhookDelivery.next_attempt_at <= now,
+        )
+        .order_by(models.WebhookDelivery.next_attempt_at, models.WebhookDelivery.id)
+        .limit(settings.webhook_claim_limit)
+        .with_for_update(skip_locked=True, of=models.WebhookDelivery)
+        .all()
+    )
+    batches: dict[int, list[Batch]] = defaultdict(list)
+    for delivery, event, url, secret in rows:
+        # Lease the row so another worker does not resend it while this one is waiting on the endpoint.
+        delivery.next_attempt_at = now + timedelta(seconds=LEASE_SECONDS + settings.webhook_timeout_seconds)
+        pending = batches[delivery.subscription_id]
+        if not pending or len(pending[-1].deliveries) >= settings.webhook_batch_size:
+            pending.append(Batch(delivery.subscription_id, url, secret))
+        batch = pending[-1]
+        batch.deliveries.append(
+            {
+                "id": delivery.id,
+                "event_id": event.id,
+                "type": event.event_type,
+                "created_at": event.created_at.isoformat() if event.created_at else None,
+                "data": event.payload,
+            }
+        )
+        batch.attempts[delivery.id] = delivery.attempts
+    db.commit()
+    return [batch for pending in batches.values() for batch in pending]
+
+
+def send(batch: Batch) -> Optional[str]:
+    body = batch.body
+    request = urllib.request.Request(
+        batch.url,
+        data=body,
+        headers={
+            "Content-Type": "application/json",
+            "User-Agent": "appgenerator-webhooks",
+            SIGNATURE_HEADER: sign(batch.secret, int(time.time()), body),
+        },
+        method="POST",
+    )
+    started = time.perf_counter()
+    try:
+        with opener.open(request, timeout=settings.webhook_timeout_seconds):
+            return None
+    except urllib.error.HTTPError as exc:
+        return f"HTTP {exc.code}"
+    except (urllib.error.URLError, OSError) as exc:
+        reason = getattr(exc, "reason", exc)
+        logger.info("Webhook POST for subscription %s failed: %s", batch.subscription_id, reason)
+        return BLOCKED_ERROR if isinstance(reason, PermissionError) else CONNECT_ERROR
+    finally:
+        batch_seconds.observe(time.perf_counter() - started)
+
+
+def send_in_order(batches: list[Batch]) -> list[Optional[str]]:
+    # One endpoint's batches go out one after another, and stop at the first failure so later ones do not overtake it.
+    errors: list[Optional[str]] = []
+    for batch in batches:
+        errors.append(send(batch) if not errors or errors[-1] is None else DEFERRED)
+    return errors
+
+
+def record(db: Session, batch: Batch, error: Optional[str], now: datetime) -> None:
+    deliveries = db.query(models.WebhookDelivery).filter(models.WebhookDelivery.id.in_(batch.attempts))
+    if error is DEFERRED:
+        # Not attempted, so no attempt is charged; they wait at least as long as the failed batch's first retry.
+        for delivery in deliveries:
+            delivery.next_attempt_at = now + timedelta(seconds=settings.webhook_backoff_base_seconds)
+        return
+    if error is None:
+        for delivery in deliveries:
+            delivery.status = models.WebhookStatus.delivered.value
+            delivery.attempts = batch.attempts[delivery.id] + 1
+            delivery.delivered_at = now
+            delivery.last_error = None
+        deliveries_total.inc(len(batch.attempts))
+        return
+    failures_total.inc()
+    for delivery in deliveries:
+        delivery.attempts = batch.attempts[delivery.id] + 1
+        delivery.last_error = error
+        if delivery.attempts >= settings.webhook_max_attempts:
+            delivery.status = models.WebhookStatus.dead.value
+            dead_letters_total.inc()
+        else:
+            delivery.next_attempt_at = now + timedelta(seconds=backoff_seconds(delivery.attempts))
+
+
+def prune(db: Session, now: datetime) -> None:
+    cutoff = now - timedelta(days=settings.webhook_retention_days)
+    db.execute(
+        delete(models.WebhookDelivery).where(
+            models.WebhookDelivery.status == models.WebhookStatus.delivered.value, models.WebhookDelivery.delivered_at < cutoff
+        )
+    )
+    db.execute(
+        delete(models.WebhookEvent).where(
+            models.WebhookEvent.dispatched_at < cutoff,
+            models.WebhookEvent.id.not_in(select(models.WebhookDelivery.event_id)),
+        )
+    )
+    db.commit()
+
+
+def run_once(session_factory) -> dict:
+    now = datetime.utcnow()
+    with session_factory() as db:
+        dispatched = dispatch(db, now)
+        batches = claim(db, now)
+    if not batches:
+        return {"dispatched": dispatched, "batches": 0, "failed": 0}
+    by_subscription: dict[int, list[Batch]] = defaultdict(list)
+    for batch in batches:
+        by_subscription[batch.subscription_id].append(batch)
+    # Endpoints are POSTed in parallel, one task per endpoint, so each gets its deliveries in order, in batches.
+    with ThreadPoolExecutor(max_workers=settings.webhook_workers) as pool:
+        results = list(pool.map(send_in_order, by_subscription.values()))
+    outcomes = [
+        (batch, error) for group, errors in zip(by_subscription.values(), results) for batch, error in zip(group, errors)
+    ]
+    now = datetime.utcnow()
+    with session_factory() as db:
+        for batch, error in outcomes:
+            if error is not None and error is not DEFERRED:
+                logger.warning("Webhook batch to subscription %s failed: %s", batch.subscription_id, error)
+            record(db, batch, error, now)
+        db.commit()
+    failed = sum(error is not None and error is not DEFERRED for _, error in outcomes)
+    return {"dispatched": dispatched, "batches": len(batches), "failed": failed}
+
+
+def run_forever(session_factory) -> None:
+    pruned_at = 0.0
+    while True:
+        try:
+            summary = run_once(session_factory)
+            if time.monotonic() - pruned_at > 3600:
+                with session_factory() as db:
+                    prune(db, datetime.utcnow())
+                pruned_at = time.monotonic()
+        except Exception:  # noqa: BLE001
+            logger.exception("Webhook delivery pass failed")
+            summary = {}
+        if not summary.get("dispatched") and not summary.get("batches"):
+            time.sleep(settings.webhook_poll_seconds)
+
+
+# A stand-in endpoint for local testing: verifies signatures, prints each batch and can fail on purpose.
+class Receiver:
+    def __init__(self, secret: Optional[str] = None, fail_rate: float = 0.0, port: int = 0, echo: bool = False):
+        self.secret = secret
+        self.fail_rate = fail_rate
+        self.echo = echo
+        self.batches: list[dict] = []
+        self.rejected = 0
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if receiver.secret and not verify(receiver.secret, self.headers.get(SIGNATURE_HEADER, ""), body):
+                    receiver.rejected += 1
+                    self.send_response(401)
+                elif random.random() < receiver.fail_rate:
+                    self.send_response(503)
+                else:
+                    batch = json.loads(body)
+                    receiver.batches.append(batch)
+                    if receiver.echo:
+                        print(json.dumps(batch), flush=True)
+                    self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+
+    def __enter__(self) -> "Receiver":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def deliveries(self) -> list[dict]:
+        return [delivery for batch in self.batches for delivery in batch["deliveries"]]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Deliver webhook events from the outbox, or run a local stand-in receiver.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("run", help="Deliver continuously")
+    commands.add_parser("once", help="Run a single dispatch and delivery pass")
+    receive = commands.add_parser("receive", help="Run a local receiver that verifies and prints batches")
+    receive.add_argument("--port", type=int, default=9000)
+    receive.add_argument("--secret", help="Subscription secret; signatures are checked when given")
+    receive.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of batches answered with 503")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "receive":
+        with Receiver(args.secret, args.fail_rate, args.port, echo=True) as receiver:
+            print(f"Listening on {receiver.url}", flush=True)
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
+        return 0
+    from .database import SessionLocal
+
+    if args.command == "once":
+        print(json.dumps(run_once(SessionLocal)))
+        return 0
+    run_forever(SessionLocal)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())